@@ -14,3 +14,5 @@ from .pdf import *
 from .mahalanobis import *
 from .statistics_list import statistics_list, twoD_statistics_list
 from .lm_seg import Lm_Seg
+from .distance_matrix import DistanceMatrix, stream_fiducial_distances
+from .result_cache import ResultCache, set_result_cache, get_result_cache
@@ -5,9 +5,11 @@ import numpy as np
 import statsmodels.api as sm
 import warnings
 import astropy.units as u
+from numpy.fft import fftshift
 
 from .lm_seg import Lm_Seg
-from .psds import pspec, make_radial_freq_arrays
+from .psds import pspec, pspec_rfft, make_radial_freq_arrays
+from .rfft_to_fft import expand_rfft
 from .fitting_utils import clip_func
 from .elliptical_powerlaw import (fit_elliptical_powerlaw,
                                   inverse_interval_transform,
@@ -24,9 +26,26 @@ class StatisticBase_PSpec2D(object):
     def ps2D(self):
         '''
         Two-dimensional power spectrum.
+
+        The power spectrum is stored in the half-plane layout of the real
+        FFT. The full, centred 2D power spectrum is created and kept when
+        this property is first accessed.
         '''
+        if getattr(self, '_ps2D', None) is None:
+            self._ps2D = fftshift(expand_rfft(self._ps2D_half,
+                                              self._ps2D_shape[-1]))
+
         return self._ps2D[::-1]
 
+    def _set_ps2D_half(self, ps2D_half, shape):
+        '''
+        Store the half-plane 2D power spectrum. Any previously expanded
+        2D power spectrum is removed.
+        '''
+        self._ps2D_half = ps2D_half
+        self._ps2D_shape = tuple(shape)
+        self._ps2D = None
+
     @property
     def ps1D(self):
         '''
@@ -54,7 +73,7 @@ class StatisticBase_PSpec2D(object):
 
     @property
     def wavenumbers(self):
-        return self._freqs * min(self._ps2D.shape)
+        return self._freqs * min(self._ps2D_shape)
 
     def compute_radial_pspec(self, return_stddev=True,
                              logspacing=False, max_bin=None, **kwargs):
@@ -69,7 +88,9 @@ class StatisticBase_PSpec2D(object):
             Return logarithmically spaced bins for the lags.
         max_bin : float, optional
             Maximum spatial frequency to bin values at.
-        kwargs : passed to `~turbustat.statistics.psds.pspec`.
+        kwargs : passed to `~turbustat.statistics.psds.pspec`. Setting
+            `boot_iter` (and optionally `boot_seed`) uses bootstrapped
+            standard deviations in the bins.
         '''
 
         # Check if azimuthal constraints are given
@@ -78,8 +99,15 @@ class StatisticBase_PSpec2D(object):
         else:
             azim_constraint_flag = False
 
-        out = pspec(self.ps2D, return_stddev=return_stddev,
-                    logspacing=logspacing, max_bin=max_bin, **kwargs)
+        # Bin the half-plane directly when it is available.
+        if getattr(self, '_ps2D_half', None) is not None:
+            out = pspec_rfft(self._ps2D_half, self._ps2D_shape,
+                             return_stddev=return_stddev,
+                             logspacing=logspacing, max_bin=max_bin,
+                             **kwargs)
+        else:
+            out = pspec(self.ps2D, return_stddev=return_stddev,
+                        logspacing=logspacing, max_bin=max_bin, **kwargs)
 
         self._stddev_flag = return_stddev
         self._azim_constraint_flag = azim_constraint_flag
@@ -136,7 +164,7 @@ class StatisticBase_PSpec2D(object):
         if low_cut is None:
             # Default to the largest frequency, since this is just 1 pixel
             # in the 2D PSpec.
-            self.low_cut = 1. / (0.5 * float(max(self.ps2D.shape)) * u.pix)
+            self.low_cut = 1. / (0.5 * float(max(self._ps2D_shape)) * u.pix)
         else:
             self.low_cut = self._to_pixel_freq(low_cut)
 
@@ -323,7 +351,7 @@ class StatisticBase_PSpec2D(object):
         if low_cut is None:
             # Default to the largest frequency, since this is just 1 pixel
             # in the 2D PSpec.
-            self.low_cut = 1. / (0.5 * float(max(self.ps2D.shape)) * u.pix)
+            self.low_cut = 1. / (0.5 * float(max(self._ps2D_shape)) * u.pix)
         else:
             self.low_cut = self._to_pixel_freq(low_cut)
 
@@ -332,7 +360,7 @@ class StatisticBase_PSpec2D(object):
         else:
             self.high_cut = self._to_pixel_freq(high_cut)
 
-        yy_freq, xx_freq = make_radial_freq_arrays(self.ps2D.shape)
+        yy_freq, xx_freq = make_radial_freq_arrays(self._ps2D_shape)
 
         freqs_dist = np.sqrt(yy_freq**2 + xx_freq**2)
 
@@ -478,7 +506,7 @@ class StatisticBase_PSpec2D(object):
 
         # 2D Spectrum is shown alongside 1D. Otherwise only 1D is returned.
         if show_2D:
-            yy_freq, xx_freq = make_radial_freq_arrays(self.ps2D.shape)
+            yy_freq, xx_freq = make_radial_freq_arrays(self._ps2D_shape)
 
             freqs_dist = np.sqrt(yy_freq**2 + xx_freq**2)
 
@@ -576,9 +604,9 @@ class StatisticBase_PSpec2D(object):
         high_cut = \
             self._spatial_freq_unit_conversion(self.high_cut, xunit).value
         low_cut = low_cut if not use_wavenumber else \
-            low_cut * min(self._ps2D.shape)
+            low_cut * min(self._ps2D_shape)
         high_cut = high_cut if not use_wavenumber else \
-            high_cut * min(self._ps2D.shape)
+            high_cut * min(self._ps2D_shape)
         p.axvline(np.log10(low_cut), color=color, alpha=0.5, linestyle='--')
         p.axvline(np.log10(high_cut), color=color, alpha=0.5, linestyle='--')
 
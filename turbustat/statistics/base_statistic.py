@@ -9,7 +9,8 @@ from radio_beam import Beam
 from radio_beam.beam import NoBeamException
 from warnings import warn
 import sys
-from copy import deepcopy
+import os
+from copy import copy
 
 if sys.version_info[0] >= 3:
     import _pickle as pickle
@@ -30,6 +31,9 @@ class BaseStatisticMixIn(object):
     # Disable this when the data property will not be used.
     no_data_flag = False
 
+    # Attributes holding the data, which are not saved by default.
+    _data_attrs = ("_data",)
+
     @property
     def header(self):
         return self._header
@@ -104,40 +108,63 @@ class BaseStatisticMixIn(object):
         else:
             self.data, self.header = input_data(data)
 
-    def save_results(self, output_name, keep_data=False):
+    def save_results(self, output_name, keep_data=False, format='pickle'):
         '''
-        Save the results of the SCF to avoid re-computing.
-        The pickled file will not include the data cube by default.
+        Save the results of the statistic to avoid re-computing.
+        The saved file will not include the data by default.
 
         Parameters
         ----------
         output_name : str
-            Name of the outputted pickle file.
+            Name of the outputted pickle file, or of the directory for the
+            'npy' format.
         keep_data : bool, optional
             Save the data cube in the pickle file when enabled.
+        format : {'pickle', 'npy'}, optional
+            With 'pickle', the object is saved in a single pickle file.
+            With 'npy', the large arrays are written to separate `.npy` files
+            in the `output_name` directory, directly from the object without
+            copying. These are memory-mapped when loaded with
+            `~BaseStatisticMixIn.load_results`, so only the arrays that are
+            used are read from disk.
         '''
 
-        if not output_name.endswith(".pkl"):
-            output_name += ".pkl"
+        # Don't keep the whole cube unless keep_data enabled. A shallow copy
+        # is used so the arrays are not duplicated.
+        self_copy = copy(self)
+        if not keep_data:
+            for attr in self._data_attrs:
+                if attr in self_copy.__dict__:
+                    setattr(self_copy, attr, None)
+
+        if format == 'pickle':
+            if not output_name.endswith(".pkl"):
+                output_name += ".pkl"
 
-        self_copy = deepcopy(self)
+            with open(output_name, 'wb') as output:
+                    pickle.dump(self_copy, output, -1)
 
-        # Don't keep the whole cube unless keep_data enabled.
-        if not keep_data:
-            self_copy._data = None
+        elif format == 'npy':
+            _save_npy_dir(self_copy, output_name)
 
-        with open(output_name, 'wb') as output:
-                pickle.dump(self_copy, output, -1)
+        else:
+            raise ValueError("format must be 'pickle' or 'npy'.")
 
     @staticmethod
-    def load_results(pickle_file):
+    def load_results(pickle_file, mmap_mode='c'):
         '''
-        Load in a saved pickle file.
+        Load in a saved pickle file, or a directory saved with the 'npy'
+        format.
 
         Parameters
         ----------
         pickle_file : str
             Name of filename to load in.
+        mmap_mode : {None, 'r', 'c', 'r+'}, optional
+            Memory-map mode for the arrays saved with the 'npy' format. See
+            `~numpy.load`. The default, copy-on-write, reads the arrays
+            only when they are used, and changes are not written back to
+            the files. Use None to read all of the arrays into memory.
 
         Returns
         -------
@@ -151,6 +178,9 @@ class BaseStatisticMixIn(object):
 
         '''
 
+        if os.path.isdir(pickle_file):
+            return _load_npy_dir(pickle_file, mmap_mode=mmap_mode)
+
         with open(pickle_file, 'rb') as input:
                 self = pickle.load(input)
 
@@ -338,3 +368,90 @@ class BaseStatisticMixIn(object):
         '''
 
         return 1 / self._to_spectral(1 / value, 1 / unit)
+
+
+# Arrays smaller than this are kept in the pickled state for the 'npy'
+# format.
+_min_npy_bytes = 2**10
+
+
+def _is_npy_array(value):
+    '''
+    Whether an attribute is written to its own `.npy` file.
+    '''
+    return (isinstance(value, np.ndarray) and
+            not isinstance(value, np.ma.MaskedArray) and
+            not value.dtype.hasobject and
+            value.nbytes >= _min_npy_bytes)
+
+
+def _save_npy_dir(obj, output_name):
+    '''
+    Save an object as a directory of `.npy` files for the large arrays and
+    a pickle file of everything else. The arrays are written from the
+    object without copying.
+    '''
+
+    if not os.path.isdir(output_name):
+        os.makedirs(output_name)
+
+    state = {}
+    arrays = {}
+
+    for attr, value in obj.__dict__.items():
+
+        if _is_npy_array(value):
+            values = [value]
+        elif isinstance(value, list) and len(value) > 0 and \
+                all(_is_npy_array(val) for val in value):
+            values = value
+        else:
+            state[attr] = value
+            continue
+
+        entries = []
+        for i, val in enumerate(values):
+            filename = "{0}_{1}.npy".format(attr.lstrip("_"), i) \
+                if isinstance(value, list) else \
+                "{0}.npy".format(attr.lstrip("_"))
+
+            if isinstance(val, u.Quantity):
+                unit = val.unit.to_string()
+                val = val.value
+            else:
+                unit = None
+
+            np.save(os.path.join(output_name, filename), val)
+
+            entries.append((filename, unit))
+
+        arrays[attr] = (isinstance(value, list), entries)
+
+    with open(os.path.join(output_name, "state.pkl"), 'wb') as output:
+        pickle.dump((type(obj), state, arrays), output, -1)
+
+
+def _load_npy_dir(input_name, mmap_mode='c'):
+    '''
+    Load an object saved with `_save_npy_dir`. The arrays are
+    memory-mapped, unless `mmap_mode` is None.
+    '''
+
+    with open(os.path.join(input_name, "state.pkl"), 'rb') as input:
+        cls, state, arrays = pickle.load(input)
+
+    self = cls.__new__(cls)
+    self.__dict__.update(state)
+
+    for attr, (is_list, entries) in arrays.items():
+        values = []
+        for filename, unit in entries:
+            val = np.load(os.path.join(input_name, filename),
+                          mmap_mode=mmap_mode)
+            if unit is not None:
+                val = u.Quantity(val, unit, copy=False)
+            values.append(val)
+
+        setattr(self, attr, values if is_list else values[0])
+
+    return self
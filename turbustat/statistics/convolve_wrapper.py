@@ -2,16 +2,10 @@
 from __future__ import (print_function, absolute_import, division,
                         unicode_literals)
 
-try:
-    from pyfftw.interfaces.numpy_fft import fftn, ifftn
-    PYFFTW_FLAG = True
-except ImportError:
-    PYFFTW_FLAG = False
-
 from astropy.convolution import convolve_fft
 from astropy.version import version as astro_version
-import numpy as np
-from warnings import warn
+
+from .fft_engine import get_fft_engine
 
 
 def convolution_wrapper(img, kernel, use_pyfftw=False, threads=1,
@@ -19,7 +13,8 @@ def convolution_wrapper(img, kernel, use_pyfftw=False, threads=1,
     '''
     Adjust parameter setting to be consistent with astropy <2 and >=2.
 
-    Also allow the FFT to be performed with pyfftw.
+    The FFTs are performed with the shared FFT engine
+    (`~turbustat.statistics.fft_engine.get_fft_engine`).
 
     Parameters
     ----------
@@ -28,9 +23,9 @@ def convolution_wrapper(img, kernel, use_pyfftw=False, threads=1,
     use_pyfftw : bool, optional
         Enable to use pyfftw, if it is installed.
     threads : int, optional
-        Number of threads to use in FFT when using pyfftw.
+        Number of threads to use in the FFT.
     pyfftw_kwargs : dict, optional
-        Passed to `~turbustat.statistics.rfft_to_fft.rfft_to_fft`. See
+        Passed to `~turbustat.statistics.fft_engine.get_fft_engine`. See
         `here <http://hgomersall.github.io/pyFFTW/pyfftw/builders/builders.html>`_
         for a list of accepted kwargs.
     kwargs : Passed to `~astropy.convolution.convolve_fft`.
@@ -41,17 +36,10 @@ def convolution_wrapper(img, kernel, use_pyfftw=False, threads=1,
         Convolved image.
     '''
 
-    if use_pyfftw:
-        if PYFFTW_FLAG:
-            use_fftn = fftn
-            use_ifftn = ifftn
-        else:
-            warn("pyfftw not installed. Using numpy.fft functions.")
-            use_fftn = np.fft.fftn
-            use_ifftn = np.fft.ifftn
-    else:
-        use_fftn = np.fft.fftn
-        use_ifftn = np.fft.ifftn
+    engine = get_fft_engine(use_pyfftw=use_pyfftw, threads=threads,
+                            **pyfftw_kwargs)
+    use_fftn = engine.fftn
+    use_ifftn = engine.ifftn
 
     if int(astro_version[0]) >= 2:
         if kwargs.get("nan_interpolate") is not None:
@@ -74,6 +74,19 @@ class Cramer_Distance(object):
                                          noise_lim=self.noise_value2,
                                          normalize=normalize, **kwargs)
 
+        self._match_samples(seed=seed)
+
+    def _match_samples(self, seed=13024):
+        '''
+        Randomly sample the larger data matrix so both have the same number
+        of samples.
+
+        Parameters
+        ----------
+        seed : int, optional
+            Random seed used in the sampling.
+        '''
+
         # Need to check if the same number of samples is taken
         samps1 = self.data_matrix1.shape[1]
         samps2 = self.data_matrix2.shape[1]
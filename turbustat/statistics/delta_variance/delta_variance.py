@@ -7,18 +7,21 @@ from astropy import units as u
 from astropy.wcs import WCS
 from copy import copy
 import statsmodels.api as sm
+from scipy.fftpack import next_fast_len
 from astropy.extern.six import string_types
 from warnings import warn
 from astropy.utils.console import ProgressBar
 
 from ..base_statistic import BaseStatisticMixIn
+from ..result_cache import cached_run
 from ...io import common_types, twod_types, input_data
-from ..stats_utils import common_scale, padwithzeros
+from ..stats_utils import common_scale, padwithzeros, ordered_map
 from ..fitting_utils import check_fit_limits
 from .kernels import core_kernel, annulus_kernel
 from ..stats_warnings import TurbuStatMetricWarning
 from ..lm_seg import Lm_Seg
 from ..convolve_wrapper import convolution_wrapper
+from ..fft_engine import get_fft_engine
 
 
 class DeltaVariance(BaseStatisticMixIn):
@@ -93,6 +96,7 @@ class DeltaVariance(BaseStatisticMixIn):
 
         self.convolved_arrays = []
         self.convolved_weights = []
+        self.convolved_lags = [] * u.pix
 
     @property
     def lags(self):
@@ -140,9 +144,11 @@ class DeltaVariance(BaseStatisticMixIn):
                         min_weight_frac=0.01, nan_interpolate=True,
                         use_pyfftw=False, threads=1,
                         pyfftw_kwargs={},
-                        show_progress=True):
+                        show_progress=True, method='convolve',
+                        keep_convolved=True, n_jobs=1, max_in_flight=None):
         '''
-        Perform the convolutions at all lags.
+        Perform the convolutions at all lags and compute the delta-variance
+        at each lag.
 
         Parameters
         ----------
@@ -163,84 +169,199 @@ class DeltaVariance(BaseStatisticMixIn):
         use_pyfftw : bool, optional
             Enable to use pyfftw, if it is installed.
         threads : int, optional
-            Number of threads to use in FFT when using pyfftw.
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
         pyfftw_kwargs : Passed to
             See `here <http://hgomersall.github.io/pyFFTW/pyfftw/builders/builders.html>`_
             for a list of accepted kwargs.
         show_progress : bool, optional
             Show a progress bar during the creation of the covariance matrix.
+        method : {"convolve", "analytic"}, optional
+            "convolve" convolves the image and weights with the kernels
+            separately for each lag. "analytic" transforms the image and
+            weights once, and applies the core and annulus kernels at each
+            lag by multiplying with their closed-form Fourier transforms.
+            The results are the same, except with `boundary='wrap'` for
+            lags where the kernel is larger than the image. There
+            "analytic" keeps the convolution periodic, while "convolve"
+            pads the image.
+        keep_convolved : bool or `~astropy.units.Quantity`, optional
+            Which convolved maps to keep in `convolved_arrays` and
+            `convolved_weights`. True keeps the maps at every lag, and False
+            keeps none. Otherwise, only the maps at the given lags are kept.
+            The delta-variance is computed as each lag is convolved, so
+            the maps are not needed to compute it.
+        n_jobs : int, optional
+            Number of threads used to convolve the lags in parallel. The
+            lags are reduced in order, so the results do not depend on
+            `n_jobs`.
+        max_in_flight : int, optional
+            Maximum number of lags being convolved or waiting to be reduced
+            at once. Each holds several image-sized maps. Defaults to twice
+            `n_jobs`.
         '''
 
+        if boundary not in ["wrap", "fill"]:
+            raise ValueError("boundary must be 'wrap' or 'fill'. "
+                             "Given {}".format(boundary))
+
+        if method not in ["convolve", "analytic"]:
+            raise ValueError("method must be 'convolve' or 'analytic'. "
+                             "Given {}".format(method))
+
+        if keep_convolved is True:
+            keep_lags = np.ones(len(self.lags), dtype=bool)
+        elif keep_convolved is False or keep_convolved is None:
+            keep_lags = np.zeros(len(self.lags), dtype=bool)
+        else:
+            if not hasattr(keep_convolved, "value"):
+                keep_convolved = keep_convolved * u.pix
+            keep_pix = np.atleast_1d(self._to_pixel(keep_convolved).value)
+
+            keep_lags = np.isclose(self.lags.value[:, np.newaxis],
+                                   keep_pix[np.newaxis]).any(1)
+
+            if keep_lags.sum() < keep_pix.size:
+                raise ValueError("keep_convolved must only contain values "
+                                 "in lags.")
+
+        self.convolved_arrays = []
+        self.convolved_weights = []
+        self.convolved_lags = self.lags[keep_lags]
+
+        self._delta_var = np.empty((len(self.lags)))
+        self._delta_var_error = np.empty((len(self.lags)))
+
         if show_progress:
             bar = ProgressBar(len(self.lags))
 
-        for i, lag in enumerate(self.lags.value):
-            core = core_kernel(lag, self.data.shape[0], self.data.shape[1])
-            annulus = annulus_kernel(lag, self.diam_ratio, self.data.shape[0],
-                                     self.data.shape[1])
-
-            if boundary == "wrap":
-                # Don't pad for periodic boundaries
-                pad_weights = self.weights
-                pad_img = self.data * self.weights
-            elif boundary == "fill":
-                # Extend to avoid boundary effects from non-periodicity
-                pad_weights = np.pad(self.weights, int(lag), padwithzeros)
-                pad_img = np.pad(self.data, int(lag), padwithzeros) * \
-                    pad_weights
+        if method == "analytic":
+            convolver = \
+                _AnalyticConvolver(self.data, self.weights,
+                                   self.lags.value, self.diam_ratio,
+                                   boundary=boundary,
+                                   nan_interpolate=nan_interpolate,
+                                   use_pyfftw=use_pyfftw, threads=threads,
+                                   **pyfftw_kwargs)
+
+        cutoff_val = min_weight_frac * self.weights.max()
+
+        def lag_outputs(i):
+            lag = self.lags.value[i]
+
+            if method == "analytic":
+                img_core, img_annulus, weights_core, weights_annulus = \
+                    convolver(lag)
             else:
-                raise ValueError("boundary must be 'wrap' or 'fill'. "
-                                 "Given {}".format(boundary))
-
-            img_core = \
-                convolution_wrapper(pad_img, core, boundary=boundary,
-                                    fill_value=np.NaN,
-                                    allow_huge=allow_huge,
-                                    nan_interpolate=nan_interpolate,
-                                    use_pyfftw=use_pyfftw,
-                                    threads=threads,
-                                    pyfftw_kwargs=pyfftw_kwargs)
-            img_annulus = \
-                convolution_wrapper(pad_img, annulus,
-                                    boundary=boundary, fill_value=np.NaN,
-                                    allow_huge=allow_huge,
-                                    nan_interpolate=nan_interpolate,
-                                    use_pyfftw=use_pyfftw,
-                                    threads=threads,
-                                    pyfftw_kwargs=pyfftw_kwargs)
-            weights_core = \
-                convolution_wrapper(pad_weights, core,
-                                    boundary=boundary, fill_value=np.NaN,
-                                    allow_huge=allow_huge,
-                                    nan_interpolate=nan_interpolate,
-                                    use_pyfftw=use_pyfftw,
-                                    threads=threads,
-                                    pyfftw_kwargs=pyfftw_kwargs)
-            weights_annulus = \
-                convolution_wrapper(pad_weights, annulus,
-                                    boundary=boundary, fill_value=np.NaN,
-                                    allow_huge=allow_huge,
-                                    nan_interpolate=nan_interpolate,
-                                    use_pyfftw=use_pyfftw,
-                                    threads=threads,
-                                    pyfftw_kwargs=pyfftw_kwargs)
-
-            cutoff_val = min_weight_frac * self.weights.max()
+                img_core, img_annulus, weights_core, weights_annulus = \
+                    self._convolve_lag(lag, allow_huge=allow_huge,
+                                       boundary=boundary,
+                                       nan_interpolate=nan_interpolate,
+                                       use_pyfftw=use_pyfftw,
+                                       threads=threads,
+                                       pyfftw_kwargs=pyfftw_kwargs)
+
             weights_core[np.where(weights_core <= cutoff_val)] = np.NaN
             weights_annulus[np.where(weights_annulus <= cutoff_val)] = np.NaN
 
-            self.convolved_arrays.append((img_core / weights_core) -
-                                         (img_annulus / weights_annulus))
-            self.convolved_weights.append(weights_core * weights_annulus)
+            conv_arr = (img_core / weights_core) - \
+                (img_annulus / weights_annulus)
+            conv_weight = weights_core * weights_annulus
+
+            val, err = _checked_delvar(conv_arr, conv_weight, lag)
+
+            if not keep_lags[i]:
+                conv_arr = conv_weight = None
+
+            return val, err, conv_arr, conv_weight
+
+        if max_in_flight is None and n_jobs is not None:
+            max_in_flight = 2 * n_jobs
+
+        outputs = ordered_map(lag_outputs, range(len(self.lags)),
+                              n_jobs=n_jobs, max_in_flight=max_in_flight)
+
+        for i, (val, err, conv_arr, conv_weight) in enumerate(outputs):
+
+            self._delta_var[i] = val
+            self._delta_var_error[i] = err
+
+            if keep_lags[i]:
+                self.convolved_arrays.append(conv_arr)
+                self.convolved_weights.append(conv_weight)
 
             if show_progress:
                 bar.update(i + 1)
 
+    def _convolve_lag(self, lag, allow_huge=False, boundary='wrap',
+                      nan_interpolate=True, use_pyfftw=False, threads=1,
+                      pyfftw_kwargs={}):
+        '''
+        Convolve the image and weights with the core and annulus kernels at
+        one lag.
+        '''
+
+        core = core_kernel(lag, self.data.shape[0], self.data.shape[1])
+        annulus = annulus_kernel(lag, self.diam_ratio, self.data.shape[0],
+                                 self.data.shape[1])
+
+        if boundary == "wrap":
+            # Don't pad for periodic boundaries
+            pad_weights = self.weights
+            pad_img = self.data * self.weights
+        else:
+            # Extend to avoid boundary effects from non-periodicity
+            pad_weights = np.pad(self.weights, int(lag), padwithzeros)
+            pad_img = np.pad(self.data, int(lag), padwithzeros) * \
+                pad_weights
+
+        img_core = \
+            convolution_wrapper(pad_img, core, boundary=boundary,
+                                fill_value=np.NaN,
+                                allow_huge=allow_huge,
+                                nan_interpolate=nan_interpolate,
+                                use_pyfftw=use_pyfftw,
+                                threads=threads,
+                                pyfftw_kwargs=pyfftw_kwargs)
+        img_annulus = \
+            convolution_wrapper(pad_img, annulus,
+                                boundary=boundary, fill_value=np.NaN,
+                                allow_huge=allow_huge,
+                                nan_interpolate=nan_interpolate,
+                                use_pyfftw=use_pyfftw,
+                                threads=threads,
+                                pyfftw_kwargs=pyfftw_kwargs)
+        weights_core = \
+            convolution_wrapper(pad_weights, core,
+                                boundary=boundary, fill_value=np.NaN,
+                                allow_huge=allow_huge,
+                                nan_interpolate=nan_interpolate,
+                                use_pyfftw=use_pyfftw,
+                                threads=threads,
+                                pyfftw_kwargs=pyfftw_kwargs)
+        weights_annulus = \
+            convolution_wrapper(pad_weights, annulus,
+                                boundary=boundary, fill_value=np.NaN,
+                                allow_huge=allow_huge,
+                                nan_interpolate=nan_interpolate,
+                                use_pyfftw=use_pyfftw,
+                                threads=threads,
+                                pyfftw_kwargs=pyfftw_kwargs)
+
+        return img_core, img_annulus, weights_core, weights_annulus
+
     def compute_deltavar(self):
         '''
-        Computes the delta-variance values and errors.
+        Computes the delta-variance values and errors from the convolved
+        maps. `~DeltaVariance.do_convolutions` already computes these, so
+        this is only needed when `convolved_arrays` or `convolved_weights`
+        have been changed. Requires the maps at every lag.
         '''
 
+        if len(self.convolved_arrays) != len(self.lags):
+            raise ValueError("The convolved maps are not kept at every lag. "
+                             "Run do_convolutions with keep_convolved=True.")
+
         self._delta_var = np.empty((len(self.lags)))
         self._delta_var_error = np.empty((len(self.lags)))
 
@@ -250,14 +371,8 @@ class DeltaVariance(BaseStatisticMixIn):
                                       self.convolved_weights,
                                       self.lags.value)):
 
-            val, err = _delvar(conv_arr, conv_weight, lag)
-
-            if (val <= 0) or (err <= 0) or np.isnan(val) or np.isnan(err):
-                self._delta_var[i] = np.NaN
-                self._delta_var_error[i] = np.NaN
-            else:
-                self._delta_var[i] = val
-                self._delta_var_error[i] = err
+            self._delta_var[i], self._delta_var_error[i] = \
+                _checked_delvar(conv_arr, conv_weight, lag)
 
     @property
     def delta_var(self):
@@ -507,12 +622,14 @@ class DeltaVariance(BaseStatisticMixIn):
         else:
             plt.show()
 
+    @cached_run
     def run(self, show_progress=True, verbose=False, xunit=u.pix,
             nan_interpolate=True, allow_huge=False, boundary='wrap',
             use_pyfftw=False, threads=1, pyfftw_kwargs={},
             xlow=None, xhigh=None,
             brk=None, fit_kwargs={},
-            save_name=None):
+            save_name=None, method='convolve', keep_convolved=True,
+            n_jobs=1, max_in_flight=None):
         '''
         Compute the delta-variance.
 
@@ -534,7 +651,8 @@ class DeltaVariance(BaseStatisticMixIn):
         use_pyfftw : bool, optional
             Enable to use pyfftw, if it is installed.
         threads : int, optional
-            Number of threads to use in FFT when using pyfftw.
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
         pyfftw_kwargs : Passed to
             See `here <http://hgomersall.github.io/pyFFTW/pyfftw/builders/builders.html>`_
             for a list of accepted kwargs.
@@ -550,6 +668,15 @@ class DeltaVariance(BaseStatisticMixIn):
             using a broken linear fit.
         save_name : str,optional
             Save the figure when a file name is given.
+        method : {"convolve", "analytic"}, optional
+            See `~DeltaVariance.do_convolutions`.
+        keep_convolved : bool or `~astropy.units.Quantity`, optional
+            See `~DeltaVariance.do_convolutions`.
+        n_jobs : int, optional
+            Number of threads used to convolve the lags. See
+            `~DeltaVariance.do_convolutions`.
+        max_in_flight : int, optional
+            See `~DeltaVariance.do_convolutions`.
         '''
 
         self.do_convolutions(allow_huge=allow_huge, boundary=boundary,
@@ -557,8 +684,10 @@ class DeltaVariance(BaseStatisticMixIn):
                              use_pyfftw=use_pyfftw,
                              threads=threads,
                              pyfftw_kwargs=pyfftw_kwargs,
-                             show_progress=show_progress)
-        self.compute_deltavar()
+                             show_progress=show_progress,
+                             method=method,
+                             keep_convolved=keep_convolved,
+                             n_jobs=n_jobs, max_in_flight=max_in_flight)
         self.fit_plaw(xlow=xlow, xhigh=xhigh, brk=brk, verbose=verbose,
                       **fit_kwargs)
 
@@ -670,12 +799,13 @@ class DeltaVariance_Distance(object):
                                          weights=weights1,
                                          diam_ratio=diam_ratio, lags=lags1)
             self.delvar1.run(xlow=xlow[0], xhigh=xhigh[0],
-                             boundary=boundary[0])
+                             boundary=boundary[0], keep_convolved=False)
 
         self.delvar2 = DeltaVariance(dataset2,
                                      weights=weights2,
                                      diam_ratio=diam_ratio, lags=lags2)
-        self.delvar2.run(xlow=xlow[1], xhigh=xhigh[1], boundary=boundary[1])
+        self.delvar2.run(xlow=xlow[1], xhigh=xhigh[1], boundary=boundary[1],
+                         keep_convolved=False)
 
     def distance_metric(self, verbose=False, label1=None, label2=None,
                         xunit=u.pix, save_name=None):
@@ -827,6 +957,180 @@ class DeltaVariance_Distance(object):
         return self
 
 
+class _AnalyticConvolver(object):
+    '''
+    Convolves an image and its weights with the delta-variance kernels at
+    any lag, using closed-form transforms of the kernels.
+
+    The core kernel and the two Gaussians that make up the annulus kernel
+    are separable, so their transforms are outer products of the 1D
+    transforms of their profiles. The image, weights and the masks of
+    their NaNs are transformed once. At each lag, the convolutions then
+    only need a product with the kernel transforms and an inverse real FFT
+    for each of the two Gaussians.
+
+    The outputs match `DeltaVariance._convolve_lag`: the kernels are sampled
+    and truncated in the same way as the kernels in
+    `~turbustat.statistics.delta_variance.kernels`. With `boundary='fill'`,
+    the maps are padded by `int(lag)` on each side. With `nan_interpolate`,
+    the convolved maps are normalized by the convolved masks of the finite
+    pixels within the padded region. For periodic boundaries, kernels
+    larger than the map wrap around the edges.
+    '''
+
+    def __init__(self, img, weights, lags, diam_ratio, boundary='wrap',
+                 nan_interpolate=True, use_pyfftw=False, threads=1,
+                 **pyfftw_kwargs):
+
+        self.diam_ratio = diam_ratio
+        self.boundary = boundary
+        self.nan_interpolate = nan_interpolate
+
+        self._engine = get_fft_engine(use_pyfftw=use_pyfftw, threads=threads,
+                                      **pyfftw_kwargs)
+
+        self._img_shape = img.shape
+
+        if boundary == "wrap":
+            self.shape = img.shape
+        else:
+            # The padded maps at the largest lag, plus the half-width of the
+            # largest kernel so the periodic transforms do not wrap around.
+            max_lag = np.max(lags)
+            extent = max(core_kernel(max_lag, *img.shape).shape) // 2 + 1
+            self.shape = tuple(next_fast_len(size + 2 * int(max_lag) +
+                                             extent)
+                               for size in img.shape)
+
+        weighted_img = img * weights
+
+        self._maps = []
+        for arr in [weighted_img, weights]:
+            finite = np.isfinite(arr)
+
+            ft_arr = self._transform(np.where(finite, arr, 0.))
+
+            if nan_interpolate and not finite.all():
+                ft_nans = self._transform((~finite).astype(float))
+            else:
+                ft_nans = None
+
+            self._maps.append((ft_arr, ft_nans))
+
+    def _transform(self, arr):
+        return self._engine.rfftn(arr, s=self.shape)
+
+    def _profile_transforms(self, stddev, kernel_shape):
+        '''
+        Transforms and sums of the sampled 1D Gaussian profiles along each
+        axis, centered on the first pixel.
+        '''
+
+        transforms = []
+        sums = []
+        for axis, (size, kern_size) in enumerate(zip(self.shape,
+                                                     kernel_shape)):
+            half_width = kern_size // 2
+            offsets = np.arange(-half_width, half_width + 1)
+            profile = np.exp(-offsets**2 / (2 * stddev**2))
+
+            # Fold kernels larger than the map for periodic boundaries
+            kern = np.zeros(size)
+            np.add.at(kern, offsets % size, profile)
+
+            # The profiles are symmetric, so the transforms are real.
+            if axis == len(self.shape) - 1:
+                transforms.append(np.fft.rfft(kern).real)
+            else:
+                transforms.append(np.fft.fft(kern).real)
+            sums.append(profile.sum())
+
+        return transforms, np.prod(sums)
+
+    def __call__(self, lag):
+        '''
+        Returns the image convolved with the core and annulus kernels,
+        followed by the weights convolved with the core and annulus kernels.
+        '''
+
+        # Both Gaussians are truncated to the size of the core kernel.
+        kernel_shape = core_kernel(lag, *self._img_shape).shape
+
+        stddev = lag / (2 * np.sqrt(2))
+
+        inner, inner_sum = self._profile_transforms(stddev, kernel_shape)
+        outer, outer_sum = \
+            self._profile_transforms(self.diam_ratio * stddev, kernel_shape)
+
+        transfers = [np.outer(*inner), np.outer(*outer)]
+
+        if self.boundary == "wrap":
+            crop = None
+        else:
+            pad = int(lag)
+            crop = np.ix_(np.arange(-pad, self._img_shape[0] + pad),
+                          np.arange(-pad, self._img_shape[1] + pad))
+
+        def combine(inner_conv, outer_conv):
+            core = inner_conv / inner_sum
+            annulus = (outer_conv - inner_conv) / (outer_sum - inner_sum)
+            return core, annulus
+
+        def convolve(ft_arr):
+            convs = [self._engine.irfftn(ft_arr * transfer, s=self.shape)
+                     for transfer in transfers]
+            if crop is not None:
+                convs = [conv[crop] for conv in convs]
+            return combine(*convs)
+
+        if self.nan_interpolate and self.boundary == "fill":
+            # The zero-padded region counts as finite pixels. The region is
+            # a box, so its convolutions are separable too.
+            box_convs = []
+            for transforms in [inner, outer]:
+                axis_convs = []
+                for size, img_size, transform in zip(self.shape,
+                                                     self._img_shape,
+                                                     transforms):
+                    box = np.zeros(size)
+                    box[np.arange(-pad, img_size + pad)] = 1.
+                    axis_convs.append(
+                        np.fft.irfft(np.fft.rfft(box) *
+                                     transform[:size // 2 + 1], n=size))
+                box_convs.append(np.outer(*axis_convs)[crop])
+            box_core, box_annulus = combine(*box_convs)
+        else:
+            box_core = box_annulus = None
+
+        outputs = []
+        for ft_arr, ft_nans in self._maps:
+            core, annulus = convolve(ft_arr)
+
+            # Normalize by the convolved finite pixels. This is one
+            # everywhere for periodic maps without NaNs.
+            if box_core is None:
+                norm_core = norm_annulus = 1.
+            else:
+                norm_core = box_core
+                norm_annulus = box_annulus
+
+            if ft_nans is not None:
+                nans_core, nans_annulus = convolve(ft_nans)
+                norm_core = norm_core - nans_core
+                norm_annulus = norm_annulus - nans_annulus
+
+            if box_core is not None or ft_nans is not None:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    core = core / norm_core
+                    annulus = annulus / norm_annulus
+
+            outputs.extend([core, annulus])
+
+        img_core, img_annulus, weights_core, weights_annulus = outputs
+
+        return img_core, img_annulus, weights_core, weights_annulus
+
+
 def _delvar(array, weight, lag):
     '''
     Computes the delta variance of the given array.
@@ -847,3 +1151,17 @@ def _delvar(array, weight, lag):
                        np.nansum(weight)) - val**2) / nindep
 
     return val, val_err
+
+
+def _checked_delvar(array, weight, lag):
+    '''
+    Delta-variance and error of the given array, set to NaN when either is
+    not positive or not finite.
+    '''
+
+    val, err = _delvar(array, weight, lag)
+
+    if (val <= 0) or (err <= 0) or np.isnan(val) or np.isnan(err):
+        return np.NaN, np.NaN
+
+    return val, err
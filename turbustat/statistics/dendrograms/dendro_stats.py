@@ -26,6 +26,7 @@ except ImportError:
 
 from ..stats_utils import hellinger, common_histogram_bins, standardize
 from ..base_statistic import BaseStatisticMixIn
+from ..result_cache import cached_run
 from ...io import common_types, threed_types, twod_types
 from .mecdf import mecdf
 
@@ -401,6 +402,7 @@ class Dendrogram_Stats(BaseStatisticMixIn):
         else:
             plt.show()
 
+    @cached_run
     def run(self, periodic_bounds=False, verbose=False, save_name=None,
             show_progress=True, dendro_obj=None, save_results=False,
             output_name=None, fit_kwargs={}, make_hists=True, hist_kwargs={}):
@@ -0,0 +1,626 @@
+# Licensed under an MIT open source license - see LICENSE
+from __future__ import print_function, absolute_import, division
+
+'''
+Compute the distances between many datasets, running each statistic on each
+dataset only once.
+'''
+
+import numpy as np
+import astropy.units as u
+from astropy.wcs import WCS
+from collections import namedtuple
+from copy import copy
+from multiprocessing import Pool
+from itertools import islice
+
+from .statistics_list import statistics_list
+from .stats_utils import standardize, common_scale, common_histogram_bins
+from .threeD_to_twoD import _format_data
+from ..io import input_data
+
+from .wavelets import Wavelet, Wavelet_Distance
+from .mvc import MVC, MVC_Distance
+from .pspec_bispec import (PowerSpectrum, PSpec_Distance, Bispectrum,
+                           Bispectrum_Distance)
+from .delta_variance import DeltaVariance, DeltaVariance_Distance
+from .genus import Genus, GenusDistance
+from .vca_vcs import VCA, VCA_Distance, VCS, VCS_Distance
+from .tsallis import Tsallis, Tsallis_Distance
+from .pca import PCA, PCA_Distance
+from .scf import SCF, SCF_Distance
+from .cramer import Cramer_Distance
+from .stat_moments import StatMoments, StatMoments_Distance
+from .pdf import PDF, PDF_Distance
+from .dendrograms import Dendrogram_Stats, DendroDistance
+
+
+class DistanceMatrix(object):
+    """
+    Compute the distance matrices between a set of datasets.
+
+    Each statistic is computed once per dataset. The distances between all
+    pairs are then found from the computed statistics, rather than running
+    the ``*_Distance`` classes on every pair, which recomputes the
+    statistics for both datasets each time.
+
+    The statistics are computed with the default settings of the
+    ``*_Distance`` classes. The delta-variance lags are set from the
+    smallest image so that all datasets share the same lags. Datasets
+    compared with the delta-variance, SCF, and statistical moments must have
+    the same pixel scale, since the lags are not rescaled between pairs.
+
+    Parameters
+    ----------
+    datasets : list of dict
+        Datasets to compare. Each is a dictionary of the data products
+        (e.g., "cube", "moment0", "centroid") containing the data and header,
+        as returned by `~turbustat.data_reduction.Mask_and_Moments.to_dict`.
+    statistics : list, optional
+        Names of the statistics to compute, from
+        `~turbustat.statistics.statistics_list`. Defaults to all statistics.
+    n_jobs : int, optional
+        Number of processes used to compute the statistics. With
+        ``n_jobs=1``, everything is computed in the current process.
+    """
+
+    def __init__(self, datasets, statistics=None, n_jobs=1):
+        super(DistanceMatrix, self).__init__()
+
+        self.datasets = list(datasets)
+
+        if len(self.datasets) < 2:
+            raise ValueError("At least two datasets are needed.")
+
+        self.statistics = _check_statistics(statistics)
+
+        self.n_jobs = n_jobs
+
+        self.models = None
+        self.distances = None
+
+    def compute_statistics(self):
+        '''
+        Run each statistic on each dataset. The results are stored in
+        `~DistanceMatrix.models`, a dictionary with an entry for each
+        statistic containing a list of the results for each dataset.
+        '''
+
+        families = _statistic_families(self.statistics)
+
+        family_kwargs = _family_kwargs(families, self.datasets)
+
+        for dataset in self.datasets[1:]:
+            _check_common_grid(families, self.datasets[0], dataset)
+
+        results = _compute_all(self.datasets, families, family_kwargs,
+                               self.n_jobs)
+
+        self.models = dict((family, [result[family] for result in results])
+                           for family in families)
+
+    def compute_distances(self):
+        '''
+        Fill the distance matrices from the computed statistics. The
+        matrices are stored in `~DistanceMatrix.distances`, a dictionary with
+        a symmetric array for each statistic name.
+        '''
+
+        if self.models is None:
+            raise ValueError("Run DistanceMatrix.compute_statistics first.")
+
+        num = len(self.datasets)
+
+        self.distances = dict((name, np.zeros((num, num)))
+                              for name in self.statistics)
+
+        for family, models in self.models.items():
+            names = [name for name in self.statistics
+                     if _statistic_names[name] == family]
+
+            for i in range(num):
+                for j in range(i + 1, num):
+                    dists = _families[family].distance(models[i], models[j])
+
+                    for name in names:
+                        self.distances[name][i, j] = dists[name]
+                        self.distances[name][j, i] = dists[name]
+
+    def run(self):
+        '''
+        Compute the statistics for each dataset, then all of the distances.
+        '''
+
+        self.compute_statistics()
+        self.compute_distances()
+
+        return self
+
+
+def stream_fiducial_distances(fiducial, designs, statistics=None, n_jobs=1,
+                              block_size=None):
+    '''
+    Compare one fiducial dataset to many others.
+
+    The statistics of the fiducial are computed once. The other datasets are
+    consumed from `designs` in blocks of `block_size`, so only one block of
+    datasets and their statistics are held in memory at a time. `designs`
+    can be a generator that loads each dataset when needed.
+
+    The delta-variance lags are set from the fiducial image.
+
+    Parameters
+    ----------
+    fiducial : dict
+        The fiducial dataset. See `~DistanceMatrix`.
+    designs : iterable of dict
+        Datasets to compare to the fiducial.
+    statistics : list, optional
+        Names of the statistics to compute, from
+        `~turbustat.statistics.statistics_list`. Defaults to all statistics.
+    n_jobs : int, optional
+        Number of processes used to compute the statistics.
+    block_size : int, optional
+        Number of datasets computed together. Defaults to `n_jobs`.
+
+    Returns
+    -------
+    distances : generator
+        Yields a dictionary of the distances to the fiducial for each dataset
+        in `designs`, in order.
+    '''
+
+    statistics = _check_statistics(statistics)
+
+    families = _statistic_families(statistics)
+
+    family_kwargs = _family_kwargs(families, [fiducial])
+
+    if block_size is None:
+        block_size = n_jobs
+
+    block_size = int(block_size)
+    if block_size < 1:
+        raise ValueError("block_size must be a positive integer.")
+
+    pool = Pool(n_jobs) if n_jobs > 1 else None
+
+    try:
+        fid_models = _compute_all([fiducial], families, family_kwargs,
+                                  n_jobs, pool=pool)[0]
+
+        designs = iter(designs)
+
+        while True:
+            block = list(islice(designs, block_size))
+
+            if len(block) == 0:
+                break
+
+            for dataset in block:
+                _check_common_grid(families, fiducial, dataset)
+
+            results = _compute_all(block, families, family_kwargs, n_jobs,
+                                   pool=pool)
+
+            del block
+
+            for models in results:
+                distances = {}
+                for family in families:
+                    dists = _families[family].distance(fid_models[family],
+                                                       models[family])
+                    distances.update((name, dists[name]) for name in
+                                     statistics
+                                     if _statistic_names[name] == family)
+
+                yield distances
+
+            del results
+
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def _check_statistics(statistics):
+    '''
+    Check the statistic names are known.
+    '''
+
+    if statistics is None:
+        return list(statistics_list)
+
+    statistics = list(statistics)
+
+    for name in statistics:
+        if name not in _statistic_names:
+            raise ValueError("{0} is not a recognized statistic. Choose from:"
+                             " {1}".format(name, statistics_list))
+
+    return statistics
+
+
+def _statistic_families(statistics):
+    '''
+    Unique statistic classes needed, in the order given.
+    '''
+
+    families = []
+    for name in statistics:
+        family = _statistic_names[name]
+        if family not in families:
+            families.append(family)
+
+    return families
+
+
+def _family_kwargs(families, datasets):
+    '''
+    Settings that depend on all of the datasets.
+    '''
+
+    kwargs = dict((family, {}) for family in families)
+
+    if "DeltaVariance" in families:
+        # Same default lags as DeltaVariance_Distance, set by the smallest
+        # image.
+        min_size = 3.0
+        nlags = 25
+        min_shape = min([min(input_data(dataset["moment0"],
+                                        no_header=True).shape)
+                         for dataset in datasets])
+        kwargs["DeltaVariance"]["lags"] = \
+            np.logspace(np.log10(min_size), np.log10(min_shape / 2.),
+                        nlags) * u.pix
+
+    return kwargs
+
+
+def _check_common_grid(families, dataset1, dataset2):
+    '''
+    Statistics with lags in pixel units need the datasets to have the same
+    pixel scale.
+    '''
+
+    for family in families:
+        if not _families[family].common_grid:
+            continue
+
+        key = _families[family].key
+
+        scale = common_scale(WCS(dataset1[key][1]), WCS(dataset2[key][1]))
+
+        if scale != 1.0:
+            raise ValueError("The {0} statistic requires the datasets to have "
+                             "the same pixel scale.".format(family))
+
+
+def _compute_all(datasets, families, family_kwargs, n_jobs, pool=None):
+    '''
+    Compute the statistics for each dataset, optionally in a process pool.
+    '''
+
+    args = [(dataset, families, family_kwargs, n_jobs > 1)
+            for dataset in datasets]
+
+    if n_jobs == 1:
+        return [_compute_dataset(arg) for arg in args]
+
+    if pool is not None:
+        return pool.map(_compute_dataset, args)
+
+    pool = Pool(n_jobs)
+    try:
+        results = pool.map(_compute_dataset, args)
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
+
+
+def _compute_dataset(args):
+    '''
+    Compute all of the statistics for one dataset.
+    '''
+
+    dataset, families, family_kwargs, strip = args
+
+    results = {}
+    for family in families:
+        model = _families[family].compute(dataset, **family_kwargs[family])
+
+        # Attributes that cannot be sent back from a worker process.
+        if strip:
+            for attr in _families[family].unpicklable:
+                if hasattr(model, attr):
+                    delattr(model, attr)
+
+        results[family] = model
+
+    return results
+
+
+def _distance_object(distance_class, **attrs):
+    '''
+    Create a distance class from computed statistics, without running
+    ``__init__``, which would recompute them.
+    '''
+
+    dist = distance_class.__new__(distance_class)
+    for attr in attrs:
+        setattr(dist, attr, attrs[attr])
+
+    return dist
+
+
+def _wavelet(dataset):
+    wt = Wavelet(dataset["moment0"])
+    wt.run()
+    return wt
+
+
+def _wavelet_distance(wt1, wt2):
+    dist = _distance_object(Wavelet_Distance, wt1=wt1, wt2=wt2)
+    dist.distance_metric()
+    return {"Wavelet": dist.distance}
+
+
+def _mvc(dataset):
+    mvc = MVC(dataset["centroid"][0], dataset["moment0"][0],
+              dataset["linewidth"][0], dataset["centroid"][1])
+    mvc.run(radial_pspec_kwargs={'logspacing': False},
+            high_cut=0.5 / u.pix, fit_kwargs={'brk': None}, fit_2D=False)
+    return mvc
+
+
+def _mvc_distance(mvc1, mvc2):
+    dist = _distance_object(MVC_Distance, mvc1=mvc1, mvc2=mvc2)
+    dist.distance_metric()
+    return {"MVC": dist.distance}
+
+
+def _pspec(dataset):
+    pspec = PowerSpectrum(dataset["moment0"])
+    pspec.run(high_cut=0.5 / u.pix,
+              radial_pspec_kwargs={"logspacing": False},
+              fit_kwargs={'brk': None}, fit_2D=False)
+    return pspec
+
+
+def _pspec_distance(pspec1, pspec2):
+    dist = _distance_object(PSpec_Distance, pspec1=pspec1, pspec2=pspec2)
+    dist.distance_metric()
+    return {"PSpec": dist.distance}
+
+
+def _bispec(dataset):
+    bispec = Bispectrum(dataset["moment0"])
+    bispec.run(nsamples=100)
+    return bispec
+
+
+def _bispec_distance(bispec1, bispec2):
+    dist = _distance_object(Bispectrum_Distance, bispec1=bispec1,
+                            bispec2=bispec2)
+    dist.distance_metric()
+    return {"Bispectrum": dist.distance}
+
+
+def _delvar(dataset, lags=None):
+    delvar = DeltaVariance(dataset["moment0"], lags=lags)
+    delvar.run(boundary='wrap', keep_convolved=False)
+    return delvar
+
+
+def _delvar_distance(delvar1, delvar2):
+    dist = _distance_object(DeltaVariance_Distance, delvar1=delvar1,
+                            delvar2=delvar2)
+    dist.distance_metric()
+    return {"DeltaVariance_Curve": dist.curve_distance,
+            "DeltaVariance_Slope": dist.slope_distance}
+
+
+def _genus(dataset):
+    img, hdr = input_data(dataset["moment0"])
+    genus = Genus(standardize(img), lowdens_percent=20).run()
+    # The header is needed to find the relative scale between datasets.
+    return genus, hdr
+
+
+def _genus_distance(model1, model2):
+    genus1, hdr1 = model1
+    genus2, hdr2 = model2
+    dist = _distance_object(GenusDistance, genus1=genus1, genus2=genus2,
+                            scale=common_scale(WCS(hdr1), WCS(hdr2)))
+    dist.distance_metric()
+    return {"Genus": dist.distance}
+
+
+def _vcs(dataset):
+    return VCS(dataset["cube"]).run(breaks=None)
+
+
+def _vcs_distance(vcs1, vcs2):
+    dist = _distance_object(VCS_Distance, vcs1=vcs1, vcs2=vcs2)
+    dist.distance_metric()
+    return {"VCS": dist.distance,
+            "VCS_Small_Scale": dist.small_scale_distance,
+            "VCS_Large_Scale": dist.large_scale_distance,
+            "VCS_Break": dist.break_distance}
+
+
+def _vca(dataset):
+    vca = VCA(dataset["cube"])
+    vca.run(fit_kwargs={'brk': None},
+            radial_pspec_kwargs={'logspacing': False}, fit_2D=False)
+    return vca
+
+
+def _vca_distance(vca1, vca2):
+    dist = _distance_object(VCA_Distance, vca1=vca1, vca2=vca2)
+    dist.distance_metric()
+    return {"VCA": dist.distance}
+
+
+def _tsallis(dataset):
+    return Tsallis(dataset["moment0"]).run(verbose=False)
+
+
+def _tsallis_distance(tsallis1, tsallis2):
+    dist = _distance_object(Tsallis_Distance, tsallis1=tsallis1,
+                            tsallis2=tsallis2)
+    dist.distance_metric()
+    return {"Tsallis": dist.distance}
+
+
+def _pca(dataset):
+    pca = PCA(dataset["cube"])
+    pca.run(mean_sub=True, n_eigs=50, decomp_only=True)
+    return pca
+
+
+def _pca_distance(pca1, pca2):
+    dist = _distance_object(PCA_Distance, pca1=pca1, pca2=pca2,
+                            _mean_sub=True, _n_eigs=50)
+    dist.distance_metric()
+    return {"PCA": dist.distance}
+
+
+def _scf(dataset):
+    size = 21
+    scf = SCF(dataset["cube"], roll_lags=np.arange(size) - size // 2)
+    scf.run(return_stddev=True, boundary='continuous', fit_2D=False)
+    return scf
+
+
+def _scf_distance(scf1, scf2):
+    dist = _distance_object(SCF_Distance, scf1=scf1, scf2=scf2,
+                            weighted=True, size=scf1.size)
+    dist.distance_metric()
+    return {"SCF": dist.distance}
+
+
+def _cramer(dataset):
+    cube = input_data(dataset["cube"], no_header=True)
+    return _format_data(cube, data_format='intensity', normalize=True)
+
+
+def _cramer_distance(data_matrix1, data_matrix2):
+    dist = _distance_object(Cramer_Distance, data_matrix1=data_matrix1,
+                            data_matrix2=data_matrix2)
+    dist._match_samples()
+    dist.cramer_statistic()
+    return {"Cramer": dist.distance}
+
+
+def _moments(dataset):
+    moments = StatMoments(dataset["moment0"])
+    moments.compute_spatial_distrib(periodic=False, min_frac=0.8)
+    return moments
+
+
+def _moments_distance(moments1, moments2):
+    # The histograms are remade with common bins, so work on copies.
+    dist = _distance_object(StatMoments_Distance, moments1=copy(moments1),
+                            moments2=copy(moments2))
+    dist.distance_metric()
+    return {"Skewness": dist.skewness_distance,
+            "Kurtosis": dist.kurtosis_distance}
+
+
+def _pdf(dataset):
+    return PDF(dataset["moment0"]).run(verbose=False, do_fit=True)
+
+
+def _pdf_distance(pdf1, pdf2):
+    # The lognormal fit does not depend on the bins, so only the histograms
+    # are remade with common bins.
+    pdf1 = copy(pdf1)
+    pdf2 = copy(pdf2)
+
+    bins, bin_centers = common_histogram_bins(pdf1.data, pdf2.data,
+                                              return_centered=True)
+    pdf1.make_pdf(bins=bins)
+    pdf1.make_ecdf()
+    pdf2.make_pdf(bins=bins)
+    pdf2.make_ecdf()
+
+    dist = _distance_object(PDF_Distance, PDF1=pdf1, PDF2=pdf2,
+                            normalization_type=None, _do_fit=True,
+                            bins=bins, bin_centers=bin_centers)
+    dist.distance_metric()
+    return {"PDF_Hellinger": dist.hellinger_distance,
+            "PDF_KS": dist.ks_distance,
+            "PDF_Lognormal": dist.lognormal_distance}
+
+
+def _dendro(dataset):
+    dendro = Dendrogram_Stats(dataset["cube"],
+                              min_deltas=np.logspace(-2.5, 0.5, 100))
+    dendro.run(verbose=False, make_hists=False)
+    return dendro
+
+
+def _dendro_distance(dendro1, dendro2, min_features=100):
+    # Set the minimum number of components to create a histogram, as in
+    # DendroDistance.
+    cutoffs = []
+    for dendro in [dendro1, dendro2]:
+        cutoff = np.argwhere(dendro.numfeatures > min_features)
+        if not cutoff.any():
+            raise ValueError("A dendrogram does not contain the necessary "
+                             "number of features, %s." % (min_features))
+        cutoffs.append(cutoff[-1])
+
+    dist = _distance_object(DendroDistance, dendro1=dendro1, dendro2=dendro2,
+                            nbins="best", cutoff=np.min(cutoffs), bins=[])
+    dist.distance_metric()
+    return {"Dendrogram_Hist": dist.histogram_distance,
+            "Dendrogram_Num": dist.num_distance}
+
+
+_StatisticFamily = namedtuple("_StatisticFamily",
+                              ["key", "compute", "distance", "common_grid",
+                               "unpicklable"])
+
+_families = \
+    {"Wavelet": _StatisticFamily("moment0", _wavelet, _wavelet_distance,
+                                 False, ()),
+     "MVC": _StatisticFamily("centroid", _mvc, _mvc_distance, False, ()),
+     "PSpec": _StatisticFamily("moment0", _pspec, _pspec_distance, False,
+                               ()),
+     "Bispectrum": _StatisticFamily("moment0", _bispec, _bispec_distance,
+                                    False, ()),
+     "DeltaVariance": _StatisticFamily("moment0", _delvar, _delvar_distance,
+                                       True, ()),
+     "Genus": _StatisticFamily("moment0", _genus, _genus_distance, False,
+                               ()),
+     "VCS": _StatisticFamily("cube", _vcs, _vcs_distance, False, ()),
+     "VCA": _StatisticFamily("cube", _vca, _vca_distance, False, ()),
+     "Tsallis": _StatisticFamily("moment0", _tsallis, _tsallis_distance,
+                                 False, ()),
+     "PCA": _StatisticFamily("cube", _pca, _pca_distance, False, ()),
+     "SCF": _StatisticFamily("cube", _scf, _scf_distance, True, ()),
+     "Cramer": _StatisticFamily("cube", _cramer, _cramer_distance, False,
+                                ()),
+     "StatMoments": _StatisticFamily("moment0", _moments, _moments_distance,
+                                     True, ()),
+     "PDF": _StatisticFamily("moment0", _pdf, _pdf_distance, False,
+                             ("_model", "_mle_fit")),
+     "Dendrogram": _StatisticFamily("cube", _dendro, _dendro_distance, False,
+                                    ())}
+
+# Map each name in statistics_list to the statistic computed for it.
+_statistic_names = \
+    {"Wavelet": "Wavelet", "MVC": "MVC", "PSpec": "PSpec",
+     "Bispectrum": "Bispectrum", "DeltaVariance_Curve": "DeltaVariance",
+     "DeltaVariance_Slope": "DeltaVariance", "Genus": "Genus",
+     "VCS": "VCS", "VCS_Small_Scale": "VCS", "VCS_Large_Scale": "VCS",
+     "VCS_Break": "VCS", "VCA": "VCA", "Tsallis": "Tsallis", "PCA": "PCA",
+     "SCF": "SCF", "Cramer": "Cramer", "Skewness": "StatMoments",
+     "Kurtosis": "StatMoments", "PDF_Hellinger": "PDF", "PDF_KS": "PDF",
+     "PDF_Lognormal": "PDF", "Dendrogram_Hist": "Dendrogram",
+     "Dendrogram_Num": "Dendrogram"}
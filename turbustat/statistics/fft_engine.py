@@ -0,0 +1,424 @@
+# Licensed under an MIT open source license - see LICENSE
+from __future__ import print_function, absolute_import, division
+
+import numpy as np
+import os
+import sys
+import threading
+from collections import OrderedDict
+from warnings import warn
+
+if sys.version_info[0] >= 3:
+    import _pickle as pickle
+else:
+    import cPickle as pickle
+
+try:
+    import pyfftw
+    import pyfftw.builders
+    PYFFTW_FLAG = True
+except ImportError:
+    PYFFTW_FLAG = False
+
+try:
+    import scipy.fft as scipy_fft
+    SCIPY_FFT_FLAG = True
+except ImportError:
+    SCIPY_FFT_FLAG = False
+
+
+'''
+A common FFT engine used by all of the Fourier-based statistics.
+
+The engine hides the choice of backend (numpy, scipy.fft or pyfftw) and
+keeps a cache of transform plans keyed by the transform type, shape, dtype
+and axes. When the same shape is transformed many times (e.g., running a
+statistic on a large set of maps of the same size), the plans are only
+created once. Engines are shared between statistics through
+`get_fft_engine`, so the cache persists between different statistic objects.
+'''
+
+available_backends = ['numpy', 'scipy', 'pyfftw']
+
+_transform_types = ['fftn', 'ifftn', 'rfftn', 'irfftn']
+
+# Default settings used when a statistic does not explicitly request pyfftw.
+_default_config = {'backend': 'numpy', 'threads': 1, 'pyfftw_kwargs': {},
+                   'wisdom_file': None}
+
+# Shared engines. One for each backend + thread + kwarg combination.
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+class FFTEngine(object):
+    '''
+    FFT engine with a pluggable backend and a plan cache.
+
+    Parameters
+    ----------
+    backend : {'numpy', 'scipy', 'pyfftw'}, optional
+        Library used to compute the transforms. If the requested library is
+        not installed, numpy is used instead.
+    threads : int, optional
+        Number of threads to use in each transform. Used by the scipy
+        (as `workers`) and pyfftw backends.
+    max_plans : int, optional
+        Maximum number of plans to keep in the cache. The least recently used
+        plans are removed first.
+    wisdom_file : str, optional
+        File to load (and later save with `~FFTEngine.save_wisdom`) the
+        FFTW wisdom from. Only used with the pyfftw backend.
+    pyfftw_kwargs : Passed to the `pyfftw.builders` functions. See
+        `here <http://hgomersall.github.io/pyFFTW/pyfftw/builders/builders.html>`_
+        for a list of accepted kwargs.
+    '''
+
+    def __init__(self, backend='numpy', threads=1, max_plans=32,
+                 wisdom_file=None, **pyfftw_kwargs):
+
+        if backend not in available_backends:
+            raise ValueError("backend must be one of {0}. Given {1}."
+                             .format(available_backends, backend))
+
+        if backend == 'pyfftw' and not PYFFTW_FLAG:
+            warn("pyfftw not installed. Using numpy.fft functions.")
+            backend = 'numpy'
+
+        if backend == 'scipy' and not SCIPY_FFT_FLAG:
+            warn("scipy.fft is not available (requires scipy>=1.4). Using "
+                 "numpy.fft functions.")
+            backend = 'numpy'
+
+        self.backend = backend
+        self.threads = int(threads) if threads is not None else 1
+        self.max_plans = int(max_plans)
+        self.pyfftw_kwargs = pyfftw_kwargs
+        self.wisdom_file = wisdom_file
+
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.backend == 'pyfftw' and wisdom_file is not None:
+            if os.path.exists(wisdom_file):
+                self.load_wisdom(wisdom_file)
+
+    def __repr__(self):
+        return "FFTEngine(backend={0}, threads={1}, cached_plans={2})"\
+            .format(self.backend, self.threads, len(self._plans))
+
+    @property
+    def cached_plans(self):
+        '''
+        Keys of the plans currently held in the cache.
+        '''
+        return list(self._plans.keys())
+
+    def clear_cache(self):
+        '''
+        Remove all cached plans.
+        '''
+        with self._lock:
+            self._plans = OrderedDict()
+
+    def get_plan(self, kind, shape, dtype, s=None, axes=None):
+        '''
+        Return the plan for a transform, creating it when it is not already
+        in the cache.
+
+        Parameters
+        ----------
+        kind : {'fftn', 'ifftn', 'rfftn', 'irfftn'}
+            Type of transform.
+        shape : tuple
+            Shape of the input array.
+        dtype : `~numpy.dtype`
+            Data type of the input array.
+        s : tuple, optional
+            Shape of the output along the transformed axes.
+        axes : tuple, optional
+            Axes to transform over.
+
+        Returns
+        -------
+        plan : function
+            Function that takes the input array and returns the transform.
+        '''
+
+        if kind not in _transform_types:
+            raise ValueError("kind must be one of {}".format(_transform_types))
+
+        key = (kind, tuple(shape), np.dtype(dtype).str, s, axes)
+
+        with self._lock:
+            plan = self._plans.pop(key, None)
+            if plan is not None:
+                # Re-insert to mark as most recently used.
+                self._plans[key] = plan
+                return plan
+
+        plan = self._build_plan(kind, tuple(shape), dtype, s, axes)
+
+        with self._lock:
+            self._plans[key] = plan
+            while len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+
+        return plan
+
+    def _build_plan(self, kind, shape, dtype, s, axes):
+
+        if self.backend == 'pyfftw':
+            builder = getattr(pyfftw.builders, kind)
+
+            kwargs = self.pyfftw_kwargs.copy()
+            kwargs['threads'] = self.threads
+
+            fftw_obj = builder(pyfftw.empty_aligned(shape, dtype=dtype),
+                               s=s, axes=axes, **kwargs)
+
+            # FFTW objects re-use their internal arrays. Make sure that calls
+            # from different threads do not overlap, and return a copy.
+            fftw_lock = threading.Lock()
+
+            def plan(arr):
+                with fftw_lock:
+                    return fftw_obj(arr).copy()
+
+        elif self.backend == 'scipy':
+            func = getattr(scipy_fft, kind)
+            workers = self.threads
+
+            def plan(arr):
+                return func(arr, s=s, axes=axes, workers=workers)
+
+        else:
+            func = getattr(np.fft, kind)
+
+            def plan(arr):
+                return func(arr, s=s, axes=axes)
+
+        return plan
+
+    def _transform(self, kind, arr, s=None, axes=None):
+
+        arr = np.asarray(arr)
+
+        if kind == 'rfftn':
+            if not np.issubdtype(arr.dtype, np.floating):
+                arr = arr.astype(np.float64)
+        elif kind == 'irfftn' or self.backend == 'pyfftw':
+            if not np.issubdtype(arr.dtype, np.complexfloating):
+                arr = arr.astype(np.complex128)
+
+        if s is not None:
+            s = tuple(int(val) for val in s)
+        if axes is not None:
+            axes = tuple(int(ax) % arr.ndim for ax in axes)
+
+        plan = self.get_plan(kind, arr.shape, arr.dtype, s=s, axes=axes)
+
+        return plan(arr)
+
+    def fftn(self, arr, s=None, axes=None):
+        '''
+        N-dimensional FFT. Same call signature as `~numpy.fft.fftn`.
+        '''
+        return self._transform('fftn', arr, s=s, axes=axes)
+
+    def ifftn(self, arr, s=None, axes=None):
+        '''
+        N-dimensional inverse FFT. Same call signature as
+        `~numpy.fft.ifftn`.
+        '''
+        return self._transform('ifftn', arr, s=s, axes=axes)
+
+    def rfftn(self, arr, s=None, axes=None):
+        '''
+        N-dimensional FFT of a real array. Same call signature as
+        `~numpy.fft.rfftn`.
+        '''
+        return self._transform('rfftn', arr, s=s, axes=axes)
+
+    def irfftn(self, arr, s=None, axes=None):
+        '''
+        Inverse of `~FFTEngine.rfftn`. Same call signature as
+        `~numpy.fft.irfftn`.
+        '''
+        return self._transform('irfftn', arr, s=s, axes=axes)
+
+    def fft(self, arr, n=None, axis=-1):
+        '''
+        1D FFT along the given axis.
+        '''
+        s = None if n is None else (n,)
+        return self._transform('fftn', arr, s=s, axes=(axis,))
+
+    def ifft(self, arr, n=None, axis=-1):
+        '''
+        1D inverse FFT along the given axis.
+        '''
+        s = None if n is None else (n,)
+        return self._transform('ifftn', arr, s=s, axes=(axis,))
+
+    def rfft(self, arr, n=None, axis=-1):
+        '''
+        1D FFT of a real array along the given axis.
+        '''
+        s = None if n is None else (n,)
+        return self._transform('rfftn', arr, s=s, axes=(axis,))
+
+    def irfft(self, arr, n=None, axis=-1):
+        '''
+        Inverse of `~FFTEngine.rfft`.
+        '''
+        s = None if n is None else (n,)
+        return self._transform('irfftn', arr, s=s, axes=(axis,))
+
+    def load_wisdom(self, filename=None):
+        '''
+        Load FFTW wisdom from a file. Only used with the pyfftw backend.
+
+        Parameters
+        ----------
+        filename : str, optional
+            Name of the wisdom file. Defaults to `wisdom_file`.
+        '''
+
+        if self.backend != 'pyfftw':
+            return
+
+        if filename is None:
+            filename = self.wisdom_file
+
+        if filename is None:
+            raise ValueError("No wisdom file was given.")
+
+        with open(filename, 'rb') as input:
+            wisdom = pickle.load(input)
+
+        pyfftw.import_wisdom(wisdom)
+
+    def save_wisdom(self, filename=None):
+        '''
+        Save the FFTW wisdom accumulated while planning to a file. Loading
+        the wisdom in a later session avoids re-measuring the plans. Only
+        used with the pyfftw backend.
+
+        Parameters
+        ----------
+        filename : str, optional
+            Name of the wisdom file. Defaults to `wisdom_file`.
+        '''
+
+        if self.backend != 'pyfftw':
+            return
+
+        if filename is None:
+            filename = self.wisdom_file
+
+        if filename is None:
+            raise ValueError("No wisdom file was given.")
+
+        with open(filename, 'wb') as output:
+            pickle.dump(pyfftw.export_wisdom(), output, -1)
+
+
+def set_fft_backend(backend='numpy', threads=1, wisdom_file=None,
+                    **pyfftw_kwargs):
+    '''
+    Set the default FFT backend used by all statistics. This is used whenever
+    `use_pyfftw` is not enabled in a statistic.
+
+    Parameters
+    ----------
+    backend : {'numpy', 'scipy', 'pyfftw'}, optional
+        Library used to compute the transforms.
+    threads : int, optional
+        Default number of threads to use in the transforms.
+    wisdom_file : str, optional
+        File with saved FFTW wisdom. See `~FFTEngine`.
+    pyfftw_kwargs : Passed to the `pyfftw.builders` functions.
+
+    Examples
+    --------
+    Use scipy.fft with 4 threads in all statistics:
+
+    >>> from turbustat.statistics.fft_engine import set_fft_backend
+    >>> set_fft_backend('scipy', threads=4)  # doctest: +SKIP
+
+    '''
+
+    if backend not in available_backends:
+        raise ValueError("backend must be one of {0}. Given {1}."
+                         .format(available_backends, backend))
+
+    _default_config['backend'] = backend
+    _default_config['threads'] = int(threads)
+    _default_config['pyfftw_kwargs'] = pyfftw_kwargs
+    _default_config['wisdom_file'] = wisdom_file
+
+
+def get_fft_engine(use_pyfftw=False, threads=1, backend=None,
+                   **pyfftw_kwargs):
+    '''
+    Return the shared `~FFTEngine` for the given settings.
+
+    Parameters
+    ----------
+    use_pyfftw : bool, optional
+        Request the pyfftw backend. If pyfftw is not installed, numpy is
+        used.
+    threads : int, optional
+        Number of threads. When 1 (or None), the default number of threads
+        set with `~set_fft_backend` is used.
+    backend : {'numpy', 'scipy', 'pyfftw'}, optional
+        Explicitly choose the backend. Overrides `use_pyfftw`.
+    pyfftw_kwargs : Passed to the `pyfftw.builders` functions.
+
+    Returns
+    -------
+    engine : `~FFTEngine`
+        The shared FFT engine.
+    '''
+
+    # Statistics pass a threads keyword in the kwargs in places.
+    if pyfftw_kwargs.get('threads') is not None:
+        threads = pyfftw_kwargs.pop('threads')
+
+    wisdom_file = None
+
+    if backend is None:
+        if use_pyfftw:
+            backend = 'pyfftw'
+        else:
+            backend = _default_config['backend']
+            if len(pyfftw_kwargs) == 0:
+                pyfftw_kwargs = _default_config['pyfftw_kwargs']
+
+    if backend == _default_config['backend']:
+        wisdom_file = _default_config['wisdom_file']
+
+    if threads is None or threads == 1:
+        threads = _default_config['threads']
+
+    # Only pyfftw makes use of the extra kwargs
+    if backend != 'pyfftw':
+        pyfftw_kwargs = {}
+
+    try:
+        kwarg_key = tuple(sorted(pyfftw_kwargs.items()))
+        hash(kwarg_key)
+    except TypeError:
+        kwarg_key = repr(sorted(pyfftw_kwargs.items()))
+
+    key = (backend, int(threads), wisdom_file, kwarg_key)
+
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = FFTEngine(backend=backend, threads=threads,
+                               wisdom_file=wisdom_file, **pyfftw_kwargs)
+            _engines[key] = engine
+
+    return engine
@@ -4,13 +4,19 @@ from __future__ import print_function, absolute_import, division
 import numpy as np
 import scipy.ndimage as nd
 from scipy.interpolate import InterpolatedUnivariateSpline
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import (minimum_spanning_tree, connected_components,
+                                  breadth_first_order)
+from scipy.fftpack import next_fast_len
 from astropy.convolution import Gaussian2DKernel, convolve_fft
 from astropy.wcs import WCS
 import astropy.units as u
 
-from ..stats_utils import standardize, common_scale
+from ..stats_utils import standardize, common_scale, ordered_map
 from ..base_statistic import BaseStatisticMixIn
+from ..result_cache import cached_run
 from ...io import common_types, twod_types, input_data, find_beam_properties
+from ..fft_engine import get_fft_engine
 
 
 class Genus(BaseStatisticMixIn):
@@ -163,16 +169,53 @@ class Genus(BaseStatisticMixIn):
 
         self._smoothing_radii = values
 
-    def make_smooth_arrays(self, **kwargs):
+    def make_smooth_arrays(self, use_pyfftw=False, threads=1,
+                           pyfftw_kwargs={}, method='convolve', n_jobs=1,
+                           **kwargs):
         '''
         Smooth data using a Gaussian kernel. NaN interpolation during
         convolution is automatically used when the data contains any NaNs.
 
         Parameters
         ----------
+        use_pyfftw : bool, optional
+            Enable to use pyfftw, if it is installed.
+        threads : int, optional
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
+        pyfftw_kwargs : Passed to
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
+        method : {"convolve", "fourier"}, optional
+            "convolve" calls `~astropy.convolve.convolve_fft` with a
+            `~astropy.convolution.Gaussian2DKernel` for each radius.
+            "fourier" transforms the zero-padded image, and its mask of
+            NaNs if there are any, once. Each smoothed image is then made
+            by multiplying with the separable transform of the kernel. The
+            smoothed images are the same as with "convolve", including the
+            NaN interpolation and the zero-filled edges.
+        n_jobs : int, optional
+            Number of threads used to make the smoothed images with
+            "fourier".
         kwargs: Passed to `~astropy.convolve.convolve_fft`.
         '''
 
+        if method not in ["convolve", "fourier"]:
+            raise ValueError("method must be 'convolve' or 'fourier'. "
+                             "Given {}".format(method))
+
+        engine = get_fft_engine(use_pyfftw=use_pyfftw, threads=threads,
+                                **pyfftw_kwargs)
+
+        if method == "fourier":
+            smoother = _GaussianSmoother(self.data, engine)
+            self._smoothed_images = \
+                list(ordered_map(smoother, self.smoothing_radii,
+                                 n_jobs=n_jobs))
+            return
+
+        kwargs.setdefault('fftn', engine.fftn)
+        kwargs.setdefault('ifftn', engine.ifftn)
+
         self._smoothed_images = []
 
         for i, width in enumerate(self.smoothing_radii):
@@ -220,6 +263,7 @@ class Genus(BaseStatisticMixIn):
             area a region must have to be counted.
         connectivity : {1, 2}, optional
             Connectivity used when removing regions below min_size.
+            Regions are always counted with eight-connectivity.
         '''
 
         if use_beam:
@@ -240,21 +284,17 @@ class Genus(BaseStatisticMixIn):
         self._genus_stats = np.empty((len(self.smoothed_images),
                                       len(self.thresholds)))
 
+        # The number of regions above and below all of the thresholds is
+        # found in one sweep over the sorted pixels for each image.
         for j, image in enumerate(self.smoothed_images):
-            for i, thresh in enumerate(self.thresholds):
-                high_density = remove_small_objects(image > thresh,
-                                                    min_size=min_size,
-                                                    connectivity=connectivity)
-                low_density = remove_small_objects(image < thresh,
-                                                   min_size=min_size,
-                                                   connectivity=connectivity)
-                # eight-connectivity to count the regions
-                high_density_labels, high_density_num = \
-                    nd.label(high_density, np.ones((3, 3)))
-                low_density_labels, low_density_num = \
-                    nd.label(low_density, np.ones((3, 3)))
-
-                self._genus_stats[j, i] = high_density_num - low_density_num
+            high_density_num = \
+                _region_counts(image, self.thresholds, min_size=min_size,
+                               connectivity=connectivity)
+            low_density_num = \
+                _region_counts(-image, -self.thresholds, min_size=min_size,
+                               connectivity=connectivity)
+
+            self._genus_stats[j] = high_density_num - low_density_num
 
     @property
     def genus_stats(self):
@@ -303,6 +343,7 @@ class Genus(BaseStatisticMixIn):
         else:
             plt.show()
 
+    @cached_run
     def run(self, verbose=False, save_name=None, use_beam=False,
             beam_area=None, min_size=4, color='b', **kwargs):
         '''
@@ -351,11 +392,14 @@ class GenusDistance(object):
         Kernel radii to smooth data to.
     fiducial_model : Genus
         Computed Genus object. Use to avoid recomputing.
+    method : {"convolve", "fourier"}, optional
+        Smoothing method. See `~Genus.make_smooth_arrays`.
     """
 
     __doc__ %= {"dtypes": " or ".join(common_types + twod_types)}
 
-    def __init__(self, img1, img2, smoothing_radii=None, fiducial_model=None):
+    def __init__(self, img1, img2, smoothing_radii=None, fiducial_model=None,
+                 method='convolve'):
         super(GenusDistance, self).__init__()
 
         # Standardize the intensity values in the images
@@ -371,11 +415,11 @@ class GenusDistance(object):
         else:
             self.genus1 = \
                 Genus(img1, smoothing_radii=smoothing_radii,
-                      lowdens_percent=20).run()
+                      lowdens_percent=20).run(method=method)
 
         self.genus2 = \
             Genus(img2, smoothing_radii=smoothing_radii,
-                  lowdens_percent=20).run()
+                  lowdens_percent=20).run(method=method)
 
         # When normalizing the genus curves for the distance metric, find
         # the scaling between the angular size of the grids.
@@ -489,3 +533,280 @@ def remove_small_objects(arr, min_size, connectivity=8):
         arr[posns] = 0
 
     return arr
+
+
+class _GaussianSmoother(object):
+    '''
+    Smooths an image with a Gaussian of any width, using the transforms of
+    the kernel profiles.
+
+    The smoothing matches `~astropy.convolution.convolve_fft` with the
+    image-sized `~astropy.convolution.Gaussian2DKernel` used by the
+    "convolve" method. The kernel is separable, so its transform is the
+    outer product of the transforms of its sampled profiles. As in the
+    kernel, the profiles are sampled half a pixel off of the lags along
+    axes with an even size, and are not renormalized after truncation.
+
+    The image, with NaNs set to zero, is zero-padded by half of the kernel
+    size and transformed once, along with its mask of NaNs when there are
+    any. With NaNs, each smoothed image is divided by the kernel sum minus
+    the smoothed NaN mask, which interpolates over the NaNs as
+    `convolve_fft` does. The pixels beyond the edges are zeros with full
+    weight, so the edges are not renormalized.
+    '''
+
+    def __init__(self, img, engine):
+
+        self._engine = engine
+
+        self._img_shape = img.shape
+
+        # Gaussian2DKernel(x_size=img.shape[0], y_size=img.shape[1])
+        self._kernel_shape = img.shape[::-1]
+
+        self.shape = tuple(next_fast_len(size + kern_size // 2)
+                           for size, kern_size in zip(img.shape,
+                                                      self._kernel_shape))
+
+        finite = np.isfinite(img)
+
+        self._ft_img = self._engine.rfftn(np.where(finite, img, 0.),
+                                          s=self.shape)
+
+        if finite.all():
+            self._ft_nans = None
+        else:
+            self._ft_nans = self._engine.rfftn((~finite).astype(float),
+                                               s=self.shape)
+
+    def __call__(self, width):
+        '''
+        Returns the image smoothed by a Gaussian with a standard deviation
+        of `width` pixels.
+        '''
+
+        transforms = []
+        sums = []
+        for axis, (size, kern_size) in enumerate(zip(self.shape,
+                                                     self._kernel_shape)):
+            lags = np.arange(kern_size) - kern_size // 2
+            samples = lags + 0.5 * (kern_size % 2 == 0)
+            profile = np.exp(-samples**2 / (2 * width**2)) / \
+                (np.sqrt(2 * np.pi) * width)
+
+            kern = np.zeros(size)
+            kern[lags % size] = profile
+
+            if axis == len(self.shape) - 1:
+                transforms.append(np.fft.rfft(kern))
+            else:
+                transforms.append(np.fft.fft(kern))
+            sums.append(profile.sum())
+
+        transfer = np.outer(*transforms)
+
+        crop = (slice(0, self._img_shape[0]), slice(0, self._img_shape[1]))
+
+        smooth_img = self._engine.irfftn(self._ft_img * transfer,
+                                         s=self.shape)[crop]
+
+        if self._ft_nans is None:
+            return smooth_img
+
+        weights = np.prod(sums) - \
+            self._engine.irfftn(self._ft_nans * transfer, s=self.shape)[crop]
+        weights[weights < 0] = 0.
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            smooth_img = smooth_img / weights
+        smooth_img[weights == 0] = 0.
+
+        return smooth_img
+
+
+def _region_counts(image, thresholds, min_size=4, connectivity=1):
+    '''
+    Number of eight-connected regions where `image` is above each
+    threshold, after removing regions with fewer than `min_size` pixels
+    with `remove_small_objects`.
+
+    Instead of labeling the image at each threshold, each pixel is given
+    the number of thresholds below it, and the regions at every threshold
+    are found from spanning forests of the pixel graph. A pixel is in a
+    large enough region below the level where its region, with the given
+    connectivity, has `min_size` pixels. The set of these pixels only
+    grows as the threshold is lowered, so the number of its
+    eight-connected regions at a threshold is the number of pixels above
+    it minus the number of forest edges above it.
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        2D image. NaNs are never above a threshold.
+    thresholds : numpy.ndarray
+        Thresholds to count the regions at.
+    min_size : int, optional
+        Smallest allowed region size.
+    connectivity : {1, 2}, optional
+        Connectivity used when removing regions below min_size.
+
+    Returns
+    -------
+    counts : numpy.ndarray
+        Number of regions at each threshold.
+    '''
+
+    thresholds = np.asarray(thresholds)
+    order = np.argsort(thresholds)
+    num_levels = thresholds.size
+
+    # A pixel is above the thresholds that are lower than its level.
+    values = np.where(np.isfinite(image), image, -np.inf)
+    levels = np.searchsorted(thresholds[order], values, side='left')
+
+    if min_size > 1:
+        levels = _large_region_levels(levels, min_size, connectivity)
+
+    forest_levels = _max_spanning_forest(levels, 2)[2]
+
+    num_above = np.bincount(levels.ravel(), minlength=num_levels + 1) - \
+        np.bincount(forest_levels, minlength=num_levels + 1)
+    num_above = num_above[::-1].cumsum()[::-1]
+
+    counts = np.empty(num_levels, dtype=int)
+    counts[order] = num_above[1:]
+
+    return counts
+
+
+def _neighbour_pairs(levels, connectivity):
+    '''
+    Flattened indices of each pair of neighbouring pixels. A diagonal pair
+    is only needed where both other pixels of its 2x2 square are lower;
+    otherwise the pair is connected through them at every level.
+    '''
+
+    inds = np.arange(levels.size).reshape(levels.shape)
+
+    pairs = [(inds[:-1], inds[1:]), (inds[:, :-1], inds[:, 1:])]
+    if connectivity == 2:
+        top_left, top_right = levels[:-1, :-1], levels[:-1, 1:]
+        bottom_left, bottom_right = levels[1:, :-1], levels[1:, 1:]
+
+        diag = np.minimum(top_left, bottom_right) > \
+            np.maximum(top_right, bottom_left)
+        anti_diag = np.minimum(top_right, bottom_left) > \
+            np.maximum(top_left, bottom_right)
+
+        pairs += [(inds[:-1, :-1][diag], inds[1:, 1:][diag]),
+                  (inds[:-1, 1:][anti_diag], inds[1:, :-1][anti_diag])]
+
+    rows = np.concatenate([pair[0].ravel() for pair in pairs])
+    cols = np.concatenate([pair[1].ravel() for pair in pairs])
+
+    return rows, cols
+
+
+def _max_spanning_forest(levels, connectivity):
+    '''
+    Edges of the maximum spanning forest of the pixel graph, and their
+    levels. The level of an edge is the lower level of its two pixels, and
+    edges at level 0 are never included.
+    '''
+
+    rows, cols = _neighbour_pairs(levels, connectivity)
+
+    levels = levels.ravel()
+    edge_levels = np.minimum(levels[rows], levels[cols])
+
+    keep = edge_levels > 0
+    rows, cols, edge_levels = rows[keep], cols[keep], edge_levels[keep]
+
+    # The minimum spanning tree of the weights is the maximum spanning
+    # forest of the levels.
+    top_level = levels.max() + 1
+    forest = \
+        minimum_spanning_tree(coo_matrix((top_level - edge_levels,
+                                          (rows, cols)),
+                                         shape=(levels.size,
+                                                levels.size))).tocoo()
+
+    return forest.row, forest.col, top_level - forest.data.astype(int)
+
+
+def _large_region_levels(levels, min_size, connectivity):
+    '''
+    Highest level at which each pixel is in a region with at least
+    `min_size` pixels, or 0 if its region is never large enough.
+
+    The spanning forest is rooted, so adding an edge joins the region
+    of the child pixel, which it is the top of, to the region of its
+    parent. All edges at one level are added at once, and the top of each
+    region is found by pointer jumping.
+    '''
+
+    npix = levels.size
+    rows, cols, edge_levels = _max_spanning_forest(levels, connectivity)
+
+    # Root each tree of the forest at one of its pixels, by searching from
+    # an extra node joined to all of them.
+    forest = coo_matrix((np.ones(rows.size), (rows, cols)),
+                        shape=(npix, npix))
+    num_trees, labels = connected_components(forest, directed=False)
+    roots = np.unique(labels, return_index=True)[1]
+
+    graph = coo_matrix((np.ones(rows.size + num_trees),
+                        (np.append(rows, np.full(num_trees, npix)),
+                         np.append(cols, roots))),
+                       shape=(npix + 1, npix + 1))
+    tree_parent = breadth_first_order(graph, npix, directed=False,
+                                      return_predecessors=True)[1][:npix]
+
+    children = np.where(tree_parent[rows] == cols, rows, cols)
+
+    order = np.argsort(edge_levels, kind='mergesort')
+    children = children[order]
+    bounds = np.searchsorted(edge_levels[order],
+                             np.arange(levels.max() + 2))
+
+    top = np.arange(npix)
+    size = np.ones(npix, dtype=int)
+    large_levels = np.zeros(npix, dtype=levels.dtype)
+    # The top of the region each pixel joined, kept to find the level at
+    # which it became large enough.
+    joined = np.arange(npix)
+
+    for level in range(levels.max(), 0, -1):
+        hooked = children[bounds[level]:bounds[level + 1]]
+        if hooked.size == 0:
+            continue
+
+        top[hooked] = tree_parent[hooked]
+        while True:
+            next_top = top[top[hooked]]
+            if (next_top == top[hooked]).all():
+                break
+            top[hooked] = next_top
+
+        tops, inds = np.unique(top[hooked], return_inverse=True)
+        new_size = size[tops] + \
+            np.bincount(inds, weights=size[hooked]).astype(int)
+
+        now_large = (size[hooked] < min_size) & (new_size[inds] >= min_size)
+        large_levels[hooked[now_large]] = level
+        now_large = (size[tops] < min_size) & (new_size >= min_size)
+        large_levels[tops[now_large]] = level
+
+        size[tops] = new_size
+        joined[hooked] = top[hooked]
+
+    # Pixels take the level of the first region they joined that became
+    # large enough.
+    ancestor = np.where(large_levels > 0, np.arange(npix), joined)
+    while True:
+        next_ancestor = ancestor[ancestor]
+        if (next_ancestor == ancestor).all():
+            break
+        ancestor = next_ancestor
+
+    return large_levels[ancestor].reshape(levels.shape)
@@ -2,19 +2,12 @@
 from __future__ import print_function, absolute_import, division
 
 import numpy as np
-from numpy.fft import fftshift
 import astropy.units as u
 from warnings import warn
-import sys
-from copy import deepcopy
-
-if sys.version_info[0] >= 3:
-    import _pickle as pickle
-else:
-    import cPickle as pickle
 
 from ..base_pspec2 import StatisticBase_PSpec2D
 from ..base_statistic import BaseStatisticMixIn
+from ..result_cache import cached_run
 from ...io import input_data, common_types, twod_types
 from ..fitting_utils import check_fit_limits
 from ..rfft_to_fft import rfft_to_fft
@@ -42,6 +35,8 @@ class MVC(BaseStatisticMixIn, StatisticBase_PSpec2D):
 
     __doc__ %= {"dtypes": " or ".join(common_types + twod_types)}
 
+    _data_attrs = ("_centroid", "_moment0", "_linewidth")
+
     def __init__(self, centroid, moment0, linewidth, header=None,
                  distance=None, beam=None):
 
@@ -137,7 +132,8 @@ class MVC(BaseStatisticMixIn, StatisticBase_PSpec2D):
         use_pyfftw : bool, optional
             Enable to use pyfftw, if it is installed.
         threads : int, optional
-            Number of threads to use in FFT when using pyfftw.
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
         pyfftw_kwargs : Passed to
             `~turbustat.statistics.rfft_to_fft.rfft_to_fft`. See
             `here <http://hgomersall.github.io/pyFFTW/pyfftw/builders/builders.html>`__
@@ -161,12 +157,13 @@ class MVC(BaseStatisticMixIn, StatisticBase_PSpec2D):
         if pyfftw_kwargs.get('threads') is not None:
             pyfftw_kwargs.pop('threads')
 
-        term1 = rfft_to_fft(term1_data,
+        # Keep the half-plane layout from the RFFT
+        term1 = rfft_to_fft(term1_data, keep_rfft=True,
                             use_pyfftw=use_pyfftw,
                             threads=threads,
                             **pyfftw_kwargs)
 
-        fft_mom0 = rfft_to_fft(mom0_data,
+        fft_mom0 = rfft_to_fft(mom0_data, keep_rfft=True,
                                use_pyfftw=use_pyfftw,
                                threads=threads,
                                **pyfftw_kwargs)
@@ -176,9 +173,6 @@ class MVC(BaseStatisticMixIn, StatisticBase_PSpec2D):
 
         mvc_fft = term1 - term2 * fft_mom0
 
-        # Shift to the center
-        mvc_fft = fftshift(mvc_fft)
-
         if beam_correct:
             if not hasattr(self, '_beam'):
                 raise AttributeError("Beam correction cannot be applied since"
@@ -188,42 +182,18 @@ class MVC(BaseStatisticMixIn, StatisticBase_PSpec2D):
                                              y_size=self.centroid.shape[0],
                                              x_size=self.centroid.shape[1])
 
-            beam_fft = fftshift(rfft_to_fft(beam_kern.array))
+            beam_fft = rfft_to_fft(beam_kern.array, keep_rfft=True)
 
             self._beam_pow = np.abs(beam_fft**2)
 
-        self._ps2D = np.abs(mvc_fft) ** 2.
+        ps2D_half = np.abs(mvc_fft) ** 2.
 
         if beam_correct:
-            self._ps2D /= self._beam_pow
-
-    def save_results(self, output_name, keep_data=False):
-        '''
-        Save the results of the SCF to avoid re-computing.
-        The pickled file will not include the data cube by default.
-
-        Parameters
-        ----------
-        output_name : str
-            Name of the outputted pickle file.
-        keep_data : bool, optional
-            Save the data cube in the pickle file when enabled.
-        '''
-
-        if not output_name.endswith(".pkl"):
-            output_name += ".pkl"
-
-        self_copy = deepcopy(self)
-
-        # Don't keep the whole cube unless keep_data enabled.
-        if not keep_data:
-            self_copy._centroid = None
-            self_copy._moment0 = None
-            self_copy._linewidth = None
+            ps2D_half /= self._beam_pow
 
-        with open(output_name, 'wb') as output:
-                pickle.dump(self_copy, output, -1)
+        self._set_ps2D_half(ps2D_half, self.centroid.shape)
 
+    @cached_run
     def run(self, verbose=False, beam_correct=False,
             apodize_kernel=None, alpha=0.2, beta=0.0,
             use_pyfftw=False, threads=1, pyfftw_kwargs={},
@@ -242,7 +212,8 @@ class MVC(BaseStatisticMixIn, StatisticBase_PSpec2D):
         use_pyfftw : bool, optional
             Enable to use pyfftw, if it is installed.
         threads : int, optional
-            Number of threads to use in FFT when using pyfftw.
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
         pyfft_kwargs : Passed to
             `~turbustat.statistics.rfft_to_fft.rfft_to_fft`. See
             `here <https://hgomersall.github.io/pyFFTW/pyfftw/interfaces/interfaces.html#interfaces-additional-args>`_
@@ -6,6 +6,7 @@ import astropy.units as u
 from warnings import warn
 
 from ..base_statistic import BaseStatisticMixIn
+from ..result_cache import cached_run
 from ...io import common_types, threed_types, input_data, find_beam_width
 
 # PCA utilities
@@ -14,6 +15,7 @@ from .width_estimate import WidthEstimate1D, WidthEstimate2D
 
 # Fitting utilities
 from ..fitting_utils import bayes_linear, leastsq_linear
+from ..fft_engine import get_fft_engine
 
 
 class PCA(BaseStatisticMixIn):
@@ -270,10 +272,12 @@ class PCA(BaseStatisticMixIn):
         # Calculate the eigenimages
         eigimgs = self.eigimages(n_eigs=n_eigs)
 
+        engine = get_fft_engine()
+
         for idx, image in enumerate(eigimgs):
-            fftx = np.fft.fft2(image)
+            fftx = engine.fftn(image)
             fftxs = np.conjugate(fftx)
-            acor = np.fft.ifft2((fftx - fftx.mean()) * (fftxs - fftxs.mean()))
+            acor = engine.ifftn((fftx - fftx.mean()) * (fftxs - fftxs.mean()))
             acor = np.fft.fftshift(acor)
 
             if idx == 0:
@@ -305,10 +309,12 @@ class PCA(BaseStatisticMixIn):
         if n_eigs is None:
             n_eigs = self.n_eigs
 
+        engine = get_fft_engine()
+
         for idx in range(n_eigs):
-            fftx = np.fft.fft(self.eigvecs[:, idx])
+            fftx = engine.fft(self.eigvecs[:, idx])
             fftxs = np.conjugate(fftx)
-            acor = np.fft.ifft((fftx - fftx.mean()) * (fftxs - fftxs.mean()))
+            acor = engine.ifft((fftx - fftx.mean()) * (fftxs - fftxs.mean()))
             if idx == 0:
                 acors = acor.real
             else:
@@ -815,6 +821,7 @@ class PCA(BaseStatisticMixIn):
         else:
             plt.show()
 
+    @cached_run
     def run(self, show_progress=True, verbose=False, save_name=None,
             mean_sub=False, decomp_only=False, n_eigs='auto', min_eigval=None,
             eigen_cut_method='value', spatial_method='contour',
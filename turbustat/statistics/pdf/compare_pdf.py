@@ -9,6 +9,7 @@ from warnings import warn
 
 from ..stats_utils import hellinger, common_histogram_bins, data_normalization
 from ..base_statistic import BaseStatisticMixIn
+from ..result_cache import cached_run
 from ...io import common_types, twod_types, threed_types, input_data
 
 
@@ -501,6 +502,7 @@ class PDF(BaseStatisticMixIn):
         else:
             plt.show()
 
+    @cached_run
     def run(self, verbose=False, save_name=None, bins=None, do_fit=True,
             model=lognorm, color=None, **kwargs):
         '''
@@ -4,15 +4,20 @@ from __future__ import print_function, absolute_import, division
 import numpy as np
 from scipy.stats import binned_statistic
 import astropy.units as u
-from astropy.coordinates import Angle
 from scipy.stats import t as t_dist
+from collections import OrderedDict
+from threading import Lock
 
 
 def pspec(psd2, nbins=None, return_stddev=False, binsize=1.0,
           logspacing=True, max_bin=None, min_bin=None, return_freqs=True,
-          theta_0=None, delta_theta=None, boot_iter=None):
+          theta_0=None, delta_theta=None, boot_iter=None, boot_seed=None,
+          boot_max_memory=2**27):
     '''
-    Calculate the radial profile using scipy.stats.binned_statistic.
+    Calculate the radial profile of a 2D power spectrum. The assignment of
+    pixels to the bins is cached (see
+    `~turbustat.statistics.psds.get_radial_bins`), so repeated calls with the
+    same shape and binning only require a pass of `np.bincount`.
 
     Parameters
     ----------
@@ -41,7 +46,13 @@ def pspec(psd2, nbins=None, return_stddev=False, binsize=1.0,
         a `theta_0` is given. Must have angular units.
     boot_iter : int, optional
         Number of bootstrap iterations for estimating the standard deviation
-        in each bin. Require `return_stddev=True`.
+        in each bin. Require `return_stddev=True`. See
+        `~turbustat.statistics.psds.bootstrap_binned_stddev`.
+    boot_seed : int, optional
+        Random seed for the bootstrap resampling.
+    boot_max_memory : int, optional
+        Approximate memory limit, in bytes, for the bootstrap resamples held
+        in memory at once.
 
     Returns
     -------
@@ -52,48 +63,574 @@ def pspec(psd2, nbins=None, return_stddev=False, binsize=1.0,
     ps1D_stddev : np.ndarray
         Returned when return_stddev is enabled. Standard deviations
         within each of the bins.
+    azim_mask : np.ndarray
+        Returned when `theta_0` is given. The azimuthal mask in the 2D
+        power spectrum.
     '''
 
-    yy, xx = make_radial_arrays(psd2.shape)
+    bin_index = get_radial_bins(psd2.shape, rfft=False, nbins=nbins,
+                                binsize=binsize, logspacing=logspacing,
+                                max_bin=max_bin, min_bin=min_bin,
+                                return_freqs=return_freqs, theta_0=theta_0,
+                                delta_theta=delta_theta)
+
+    return _binned_pspec(bin_index, psd2, return_stddev, boot_iter,
+                         boot_seed, boot_max_memory)
+
+
+def pspec_rfft(psd2_half, shape, nbins=None, return_stddev=False,
+               binsize=1.0, logspacing=True, max_bin=None, min_bin=None,
+               return_freqs=True, theta_0=None, delta_theta=None,
+               boot_iter=None, boot_seed=None, boot_max_memory=2**27):
+    '''
+    Calculate the radial profile from the half-plane (RFFT) layout of a 2D
+    power spectrum, without expanding to the full plane.
+
+    Each half-plane pixel that has a distinct Hermitian counterpart in the
+    negative frequencies is binned twice: once at its own position and once
+    at the position of its counterpart. The output is the same as
+    `~turbustat.statistics.psds.pspec` applied to the full power spectrum
+    (see `~turbustat.statistics.base_pspec2.StatisticBase_PSpec2D.ps2D`).
+
+    Parameters
+    ----------
+    psd2_half : np.ndarray
+        2D spectral power density in the unshifted RFFT layout, with shape
+        `(shape[0], shape[1] // 2 + 1)`.
+    shape : tuple
+        Shape of the full 2D power spectrum (the shape of the image).
+    nbins : int, optional
+        Number of bins to use. If None, it is calculated based on the size
+        of the given arrays.
+    return_stddev : bool, optional
+        Return the standard deviations in each bin.
+    binsize : float, optional
+        Size of bins to be used. If logspacing is enabled, this will increase
+        the number of bins used by the inverse of the given binsize.
+    logspacing : bool, optional
+        Use logarithmically spaces bins.
+    max_bin : float, optional
+        Give the maximum value to bin to.
+    min_bin : float, optional
+        Give the minimum value to bin to.
+    return_freqs : bool, optional
+        Return spatial frequencies.
+    theta_0 : `~astropy.units.Quantity`, optional
+        The center angle of the azimuthal mask. Must have angular units.
+    delta_theta : `~astropy.units.Quantity`, optional
+        The width of the azimuthal mask. This must be given when
+        a `theta_0` is given. Must have angular units.
+    boot_iter : int, optional
+        Number of bootstrap iterations for estimating the standard deviation
+        in each bin. Require `return_stddev=True`. See
+        `~turbustat.statistics.psds.bootstrap_binned_stddev`.
+    boot_seed : int, optional
+        Random seed for the bootstrap resampling.
+    boot_max_memory : int, optional
+        Approximate memory limit, in bytes, for the bootstrap resamples held
+        in memory at once.
+
+    Returns
+    -------
+    bins_cents : np.ndarray
+        Centre of the bins.
+    ps1D : np.ndarray
+        1D binned power spectrum.
+    ps1D_stddev : np.ndarray
+        Returned when return_stddev is enabled. Standard deviations
+        within each of the bins.
+    azim_mask : np.ndarray
+        Returned when `theta_0` is given. The azimuthal mask in the full
+        2D power spectrum.
+    '''
+
+    shape = tuple(shape)
+
+    if len(shape) != 2:
+        raise ValueError("shape must be 2D.")
+
+    if psd2_half.shape != (shape[0], shape[1] // 2 + 1):
+        raise ValueError("psd2_half has shape {0}, but the RFFT of an array "
+                         "with shape {1} has shape {2}."
+                         .format(psd2_half.shape, shape,
+                                 (shape[0], shape[1] // 2 + 1)))
+
+    bin_index = get_radial_bins(shape, rfft=True, nbins=nbins,
+                                binsize=binsize, logspacing=logspacing,
+                                max_bin=max_bin, min_bin=min_bin,
+                                return_freqs=return_freqs, theta_0=theta_0,
+                                delta_theta=delta_theta)
+
+    return _binned_pspec(bin_index, psd2_half, return_stddev, boot_iter,
+                         boot_seed, boot_max_memory)
+
+
+def _binned_pspec(bin_index, values, return_stddev, boot_iter, boot_seed,
+                  boot_max_memory):
+    '''
+    Shared reduction for `pspec` and `pspec_rfft`.
+    '''
+
+    if return_stddev and boot_iter is None:
+        ps1D, ps1D_stddev = bin_index.bin_stats(values, return_stddev=True,
+                                                ddof=1)
+    else:
+        ps1D = bin_index.bin_stats(values, return_stddev=False)
+
+    bin_cents = bin_index.bin_centers
+
+    if not return_stddev:
+        if bin_index.azim_mask is not None:
+            return bin_cents, ps1D, bin_index.azim_mask
+        else:
+            return bin_cents, ps1D
+
+    if boot_iter is not None:
+        ps1D_stddev = \
+            bootstrap_binned_stddev(bin_index.sorted_values(values),
+                                    bin_index.bin_counts, boot_iter,
+                                    seed=boot_seed,
+                                    max_memory=boot_max_memory)
+
+    # We're dealing with variations in the number of samples for each bin.
+    # Add a correction based on the t distribution
+    ps1D, ps1D_stddev = \
+        _small_sample_correction(ps1D, ps1D_stddev,
+                                 bin_index.bin_counts.astype(float))
+
+    if bin_index.azim_mask is not None:
+        return bin_cents, ps1D, ps1D_stddev, bin_index.azim_mask
+    else:
+        return bin_cents, ps1D, ps1D_stddev
+
+
+class RadialBinIndex(object):
+    '''
+    Precomputed assignment of the pixels in a 2D array to 1D bins. Created
+    by `~turbustat.statistics.psds.get_radial_bins`.
+
+    Parameters
+    ----------
+    segments : list of tuples
+        Each segment is a pair of an integer array of bin numbers and the
+        slices that select the matching values from the array that is
+        binned. Pixels outside of the bins, or masked, have a bin number
+        equal to `nbins`.
+    bin_edges : np.ndarray
+        Edges of the bins.
+    azim_mask : np.ndarray, optional
+        Azimuthal mask used to create the bins.
+    '''
+
+    def __init__(self, segments, bin_edges, azim_mask=None):
+
+        self.segments = segments
+        self.bin_edges = bin_edges
+        self.nbins = len(bin_edges) - 1
+        self.azim_mask = azim_mask
+
+        self.bin_counts = np.zeros(self.nbins, dtype=int)
+        for bin_num, _ in self.segments:
+            self.bin_counts += \
+                np.bincount(bin_num.ravel(),
+                            minlength=self.nbins + 1)[:self.nbins]
+
+        self._order = None
+
+    @property
+    def bin_centers(self):
+        '''
+        Centres of the bins.
+        '''
+        return (self.bin_edges[1:] + self.bin_edges[:-1]) / 2.
+
+    def bin_stats(self, values, return_stddev=True, ddof=1):
+        '''
+        Mean and standard deviation of the values in each bin. NaNs are
+        ignored, as in `np.nanmean` and `np.nanstd`.
+
+        Parameters
+        ----------
+        values : np.ndarray
+            Array to bin.
+        return_stddev : bool, optional
+            Return the standard deviation in each bin.
+        ddof : int, optional
+            Delta degrees of freedom for the standard deviation.
+
+        Returns
+        -------
+        mean : np.ndarray
+            Mean in each bin.
+        stddev : np.ndarray
+            Standard deviation in each bin. Returned when `return_stddev` is
+            enabled.
+        '''
+
+        return binned_mean_std([(bin_num, values[slices]) for bin_num, slices
+                                in self.segments],
+                               self.nbins, return_stddev=return_stddev,
+                               ddof=ddof)
+
+    def sorted_values(self, values):
+        '''
+        Order the values by their bin. Values outside of the bins are
+        removed.
+
+        Parameters
+        ----------
+        values : np.ndarray
+            Array to bin.
+
+        Returns
+        -------
+        sorted_vals : np.ndarray
+            The values in bin order (including NaNs). The number in each
+            bin is given by `bin_counts`.
+        '''
+
+        if self._order is None:
+            all_bins = np.concatenate([bin_num.ravel() for bin_num, _ in
+                                       self.segments])
+            order = np.argsort(all_bins, kind='mergesort')
+            self._order = order[:self.bin_counts.sum()]
+
+        all_vals = np.concatenate([values[slices].ravel() for _, slices in
+                                   self.segments])
+
+        return all_vals[self._order]
+
+
+def bootstrap_binned_stddev(sorted_vals, bin_counts, niters, seed=None,
+                            max_memory=2**27):
+    '''
+    Bootstrap estimate of the standard deviation in each bin. For each bin,
+    the values are resampled with replacement `niters` times, and the
+    standard deviations of the resamples are averaged.
+
+    The resampling for all bins is done at once. The iterations are split
+    into blocks to limit the memory used.
+
+    Parameters
+    ----------
+    sorted_vals : np.ndarray
+        Values ordered by bin. See `RadialBinIndex.sorted_values`.
+    bin_counts : np.ndarray
+        Number of values in each bin.
+    niters : int
+        Number of bootstrap iterations.
+    seed : int, optional
+        Random seed. The same seed gives the same standard deviations.
+    max_memory : int, optional
+        Approximate memory limit, in bytes, for the resamples held in
+        memory at once.
+
+    Returns
+    -------
+    stddev : np.ndarray
+        Bootstrapped standard deviation in each bin. Empty bins are NaN.
+    '''
+
+    niters = int(niters)
+    if niters < 1:
+        raise ValueError("niters must be at least 1.")
+
+    bin_counts = np.asarray(bin_counts, dtype=int)
+
+    nbins = bin_counts.size
+    nvals = sorted_vals.size
+
+    if bin_counts.sum() != nvals:
+        raise ValueError("The sum of bin_counts ({0}) must match the number "
+                         "of values ({1}).".format(bin_counts.sum(), nvals))
+
+    stddev = np.empty(nbins) * np.NaN
+
+    filled = bin_counts > 0
+    if not filled.any():
+        return stddev
+
+    counts = bin_counts[filled]
+    starts = np.append(0, np.cumsum(counts)[:-1])
+
+    # The start and size of the bin for every value
+    val_starts = np.repeat(starts, counts)
+    val_counts = np.repeat(counts, counts)
+
+    # Approximately 4 arrays of the resample size are needed at once.
+    block_size = int(max(1, min(niters, max_memory // (32 * nvals))))
+
+    rng = np.random.RandomState(seed)
+
+    std_sum = np.zeros(counts.size)
+
+    for start in range(0, niters, block_size):
+        block_iters = min(block_size, niters - start)
+
+        idx = rng.random_sample((block_iters, nvals))
+        idx *= val_counts
+        idx = val_starts + idx.astype(int)
+
+        resamps = sorted_vals[idx]
+
+        del idx
+
+        means = np.add.reduceat(resamps, starts, axis=1) / counts
+        resamps -= np.repeat(means, counts, axis=1)
+        resamps **= 2
+
+        std_sum += np.sqrt(np.add.reduceat(resamps, starts, axis=1) /
+                           counts).sum(0)
+
+        del resamps
+
+    stddev[filled] = std_sum / niters
+
+    return stddev
+
+
+def binned_mean_std(segments, nbins, return_stddev=True, ddof=1):
+    '''
+    Compute the mean and standard deviation in bins using `np.bincount`.
+    NaNs are ignored.
+
+    Parameters
+    ----------
+    segments : list of tuples
+        Pairs of bin numbers and values with matching shapes. Bin numbers
+        equal to `nbins` are ignored.
+    nbins : int
+        Number of bins.
+    return_stddev : bool, optional
+        Return the standard deviation in each bin.
+    ddof : int, optional
+        Delta degrees of freedom for the standard deviation.
+
+    Returns
+    -------
+    mean : np.ndarray
+        Mean in each bin. Empty bins are NaN.
+    stddev : np.ndarray
+        Standard deviation in each bin. Bins with `ddof` or fewer valid
+        points are NaN.
+    '''
+
+    sums = np.zeros(nbins + 1)
+    valid_cts = np.zeros(nbins + 1)
+
+    flat_segments = []
+
+    for bin_num, vals in segments:
+        bin_num = bin_num.ravel()
+        vals = vals.ravel()
+
+        # Only copy the segment when NaNs need to be removed
+        nan_posns = np.isnan(vals)
+        if nan_posns.any():
+            bin_num = bin_num[~nan_posns]
+            vals = vals[~nan_posns]
+
+        sums += np.bincount(bin_num, weights=vals, minlength=nbins + 1)
+        valid_cts += np.bincount(bin_num, minlength=nbins + 1)
+
+        flat_segments.append((bin_num, vals))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sums / valid_cts
+
+    if not return_stddev:
+        return mean[:nbins]
+
+    # The residuals are taken about the mean in each bin, which avoids the
+    # loss of precision from using the sum of squares alone.
+    sq_sums = np.zeros(nbins + 1)
+    for bin_num, vals in flat_segments:
+        sq_sums += np.bincount(bin_num, weights=(vals - mean[bin_num])**2,
+                               minlength=nbins + 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stddev = np.sqrt(sq_sums / (valid_cts - ddof))
+
+    stddev[valid_cts <= ddof] = np.NaN
+
+    return mean[:nbins], stddev[:nbins]
+
+
+def assign_bins(x, bins):
+    '''
+    Find which bin each value falls into, following the bin edge
+    conventions of `scipy.stats.binned_statistic`.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        Values to bin.
+    bins : np.ndarray
+        Bin edges.
+
+    Returns
+    -------
+    bin_num : np.ndarray
+        Bin number of each value, with the shape of `x`. Values outside of
+        the bins are given a bin number of `len(bins) - 1`.
+    '''
+
+    nbins = len(bins) - 1
+
+    bin_num = binned_statistic(x.ravel(), x.ravel(), bins=bins,
+                               statistic='count')[2] - 1
+
+    bin_num[bin_num < 0] = nbins
+    bin_num[bin_num > nbins] = nbins
+
+    # Use the smallest integer type to keep the cache small
+    bin_num = bin_num.astype(np.min_scalar_type(nbins))
+
+    return bin_num.reshape(x.shape)
+
+
+_radial_bin_cache = OrderedDict()
+_radial_bin_cache_lock = Lock()
+_max_radial_bin_cache = 8
+
+
+def get_radial_bins(shape, rfft=False, nbins=None, binsize=1.0,
+                    logspacing=True, max_bin=None, min_bin=None,
+                    return_freqs=True, theta_0=None, delta_theta=None):
+    '''
+    Return the radial bins for a 2D power spectrum. The bins are cached for
+    each combination of the shape and binning parameters, and the most
+    recently used entries are kept. See `clear_radial_bin_cache`.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the full 2D power spectrum.
+    rfft : bool, optional
+        Create the bins for the half-plane (RFFT) layout. See
+        `~turbustat.statistics.psds.pspec_rfft`.
+    nbins : int, optional
+        Number of bins to use. If None, it is calculated based on the size
+        of the given arrays.
+    binsize : float, optional
+        Size of bins to be used.
+    logspacing : bool, optional
+        Use logarithmically spaces bins.
+    max_bin : float, optional
+        Give the maximum value to bin to.
+    min_bin : float, optional
+        Give the minimum value to bin to.
+    return_freqs : bool, optional
+        Bin in spatial frequencies, rather than pixel distances.
+    theta_0 : `~astropy.units.Quantity`, optional
+        The center angle of the azimuthal mask. Must have angular units.
+    delta_theta : `~astropy.units.Quantity`, optional
+        The width of the azimuthal mask.
+
+    Returns
+    -------
+    bin_index : `~turbustat.statistics.psds.RadialBinIndex`
+        The bins.
+    '''
+
+    shape = tuple(int(size) for size in shape)
 
-    dists = np.sqrt(yy**2 + xx**2)
     if theta_0 is not None:
 
         if delta_theta is None:
             raise ValueError("Must give delta_theta.")
 
-        theta_0 = theta_0.to(u.rad)
-        delta_theta = delta_theta.to(u.rad)
+        theta_0 = theta_0.to(u.rad).value
+        delta_theta = delta_theta.to(u.rad).value
+
+    key = (shape, rfft, nbins, binsize, logspacing, max_bin, min_bin,
+           return_freqs, theta_0, delta_theta)
+
+    with _radial_bin_cache_lock:
+        bin_index = _radial_bin_cache.pop(key, None)
+        if bin_index is not None:
+            # Re-insert to mark as most recently used.
+            _radial_bin_cache[key] = bin_index
+            return bin_index
+
+    bin_index = _make_radial_bins(*key)
+
+    with _radial_bin_cache_lock:
+        _radial_bin_cache[key] = bin_index
+        while len(_radial_bin_cache) > _max_radial_bin_cache:
+            _radial_bin_cache.popitem(last=False)
+
+    return bin_index
 
-        theta_limits = Angle([theta_0 - 0.5 * delta_theta,
-                              theta_0 + 0.5 * delta_theta])
 
-        # Define theta array
-        thetas = Angle(np.arctan2(yy, xx) * u.rad)
+def clear_radial_bin_cache():
+    '''
+    Remove all cached radial bins.
+    '''
+    with _radial_bin_cache_lock:
+        _radial_bin_cache.clear()
+
+
+def _make_radial_bins(shape, rfft, nbins, binsize, logspacing, max_bin,
+                      min_bin, return_freqs, theta_0, delta_theta):
+    '''
+    Create the radial bins. See `get_radial_bins`. The angles are in
+    radians.
+    '''
+
+    ny, nx = shape
 
-        # Wrap around pi
-        theta_limits = theta_limits.wrap_at(np.pi * u.rad)
+    # Positions of the pixels in the full 2D power spectrum. For the
+    # half-plane, this includes the positions of the Hermitian counterparts.
+    if rfft:
+        own_posns, mirr_posns, n_mirr = rfft_to_pspec_indices(shape)
+        posns = [own_posns, mirr_posns]
+        slices = [(slice(None), slice(None)),
+                  (slice(None), slice(1, n_mirr + 1))]
+    else:
+        posns = [(np.arange(ny)[:, np.newaxis], np.arange(nx)[np.newaxis])]
+        slices = [(slice(None), slice(None))]
+
+    if theta_0 is not None:
+        azim_mask = make_azimuthal_mask(shape, theta_0, delta_theta)
+        azim_mask.flags.writeable = False
+    else:
+        azim_mask = None
+
+    # Largest distance from the centre
+    max_dist = np.sqrt((ny // 2)**2 + (nx // 2)**2)
 
     if nbins is None:
-        nbins = int(np.round(dists.max() / binsize) + 1)
+        nbins = int(np.round(max_dist / binsize) + 1)
 
     if return_freqs:
-        yy_freq, xx_freq = make_radial_freq_arrays(psd2.shape)
+        yfreqs = np.fft.fftshift(np.fft.fftfreq(ny))[::-1]
+        xfreqs = np.fft.fftshift(np.fft.fftfreq(nx))
+
+        dists = [np.sqrt(yfreqs[posn[0]]**2 + xfreqs[posn[1]]**2)
+                 for posn in posns]
 
-        freqs_dist = np.sqrt(yy_freq**2 + xx_freq**2)
+        # The first set of positions contains every distance
+        zero_freq_val = dists[0][np.nonzero(dists[0])].min() / 2.
+        for dist in dists:
+            dist[dist == 0] = zero_freq_val
 
-        zero_freq_val = freqs_dist[np.nonzero(freqs_dist)].min() / 2.
-        freqs_dist[freqs_dist == 0] = zero_freq_val
+    else:
+        y_center = np.floor(ny / 2.).astype(int)
+        x_center = np.floor(nx / 2.).astype(int)
+
+        dists = [np.sqrt((posn[0] - y_center)**2 + (posn[1] - x_center)**2)
+                 for posn in posns]
 
     if max_bin is None:
         if return_freqs:
             max_bin = 0.5
         else:
-            max_bin = dists.max()
+            max_bin = max_dist
 
     if min_bin is None:
         if return_freqs:
-            min_bin = 1.0 / min(psd2.shape)
+            min_bin = 1.0 / min(shape)
         else:
             min_bin = 0.5
 
@@ -102,87 +639,130 @@ def pspec(psd2, nbins=None, return_stddev=False, binsize=1.0,
     else:
         bins = np.linspace(min_bin, max_bin, nbins + 1)
 
-    if return_freqs:
-        dist_arr = freqs_dist
-    else:
-        dist_arr = dists
+    segments = []
+    for dist, posn, slicer in zip(dists, posns, slices):
+        bin_num = assign_bins(dist, bins)
 
-    if theta_0 is not None:
-        if theta_limits[0] < theta_limits[1]:
-            azim_mask = np.logical_and(thetas >= theta_limits[0],
-                                       thetas <= theta_limits[1])
-        else:
-            azim_mask = np.logical_or(thetas >= theta_limits[0],
-                                      thetas <= theta_limits[1])
+        if azim_mask is not None:
+            bin_num[~azim_mask[posn]] = nbins
 
-        azim_mask = np.logical_or(azim_mask, azim_mask[::-1, ::-1])
+        segments.append((bin_num, slicer))
 
-        # Fill in the middle angles
-        ny = np.floor(psd2.shape[0] / 2.).astype(int)
-        nx = np.floor(psd2.shape[1] / 2.).astype(int)
+    return RadialBinIndex(segments, bins, azim_mask=azim_mask)
 
-        azim_mask[ny - 1:ny + 1, nx - 1:nx + 1] = True
-    else:
-        azim_mask = None
 
-    ps1D, bin_edge, cts = binned_statistic(dist_arr[azim_mask].ravel(),
-                                           psd2[azim_mask].ravel(),
-                                           bins=bins,
-                                           statistic=np.nanmean)
+def rfft_to_pspec_indices(shape):
+    '''
+    Find where the pixels of a 2D RFFT are located in the full 2D power
+    spectrum, after shifting the zero frequency to the centre and
+    flipping the y-axis (the layout of
+    `~turbustat.statistics.base_pspec2.StatisticBase_PSpec2D.ps2D`).
 
-    bin_cents = (bin_edge[1:] + bin_edge[:-1]) / 2.
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the full 2D array.
 
-    if not return_stddev:
-        if theta_0 is not None:
-            return bin_cents, ps1D, azim_mask
-        else:
-            return bin_cents, ps1D
-    else:
+    Returns
+    -------
+    own_posns : tuple of np.ndarray
+        Row and column positions of the RFFT pixels. These broadcast to
+        the RFFT shape.
+    mirr_posns : tuple of np.ndarray
+        Row and column positions of the Hermitian counterparts of the
+        RFFT pixels in columns `1` to `n_mirr`.
+    n_mirr : int
+        Number of RFFT columns with distinct counterparts in the negative
+        frequencies.
+    '''
 
-        if boot_iter is None:
+    ny, nx = shape
 
-            stat_func = lambda x: np.nanstd(x, ddof=1)
+    n_mirr = (nx + 1) // 2 - 1
 
-        else:
-            from astropy.stats import bootstrap
+    rows = np.arange(ny)[:, np.newaxis]
+    cols = np.arange(nx // 2 + 1)[np.newaxis]
+    mirr_rows = (-rows) % ny
+    mirr_cols = nx - cols[:, 1:n_mirr + 1]
+
+    def to_pspec(y, x):
+        return (ny - 1 - (y + ny // 2) % ny, (x + nx // 2) % nx)
 
-            stat_func = lambda data: np.mean(bootstrap(data, boot_iter,
-                                                       bootfunc=np.std))
+    return to_pspec(rows, cols), to_pspec(mirr_rows, mirr_cols), n_mirr
 
-        ps1D_stddev = binned_statistic(dist_arr[azim_mask].ravel(),
-                                       psd2[azim_mask].ravel(),
-                                       bins=bins,
-                                       statistic=stat_func)[0]
 
-        # We're dealing with variations in the number of samples for each bin.
-        # Add a correction based on the t distribution
-        bin_cts = binned_statistic(dist_arr[azim_mask].ravel(),
-                                   psd2[azim_mask].ravel(),
-                                   bins=bins,
-                                   statistic='count')[0]
+def make_azimuthal_mask(shape, theta_0, delta_theta):
+    '''
+    Create an azimuthal mask for a 2D power spectrum. The mask is symmetric
+    about the centre.
 
-        # Two-tail CI for 85% (~1 sigma)
-        alpha = 1 - (0.15 / 2.)
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the 2D power spectrum.
+    theta_0 : float
+        The center angle of the azimuthal mask in radians.
+    delta_theta : float
+        The width of the azimuthal mask in radians.
 
-        # Correction factor to convert to the standard error
-        A = t_dist.ppf(alpha, bin_cts - 1) / np.sqrt(bin_cts)
+    Returns
+    -------
+    azim_mask : np.ndarray
+        Boolean mask.
+    '''
 
-        # If the standard error is larger than the standard deviation,
-        # use it instead
-        ps1D_stddev[A > 1] *= A[A > 1]
+    yy, xx = make_radial_arrays(shape)
 
-        # Mask out bins that have 1 or fewer points
-        mask = bin_cts <= 1
+    thetas = np.arctan2(yy, xx)
 
-        ps1D_stddev[mask] = np.NaN
-        ps1D[mask] = np.NaN
+    del yy, xx
 
-        # ps1D_stddev[ps1D_stddev == 0.] = np.NaN
+    # Wrap the limits to [-pi, pi)
+    theta_limits = np.array([theta_0 - 0.5 * delta_theta,
+                             theta_0 + 0.5 * delta_theta])
+    theta_limits -= np.floor((theta_limits + np.pi) / (2 * np.pi)) * 2 * np.pi
 
-        if theta_0 is not None:
-            return bin_cents, ps1D, ps1D_stddev, azim_mask
-        else:
-            return bin_cents, ps1D, ps1D_stddev
+    if theta_limits[0] < theta_limits[1]:
+        azim_mask = np.logical_and(thetas >= theta_limits[0],
+                                   thetas <= theta_limits[1])
+    else:
+        azim_mask = np.logical_or(thetas >= theta_limits[0],
+                                  thetas <= theta_limits[1])
+
+    azim_mask = np.logical_or(azim_mask, azim_mask[::-1, ::-1])
+
+    # Fill in the middle angles
+    ny = np.floor(shape[0] / 2.).astype(int)
+    nx = np.floor(shape[1] / 2.).astype(int)
+
+    azim_mask[ny - 1:ny + 1, nx - 1:nx + 1] = True
+
+    return azim_mask
+
+
+def _small_sample_correction(ps1D, ps1D_stddev, bin_cts):
+    '''
+    Correct the standard deviations in bins with few samples using the
+    t distribution, and mask bins with 1 or fewer points.
+    '''
+
+    # Two-tail CI for 85% (~1 sigma)
+    alpha = 1 - (0.15 / 2.)
+
+    # Correction factor to convert to the standard error
+    A = t_dist.ppf(alpha, bin_cts - 1) / np.sqrt(bin_cts)
+
+    # If the standard error is larger than the standard deviation,
+    # use it instead
+    ps1D_stddev[A > 1] *= A[A > 1]
+
+    # Mask out bins that have 1 or fewer points
+    mask = bin_cts <= 1
+
+    ps1D_stddev[mask] = np.NaN
+    ps1D[mask] = np.NaN
+
+    return ps1D, ps1D_stddev
 
 
 def make_radial_arrays(shape, y_center=None, x_center=None):
@@ -1,24 +1,20 @@
 # Licensed under an MIT open source license - see LICENSE
 # from __future__ import print_function, absolute_import, division
 
+import tempfile
 import numpy as np
 import numpy.random as ra
 import astropy.units as u
-from scipy.stats import binned_statistic
 from warnings import warn
 from astropy.utils.console import ProgressBar
 from astropy.utils import NumpyRNGContext
-from itertools import product
-
-try:
-    from pyfftw.interfaces.numpy_fft import fft2
-    PYFFTW_FLAG = True
-except ImportError:
-    PYFFTW_FLAG = False
 
 from ..base_statistic import BaseStatisticMixIn
+from ..result_cache import cached_run
 from ...io import common_types, twod_types, input_data
-from ..psds import make_radial_arrays
+from ..psds import make_radial_arrays, assign_bins, binned_mean_std
+from ..fft_engine import get_fft_engine
+from ..stats_utils import ordered_map
 
 
 class Bispectrum(BaseStatisticMixIn):
@@ -60,10 +56,20 @@ class Bispectrum(BaseStatisticMixIn):
 
     def compute_bispectrum(self, show_progress=True, use_pyfftw=False,
                            threads=1, nsamples=100, seed=1000,
-                           mean_subtract=False, **pyfftw_kwargs):
+                           mean_subtract=False, max_memory=2**27,
+                           method='sample', n_jobs=1, max_in_flight=None,
+                           **pyfftw_kwargs):
         '''
         Do the computation.
 
+        With `method='sample'`, the bispectrum is sampled at `nsamples`
+        random pairs of angles for each pair of wavevector magnitudes. The
+        angles for a block of magnitude pairs are drawn at once, in the same
+        order as drawing `nsamples` angles for k_1 and then for k_2 at each
+        magnitude pair, looping over k_2 fastest. With a given `seed`, the
+        bispectrum and bicoherence are the same as with that loop, to the
+        bit, for any `max_memory` and `n_jobs`.
+
         Parameters
         ----------
         show_progress : optional, bool
@@ -71,7 +77,8 @@ class Bispectrum(BaseStatisticMixIn):
         use_pyfftw : bool, optional
             Enable to use pyfftw, if it is installed.
         threads : int, optional
-            Number of threads to use in FFT when using pyfftw.
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
         nsamples : int, optional
             Sets the number of samples to take at each vector
             magnitude.
@@ -81,82 +88,118 @@ class Bispectrum(BaseStatisticMixIn):
             Subtract the mean from the data before computing. This removes the
             "zero frequency" (i.e., constant) portion of the power, resulting
             in a loss of phase coherence along the k_1=k_2 line.
+        max_memory : int, optional
+            Approximate memory, in bytes, used by the samples in each block
+            of magnitude pairs, or by the shell fields with
+            `method='shells'`. Shell fields that do not fit are kept in a
+            temporary file. Defaults to 128 MB.
+        method : {"sample", "shells"}, optional
+            "sample" estimates the bispectrum from `nsamples` random angles
+            at each pair of magnitudes. "shells" sums over every pair of
+            wavevectors in the |k| shells (of unit width, centered on
+            the magnitude) with real-space products of the shell-filtered
+            images. This is exact, has no sampling noise and ignores
+            `nsamples` and `seed`. The bicoherence is normalized with the
+            same sums of the absolute values. The bispectrum amplitudes
+            are sums over all of the pairs, so they are not on the same
+            scale as with "sample". `tracker` is None.
+        n_jobs : int, optional
+            Number of threads used to sample blocks of magnitude pairs in
+            parallel. The angles for each block are drawn from the one
+            random stream set by `seed`, in block order, before the block
+            is given to a thread. The blocks are merged in order, so the
+            results do not depend on `n_jobs`.
+        max_in_flight : int, optional
+            Maximum number of blocks being sampled or waiting to be merged
+            at once. Each uses about `max_memory`. Defaults to twice
+            `n_jobs`.
         pyfft_kwargs : Passed to
             `~turbustat.statistics.rfft_to_fft.rfft_to_fft`. See
             `here <https://hgomersall.github.io/pyFFTW/pyfftw/interfaces/interfaces.html#interfaces-additional-args>`_
             for a list of accepted kwargs.
         '''
 
+        if method not in ["sample", "shells"]:
+            raise ValueError("method must be 'sample' or 'shells'. "
+                             "Given {}".format(method))
+
         if mean_subtract:
             norm_data = self.data - self.data.mean()
         else:
             norm_data = self.data
 
-        if use_pyfftw:
-            if PYFFTW_FLAG:
-                if pyfftw_kwargs.get('threads') is not None:
-                    pyfftw_kwargs.pop('threads')
+        if pyfftw_kwargs.get('threads') is not None:
+            pyfftw_kwargs.pop('threads')
 
-                fftarr = fft2(norm_data,
-                              threads=threads,
-                              **pyfftw_kwargs)
-            else:
-                warn("pyfftw not installed. Reverting to using numpy.")
-                use_pyfftw = False
+        engine = get_fft_engine(use_pyfftw=use_pyfftw, threads=threads,
+                                **pyfftw_kwargs)
 
-        if not use_pyfftw:
-            fftarr = np.fft.fft2(norm_data)
+        bispec_shape = (int(self.shape[0] / 2.), int(self.shape[1] / 2.))
 
-        conjfft = np.conj(fftarr)
+        if method == "shells":
+            bispec, biconorm = _shell_bispectrum(norm_data, bispec_shape,
+                                                 engine, max_memory)
 
-        bispec_shape = (int(self.shape[0] / 2.), int(self.shape[1] / 2.))
+            self._bispectrum = bispec.astype(np.complex)
+            self._tracker = None
 
-        self._bispectrum = np.zeros(bispec_shape, dtype=np.complex)
-        self._bicoherence = np.zeros(bispec_shape, dtype=np.float)
-        self._tracker = np.zeros(self.shape, dtype=np.int16)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self._bicoherence = (np.abs(self.bispectrum) / biconorm)
+                self._bispectrum_amp = np.log10(np.abs(self.bispectrum))
 
-        biconorm = np.ones_like(self.bispectrum, dtype=float)
+            return
 
-        if show_progress:
-            bar = ProgressBar(np.prod(fftarr.shape) / 4.)
+        fftarr = engine.fftn(norm_data)
 
-        prod = product(range(int(fftarr.shape[0] / 2.)),
-                       range(int(fftarr.shape[1] / 2.)))
+        conjfft = np.conj(fftarr)
 
-        with NumpyRNGContext(seed):
-            for n, (k1mag, k2mag) in enumerate(prod):
-                phi1 = ra.uniform(0, 2 * np.pi, nsamples)
-                phi2 = ra.uniform(0, 2 * np.pi, nsamples)
+        npairs = bispec_shape[0] * bispec_shape[1]
+
+        block_size = \
+            max(1, int(max_memory // (_bytes_per_sample * nsamples)))
+
+        self._bispectrum = np.zeros(npairs, dtype=np.complex)
+        biconorm = np.ones(npairs, dtype=float)
+        tracker = np.zeros(np.prod(self.shape), dtype=np.int64)
+
+        if show_progress:
+            bar = ProgressBar(npairs)
 
-                k1x = np.asarray([int(k1mag * np.cos(angle))
-                                  for angle in phi1])
-                k2x = np.asarray([int(k2mag * np.cos(angle))
-                                  for angle in phi2])
-                k1y = np.asarray([int(k1mag * np.sin(angle))
-                                  for angle in phi1])
-                k2y = np.asarray([int(k2mag * np.sin(angle))
-                                  for angle in phi2])
+        def blocks():
+            for start in range(0, npairs, block_size):
+                pairs = np.arange(start, min(start + block_size, npairs))
+                # For each pair, the angles of k_1 are drawn before those of
+                # k_2.
+                phis = ra.uniform(0, 2 * np.pi, (pairs.size, 2, nsamples))
+                yield pairs, phis
 
-                k3x = np.asarray([int(k1mag * np.cos(ang1) +
-                                      k2mag * np.cos(ang2))
-                                  for ang1, ang2 in zip(phi1, phi2)])
-                k3y = np.asarray([int(k1mag * np.sin(ang1) +
-                                      k2mag * np.sin(ang2))
-                                  for ang1, ang2 in zip(phi1, phi2)])
+        def block_outputs(block):
+            pairs, phis = block
+            k1mag, k2mag = np.unravel_index(pairs, bispec_shape)
+            return (pairs,) + _sample_bispectrum(fftarr, conjfft, k1mag,
+                                                 k2mag, phis)
 
-                samps = fftarr[k1x, k1y] * fftarr[k2x, k2y] * conjfft[k3x, k3y]
+        if max_in_flight is None and n_jobs is not None:
+            max_in_flight = 2 * n_jobs
 
-                self._bispectrum[k1mag, k2mag] = np.sum(samps)
+        with NumpyRNGContext(seed):
+            # The blocks are drawn as they are consumed, so all of the
+            # angles come from the seeded stream in order.
+            outputs = ordered_map(block_outputs, blocks(), n_jobs=n_jobs,
+                                  max_in_flight=max_in_flight)
 
-                biconorm[k1mag, k2mag] = np.sum(np.abs(samps))
+            for pairs, bispec_block, biconorm_block, tracker_block in outputs:
 
-                # Track where we're sampling from in fourier space
-                self._tracker[k1x, k1y] += 1
-                self._tracker[k2x, k2y] += 1
-                self._tracker[k3x, k3y] += 1
+                self._bispectrum[pairs] = bispec_block
+                biconorm[pairs] = biconorm_block
+                tracker += tracker_block
 
                 if show_progress:
-                    bar.update(n + 1)
+                    bar.update(pairs[-1] + 1)
+
+        self._bispectrum = self._bispectrum.reshape(bispec_shape)
+        biconorm = biconorm.reshape(bispec_shape)
+        self._tracker = tracker.reshape(self.shape)
 
         self._bicoherence = (np.abs(self.bispectrum) / biconorm)
         self._bispectrum_amp = np.log10(np.abs(self.bispectrum))
@@ -185,7 +228,8 @@ class Bispectrum(BaseStatisticMixIn):
     @property
     def tracker(self):
         '''
-        Array showing the number of samples in each k_1 k_2 bin.
+        Array showing the number of times each position in the Fourier
+        transform was sampled.
         '''
         return self._tracker
 
@@ -257,6 +301,10 @@ class Bispectrum(BaseStatisticMixIn):
         nbins = np.floor(np.pi / bin_width).astype(int)
         bins = np.linspace(0, np.pi, nbins)
 
+        # Assign the bins once for all of the slices
+        theta_bins = assign_bins(theta, bins)
+        bin_cents = (bins[1:] + bins[:-1]) / 2.
+
         azimuthal_slices = {}
         if return_masks:
             masks = []
@@ -267,17 +315,8 @@ class Bispectrum(BaseStatisticMixIn):
             mask = np.logical_and(dist >= rad - del_rad / 2.,
                                   dist <= rad + del_rad / 2.)
 
-            vals, bin_edge, cts = binned_statistic(theta[mask].ravel(),
-                                                   value_arr[mask].ravel(),
-                                                   bins=bins,
-                                                   statistic=np.nanmean)
-
-            stds, bin_edge, cts = binned_statistic(theta[mask].ravel(),
-                                                   value_arr[mask].ravel(),
-                                                   bins=bins,
-                                                   statistic=np.nanstd)
-
-            bin_cents = (bin_edge[1:] + bin_edge[:-1]) / 2.
+            vals, stds = binned_mean_std([(theta_bins[mask], value_arr[mask])],
+                                         len(bins) - 1, ddof=0)
 
             azimuthal_slices[rad] = np.array([bin_cents, vals, stds])
             if return_masks:
@@ -367,23 +406,18 @@ class Bispectrum(BaseStatisticMixIn):
         nbins = np.floor(dist.max() / bin_width).astype(int)
         bins = np.linspace(0, dist.max(), nbins)
 
+        # Assign the bins once for all of the slices
+        dist_bins = assign_bins(dist, bins)
+        bin_cents = (bins[1:] + bins[:-1]) / 2.
+
         for theta, del_theta, theta0 in zip(thetas, delta_thetas, orig_thetas):
 
             # Create the mask of the radii to extract the profile at.
             mask = np.logical_and(theta_arr >= theta - del_theta / 2.,
                                   theta_arr <= theta + del_theta / 2.)
 
-            vals, bin_edge, cts = binned_statistic(dist[mask].ravel(),
-                                                   value_arr[mask].ravel(),
-                                                   bins=bins,
-                                                   statistic=np.nanmean)
-
-            stds, bin_edge, cts = binned_statistic(dist[mask].ravel(),
-                                                   value_arr[mask].ravel(),
-                                                   bins=bins,
-                                                   statistic=np.nanstd)
-
-            bin_cents = (bin_edge[1:] + bin_edge[:-1]) / 2.
+            vals, stds = binned_mean_std([(dist_bins[mask], value_arr[mask])],
+                                         len(bins) - 1, ddof=0)
 
             radial_slices[theta0] = np.array([bin_cents, vals, stds])
             if return_masks:
@@ -444,10 +478,12 @@ class Bispectrum(BaseStatisticMixIn):
         else:
             plt.show()
 
+    @cached_run
     def run(self, show_progress=True, use_pyfftw=False, threads=1,
             nsamples=100, seed=1000,
-            mean_subtract=False, verbose=False,
-            save_name=None, **pyfftw_kwargs):
+            mean_subtract=False, max_memory=2**27, method='sample',
+            n_jobs=1, max_in_flight=None, verbose=False, save_name=None,
+            **pyfftw_kwargs):
         '''
         Compute the bispectrum. Necessary to maintain package standards.
 
@@ -458,13 +494,23 @@ class Bispectrum(BaseStatisticMixIn):
         use_pyfftw : bool, optional
             Enable to use pyfftw, if it is installed.
         threads : int, optional
-            Number of threads to use in FFT when using pyfftw.
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
         nsamples : int, optional
             See `~BiSpectrum.compute_bispectrum`.
         seed : int, optional
             See `~BiSpectrum.compute_bispectrum`.
         mean_subtract : bool, optional
             See `~BiSpectrum.compute_bispectrum`.
+        max_memory : int, optional
+            See `~BiSpectrum.compute_bispectrum`.
+        method : {"sample", "shells"}, optional
+            See `~BiSpectrum.compute_bispectrum`.
+        n_jobs : int, optional
+            Number of threads used to sample the bispectrum. See
+            `~BiSpectrum.compute_bispectrum`.
+        max_in_flight : int, optional
+            See `~BiSpectrum.compute_bispectrum`.
         verbose : bool, optional
             Enables plotting.
         save_name : str,optional
@@ -480,7 +526,10 @@ class Bispectrum(BaseStatisticMixIn):
                                 threads=threads,
                                 nsamples=nsamples,
                                 mean_subtract=mean_subtract,
-                                seed=seed, **pyfftw_kwargs)
+                                seed=seed, max_memory=max_memory,
+                                method=method, n_jobs=n_jobs,
+                                max_in_flight=max_in_flight,
+                                **pyfftw_kwargs)
 
         if verbose:
             self.plot_surface(save_name=save_name)
@@ -488,6 +537,174 @@ class Bispectrum(BaseStatisticMixIn):
         return self
 
 
+# Approximate bytes used by each sample in _sample_bispectrum: the angles,
+# their cosines and sines, the wavevector indices and the products.
+_bytes_per_sample = 200
+
+
+def _sample_bispectrum(fftarr, conjfft, k1mag, k2mag, phis):
+    '''
+    Sample the bispectrum for a block of wavevector magnitude pairs.
+
+    Parameters
+    ----------
+    fftarr : numpy.ndarray
+        Fourier transform of the image.
+    conjfft : numpy.ndarray
+        Complex conjugate of `fftarr`.
+    k1mag : numpy.ndarray
+        Magnitudes of k_1 in the block.
+    k2mag : numpy.ndarray
+        Magnitudes of k_2 in the block.
+    phis : numpy.ndarray
+        Angles of k_1 and k_2 for each pair, with a shape of
+        (number of pairs, 2, number of samples).
+
+    Returns
+    -------
+    bispec : numpy.ndarray
+        Sum of the sampled products for each pair.
+    biconorm : numpy.ndarray
+        Sum of the absolute values of the sampled products for each pair.
+    tracker : numpy.ndarray
+        Number of times each position in the flattened `fftarr` was
+        sampled.
+    '''
+
+    k1mag = k1mag[:, np.newaxis]
+    k2mag = k2mag[:, np.newaxis]
+
+    k1_cos = k1mag * np.cos(phis[:, 0])
+    k1_sin = k1mag * np.sin(phis[:, 0])
+    k2_cos = k2mag * np.cos(phis[:, 1])
+    k2_sin = k2mag * np.sin(phis[:, 1])
+
+    # Truncate towards zero, like int()
+    k1x = k1_cos.astype(int)
+    k1y = k1_sin.astype(int)
+    k2x = k2_cos.astype(int)
+    k2y = k2_sin.astype(int)
+    k3x = (k1_cos + k2_cos).astype(int)
+    k3y = (k1_sin + k2_sin).astype(int)
+
+    samps = fftarr[k1x, k1y] * fftarr[k2x, k2y] * conjfft[k3x, k3y]
+
+    inds = [np.ravel_multi_index((kx, ky), fftarr.shape, mode='wrap').ravel()
+            for kx, ky in [(k1x, k1y), (k2x, k2y), (k3x, k3y)]]
+    tracker = np.bincount(np.concatenate(inds), minlength=fftarr.size)
+
+    return samps.sum(axis=1), np.abs(samps).sum(axis=1), tracker
+
+
+def _shell_bispectrum(data, bispec_shape, engine, max_memory):
+    '''
+    Exact bispectrum and bicoherence normalization, summed over all
+    wavevector pairs in each pair of |k| shells.
+
+    With f_k the image filtered to the shell k, the sum over the pixels of
+    f_k1 f_k2 f is the sum of F(k_1) F(k_2) F*(k_1 + k_2) over the shells,
+    divided by the number of pixels squared. The shells are symmetric, so
+    the filtered images are real. The normalization uses the same sum with
+    |F| in place of F. The zeroth shell only holds k = 0, where the sums
+    are F(0) and |F(0)| times the power in the other shell. These are
+    found directly, since the sums over the pixels are all round-off when
+    the image has a zero mean.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        2D image.
+    bispec_shape : tuple
+        Shape of the bispectrum.
+    engine : `~turbustat.statistics.fft_engine.FFTEngine`
+        Engine used for the transforms.
+    max_memory : int
+        Approximate memory, in bytes, used by the shell fields at once.
+        When all of the fields do not fit, they are kept in a temporary
+        file.
+
+    Returns
+    -------
+    bispec : numpy.ndarray
+        Bispectrum.
+    biconorm : numpy.ndarray
+        Sums of the absolute values of the products.
+    '''
+
+    npix = data.size
+
+    ft = engine.rfftn(data)
+    amps = np.abs(ft)
+
+    yfreqs = np.fft.fftfreq(data.shape[0], 1. / data.shape[0])
+    xfreqs = np.fft.rfftfreq(data.shape[1], 1. / data.shape[1])
+    dist = np.sqrt(yfreqs[:, np.newaxis]**2 + xfreqs[np.newaxis]**2)
+    shells = np.floor(dist + 0.5).astype(int)
+
+    nshells = max(bispec_shape)
+
+    sums = np.empty((2, nshells, nshells))
+
+    # The rfft holds one of each pair of conjugate columns.
+    ncopies = np.full(ft.shape[1], 2.)
+    ncopies[0] = 1.
+    if data.shape[1] % 2 == 0:
+        ncopies[-1] = 1.
+    power = np.bincount(shells.ravel(), weights=(ncopies * amps**2).ravel(),
+                        minlength=nshells)[:nshells]
+
+    sums[0, 0] = sums[0, :, 0] = ft[0, 0].real * power
+    sums[1, 0] = sums[1, :, 0] = amps[0, 0] * power
+
+    full = np.array([engine.irfftn(ft, s=data.shape).ravel(),
+                     engine.irfftn(amps, s=data.shape).ravel()])
+
+    # Three blocks of fields are held at once: the first block, the first
+    # block weighted by the full images, and the second block.
+    block_size = max(1, int(max_memory // (3 * 2 * 8 * npix)))
+
+    def shell_sums(fields):
+        # The fields of each shell are transformed once.
+        for num in range(1, nshells):
+            in_shell = shells == num
+            fields[0, num - 1] = engine.irfftn(np.where(in_shell, ft, 0.),
+                                               s=data.shape).ravel()
+            fields[1, num - 1] = engine.irfftn(np.where(in_shell, amps, 0.),
+                                               s=data.shape).ravel()
+
+        for start1 in range(1, nshells, block_size):
+            block1 = slice(start1, min(start1 + block_size, nshells))
+            weighted1 = fields[:, block1.start - 1:block1.stop - 1] * \
+                full[:, np.newaxis]
+
+            # The sums are symmetric in k_1 and k_2.
+            for start2 in range(start1, nshells, block_size):
+                block2 = slice(start2, min(start2 + block_size, nshells))
+                fields2 = np.asarray(fields[:, block2.start - 1:
+                                            block2.stop - 1])
+
+                for i in range(2):
+                    block_sums = npix**2 * np.dot(weighted1[i], fields2[i].T)
+                    sums[i, block1, block2] = block_sums
+                    sums[i, block2, block1] = block_sums.T
+
+    fields_shape = (2, nshells - 1, npix)
+
+    if 8 * np.prod(fields_shape) <= max_memory:
+        shell_sums(np.empty(fields_shape))
+    else:
+        with tempfile.TemporaryFile() as fields_file:
+            fields = np.memmap(fields_file, dtype=float, mode='w+',
+                               shape=fields_shape)
+            shell_sums(fields)
+            del fields
+
+    bispec = sums[0, :bispec_shape[0], :bispec_shape[1]]
+    biconorm = sums[1, :bispec_shape[0], :bispec_shape[1]]
+
+    return bispec, biconorm
+
+
 def BiSpectrum(*args, **kwargs):
     '''
     Old name for the Bispectrum class.
@@ -517,20 +734,24 @@ class Bispectrum_Distance(object):
         Sets the number of samples to take at each vector magnitude.
     fiducial_model : Bispectrum
         Computed Bispectrum object. use to avoid recomputing.
+    method : {"sample", "shells"}, optional
+        See `~Bispectrum.compute_bispectrum`. "shells" gives the exact
+        bicoherence, so `nsamples` is not needed.
     '''
 
     __doc__ %= {"dtypes": " or ".join(common_types + twod_types)}
 
-    def __init__(self, data1, data2, nsamples=100, fiducial_model=None):
+    def __init__(self, data1, data2, nsamples=100, fiducial_model=None,
+                 method='sample'):
 
         if fiducial_model is not None:
             self.bispec1 = fiducial_model
         else:
             self.bispec1 = Bispectrum(data1)
-            self.bispec1.run(nsamples=nsamples)
+            self.bispec1.run(nsamples=nsamples, method=method)
 
         self.bispec2 = Bispectrum(data2)
-        self.bispec2.run(nsamples=nsamples)
+        self.bispec2.run(nsamples=nsamples, method=method)
 
         self.distance = None
 
@@ -2,13 +2,13 @@
 from __future__ import print_function, absolute_import, division
 
 import numpy as np
-from numpy.fft import fftshift
 import astropy.units as u
 
 
 from ..rfft_to_fft import rfft_to_fft
 from ..base_pspec2 import StatisticBase_PSpec2D
 from ..base_statistic import BaseStatisticMixIn
+from ..result_cache import cached_run
 from ...io import common_types, twod_types
 from ..fitting_utils import check_fit_limits
 
@@ -82,7 +82,8 @@ class PowerSpectrum(BaseStatisticMixIn, StatisticBase_PSpec2D):
         use_pyfftw : bool, optional
             Enable to use pyfftw, if it is installed.
         threads : int, optional
-            Number of threads to use in FFT when using pyfftw.
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
         pyfftw_kwargs : Passed to
             `~turbustat.statistics.rfft_to_fft.rfft_to_fft`. See
             `here <http://hgomersall.github.io/pyFFTW/pyfftw/builders/builders.html>`__
@@ -100,9 +101,9 @@ class PowerSpectrum(BaseStatisticMixIn, StatisticBase_PSpec2D):
         if pyfftw_kwargs.get('threads') is not None:
             pyfftw_kwargs.pop('threads')
 
-        fft = fftshift(rfft_to_fft(data, use_pyfftw=use_pyfftw,
-                                   threads=threads,
-                                   **pyfftw_kwargs))
+        # Keep the half-plane layout from the RFFT
+        fft = rfft_to_fft(data, keep_rfft=True, use_pyfftw=use_pyfftw,
+                          threads=threads, **pyfftw_kwargs)
 
         if beam_correct:
             if not hasattr(self, '_beam'):
@@ -113,15 +114,18 @@ class PowerSpectrum(BaseStatisticMixIn, StatisticBase_PSpec2D):
                                              y_size=self.data.shape[0],
                                              x_size=self.data.shape[1])
 
-            beam_fft = fftshift(rfft_to_fft(beam_kern.array))
+            beam_fft = rfft_to_fft(beam_kern.array, keep_rfft=True)
 
             self._beam_pow = np.abs(beam_fft**2)
 
-        self._ps2D = np.power(fft, 2.)
+        ps2D_half = np.power(fft, 2.)
 
         if beam_correct:
-            self._ps2D /= self._beam_pow
+            ps2D_half /= self._beam_pow
 
+        self._set_ps2D_half(ps2D_half, data.shape)
+
+    @cached_run
     def run(self, verbose=False, beam_correct=False,
             apodize_kernel=None, alpha=0.2, beta=0.0,
             use_pyfftw=False, threads=1,
@@ -152,7 +156,8 @@ class PowerSpectrum(BaseStatisticMixIn, StatisticBase_PSpec2D):
         use_pyfftw : bool, optional
             Enable to use pyfftw, if it is installed.
         threads : int, optional
-            Number of threads to use in FFT when using pyfftw.
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
         pyfft_kwargs : Passed to
             `~turbustat.statistics.rfft_to_fft.rfft_to_fft`. See
             `here <https://hgomersall.github.io/pyFFTW/pyfftw/interfaces/interfaces.html#interfaces-additional-args>`_
@@ -0,0 +1,374 @@
+# Licensed under an MIT open source license - see LICENSE
+from __future__ import print_function, absolute_import, division
+
+'''
+Opt-in on-disk cache of the results from running a statistic.
+'''
+
+import os
+import sys
+import hashlib
+import inspect
+import tempfile
+import types
+import numpy as np
+import astropy.units as u
+from astropy.io import fits
+from functools import wraps
+from threading import Lock
+from warnings import warn
+
+if sys.version_info[0] >= 3:
+    import _pickle as pickle
+else:
+    import cPickle as pickle
+
+from .. import __version__
+
+
+# Arguments to run that do not change the results.
+_ignored_run_args = ("self", "verbose", "save_name", "show_progress",
+                     "n_jobs", "max_in_flight")
+
+# Header keywords that do not change the results.
+_ignored_header_keys = ("", "HISTORY", "COMMENT", "DATE", "ORIGIN",
+                        "CHECKSUM", "DATASUM")
+
+
+class ResultCache(object):
+    """
+    On-disk cache of statistic results, keyed by a hash of the input data,
+    the header, the statistic class and all of the arguments to `run`.
+
+    Results are stored as one pickle file per key. When the total size of
+    the cache exceeds `max_size`, the least recently used results are
+    removed. The data are not stored, since they are part of the key.
+
+    Enable the cache for all statistics with `~set_result_cache`.
+
+    Parameters
+    ----------
+    path : str
+        Directory to store the results in. Created if it does not exist.
+    max_size : int, optional
+        Maximum size of the cache in bytes. Defaults to 1 GB.
+    """
+
+    def __init__(self, path, max_size=2**30):
+        super(ResultCache, self).__init__()
+
+        if max_size <= 0:
+            raise ValueError("max_size must be positive.")
+
+        self.path = path
+        self.max_size = max_size
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        self._lock = Lock()
+
+    def key(self, stat, run_args):
+        '''
+        Hash of the statistic state before running and the run arguments.
+
+        Parameters
+        ----------
+        stat : object
+            Statistic instance, before `run` is called.
+        run_args : dict
+            Arguments passed to `run`.
+
+        Returns
+        -------
+        key : str
+            Hex digest of the hash.
+        '''
+
+        hasher = hashlib.sha256()
+
+        _hash_update(hasher, __version__)
+        _hash_update(hasher, type(stat).__module__)
+        _hash_update(hasher, type(stat).__name__)
+        _hash_update(hasher, stat.__dict__)
+        _hash_update(hasher, dict((arg, value) for arg, value in
+                                  run_args.items()
+                                  if arg not in _ignored_run_args))
+
+        return hasher.hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.path, key + ".pkl")
+
+    def load(self, key):
+        '''
+        Load the saved state of a statistic.
+
+        Parameters
+        ----------
+        key : str
+            Key from `~ResultCache.key`.
+
+        Returns
+        -------
+        state : dict or None
+            The saved attributes of the statistic. None if the key is not
+            in the cache.
+        '''
+
+        filename = self._filename(key)
+
+        try:
+            with open(filename, 'rb') as input:
+                state = pickle.load(input)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+
+        return state
+
+    def store(self, key, stat):
+        '''
+        Save the state of a statistic, without the data.
+
+        Parameters
+        ----------
+        key : str
+            Key from `~ResultCache.key`.
+        stat : object
+            Statistic instance, after `run` is called.
+        '''
+
+        state = dict(stat.__dict__)
+        for attr in getattr(stat, "_data_attrs", ("_data",)):
+            state.pop(attr, None)
+
+        try:
+            output = pickle.dumps(state, -1)
+        except Exception as exc:
+            warn("Unable to cache the results of {0}: {1}"
+                 .format(type(stat).__name__, exc))
+            return
+
+        # Write to a temporary file first so an incomplete file is never
+        # read.
+        fd, tmp_name = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(output)
+
+        # Replacing the file is atomic, so concurrent writers sharing the
+        # directory do not race on removing the old entry.
+        filename = self._filename(key)
+        try:
+            os.replace(tmp_name, filename)
+        except AttributeError:
+            # Python 2. os.rename only overwrites an existing file on POSIX.
+            if os.name == 'nt' and os.path.exists(filename):
+                os.remove(filename)
+            os.rename(tmp_name, filename)
+
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(".pkl"):
+                continue
+            try:
+                stats = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            entries.append((stats.st_mtime, stats.st_size, name))
+
+        return entries
+
+    @property
+    def size(self):
+        '''
+        Total size of the cached results in bytes.
+        '''
+        return sum(entry[1] for entry in self._entries())
+
+    def evict(self):
+        '''
+        Remove the least recently used results until the cache is smaller
+        than `max_size`.
+        '''
+
+        with self._lock:
+            entries = sorted(self._entries())
+
+            total = sum(entry[1] for entry in entries)
+
+            for mtime, size, name in entries:
+                if total <= self.max_size:
+                    break
+
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    continue
+
+                total -= size
+
+    def clear(self):
+        '''
+        Remove all cached results.
+        '''
+
+        with self._lock:
+            for mtime, size, name in self._entries():
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+
+_result_cache = None
+
+
+def set_result_cache(path, max_size=2**30):
+    '''
+    Enable caching of the results from all statistics.
+
+    Parameters
+    ----------
+    path : str, `~ResultCache` or None
+        Directory to store the results in, or a `~ResultCache`. None disables
+        the cache.
+    max_size : int, optional
+        Maximum size of the cache in bytes, when `path` is a directory.
+
+    Returns
+    -------
+    cache : `~ResultCache` or None
+        The enabled cache.
+    '''
+
+    global _result_cache
+
+    if path is None or isinstance(path, ResultCache):
+        _result_cache = path
+    else:
+        _result_cache = ResultCache(path, max_size=max_size)
+
+    return _result_cache
+
+
+def get_result_cache():
+    '''
+    Return the enabled `~ResultCache`, or None if caching is disabled.
+    '''
+    return _result_cache
+
+
+def cached_run(run):
+    '''
+    Decorator for `run` methods. When a cache is enabled with
+    `~set_result_cache`, the results are loaded from the cache if the
+    statistic was previously run on the same data with the same arguments.
+    The cache is skipped when `verbose` is enabled, so the plots are made.
+    '''
+
+    @wraps(run)
+    def cached(self, *args, **kwargs):
+
+        cache = _result_cache
+
+        if cache is None:
+            return run(self, *args, **kwargs)
+
+        run_args = inspect.getcallargs(run, self, *args, **kwargs)
+
+        if run_args.get("verbose", False):
+            return run(self, *args, **kwargs)
+
+        key = cache.key(self, run_args)
+
+        state = cache.load(key)
+        if state is not None:
+            self.__dict__.update(state)
+            return self
+
+        output = run(self, *args, **kwargs)
+
+        cache.store(key, self)
+
+        return output
+
+    return cached
+
+
+def _hash_update(hasher, obj):
+    '''
+    Update the hash with a canonical representation of an object.
+    '''
+
+    if isinstance(obj, u.Quantity):
+        hasher.update(b"Quantity")
+        _hash_update(hasher, obj.unit.to_string())
+        _hash_update(hasher, obj.value)
+
+    elif isinstance(obj, np.ndarray):
+        hasher.update(b"ndarray")
+        hasher.update(str(obj.dtype).encode())
+        hasher.update(str(obj.shape).encode())
+        if obj.dtype.hasobject:
+            for value in obj.ravel():
+                _hash_update(hasher, value)
+        else:
+            hasher.update(np.ascontiguousarray(obj).view(np.uint8))
+
+    elif isinstance(obj, fits.Header):
+        hasher.update(b"Header")
+        for card in obj.cards:
+            if card.keyword in _ignored_header_keys:
+                continue
+            _hash_update(hasher, card.keyword)
+            _hash_update(hasher, card.value)
+
+    elif isinstance(obj, dict):
+        hasher.update(b"dict")
+        for name in sorted(obj, key=str):
+            _hash_update(hasher, name)
+            _hash_update(hasher, obj[name])
+
+    elif isinstance(obj, (list, tuple)):
+        hasher.update(type(obj).__name__.encode())
+        for value in obj:
+            _hash_update(hasher, value)
+
+    elif isinstance(obj, u.UnitBase):
+        hasher.update(b"Unit")
+        _hash_update(hasher, obj.to_string())
+
+    elif isinstance(obj, (types.FunctionType, type)):
+        hasher.update(b"Named")
+        _hash_update(hasher, obj.__module__)
+        _hash_update(hasher, obj.__name__)
+
+    elif obj is None or isinstance(obj, (bool, int, float, complex,
+                                         np.generic)):
+        hasher.update(repr(obj).encode())
+
+    elif isinstance(obj, bytes):
+        hasher.update(obj)
+
+    elif isinstance(obj, str) or type(obj).__name__ == 'unicode':
+        hasher.update(obj.encode('utf-8'))
+
+    elif hasattr(obj, "__dict__"):
+        hasher.update(b"Object")
+        _hash_update(hasher, type(obj))
+        _hash_update(hasher, obj.__dict__)
+
+    else:
+        # Falls back to the repr. If this contains the memory address, the
+        # result is never found in the cache, rather than giving a wrong
+        # result.
+        hasher.update(repr(obj).encode())
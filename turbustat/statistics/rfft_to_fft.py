@@ -2,13 +2,8 @@
 from __future__ import print_function, absolute_import, division
 
 import numpy as np
-from warnings import warn
 
-try:
-    from pyfftw.interfaces.numpy_fft import rfftn
-    PYFFTW_FLAG = True
-except ImportError:
-    PYFFTW_FLAG = False
+from .fft_engine import get_fft_engine
 
 
 '''
@@ -35,8 +30,9 @@ def rfft_to_fft(image, keep_rfft=False, use_pyfftw=False,
     use_pyfftw : bool, optional
         Try using pyfftw for the FFT.
     threads : int, optional
-        Number of threads to use when using pyfftw. Default is 1.
-    pyfftw_kwargs : Passed to `~pyfftw.interfaces.numpy_fft.rfftn`.
+        Number of threads to use in the FFT. Default is 1.
+    pyfftw_kwargs : Passed to
+        `~turbustat.statistics.fft_engine.get_fft_engine`.
 
     Outputs
     -------
@@ -50,36 +46,65 @@ def rfft_to_fft(image, keep_rfft=False, use_pyfftw=False,
 
     last_dim = image.shape[-1]
 
-    if use_pyfftw:
-        if PYFFTW_FLAG:
-            fft_abs = np.abs(rfftn(image, **pyfftw_kwargs))
-        else:
-            use_pyfftw = False
-            warn("pyfftw is not installed")
+    engine = get_fft_engine(use_pyfftw=use_pyfftw, threads=threads,
+                            **pyfftw_kwargs)
 
-    if not use_pyfftw:
-        fft_abs = np.abs(np.fft.rfftn(image))
+    fft_abs = np.abs(engine.rfftn(image))
 
     if keep_rfft:
         return fft_abs
 
+    return expand_rfft(fft_abs, last_dim)
+
+
+def expand_rfft(rfft_arr, last_dim):
+    '''
+    Expand the half-plane output of a real FFT (e.g., from `rfft_to_fft`
+    with `keep_rfft=True`) to the full set of frequencies. Only valid for
+    real-valued arrays derived from the transform, like the absolute value
+    or the power, which are symmetric about the origin.
+
+    Inputs
+    ------
+    rfft_arr : numpy.ndarray
+        2 or 3D array in the RFFT layout, where the last axis has
+        `last_dim // 2 + 1` elements.
+    last_dim : int
+        Size of the last dimension of the original array.
+
+    Outputs
+    -------
+    full_arr : numpy.ndarray
+        Array with the shape of the original array.
+    '''
+
+    ndim = len(rfft_arr.shape)
+
+    if ndim < 2 or ndim > 3:
+        raise TypeError("Dimension of array must be 2D or 3D.")
+
+    if rfft_arr.shape[-1] != last_dim // 2 + 1:
+        raise ValueError("The last dimension of the array ({0}) does not "
+                         "match the RFFT of an array with a last dimension "
+                         "of {1}.".format(rfft_arr.shape[-1], last_dim))
+
     if ndim == 2:
         if last_dim % 2 == 0:
-            fftstar_abs = fft_abs.copy()[:, -2:0:-1]
+            fftstar_abs = rfft_arr.copy()[:, -2:0:-1]
         else:
-            fftstar_abs = fft_abs.copy()[:, -1:0:-1]
+            fftstar_abs = rfft_arr.copy()[:, -1:0:-1]
 
         fftstar_abs[1::, :] = fftstar_abs[:0:-1, :]
 
-        return np.concatenate((fft_abs, fftstar_abs), axis=1)
+        return np.concatenate((rfft_arr, fftstar_abs), axis=1)
 
     elif ndim == 3:
         if last_dim % 2 == 0:
-            fftstar_abs = fft_abs.copy()[:, :, -2:0:-1]
+            fftstar_abs = rfft_arr.copy()[:, :, -2:0:-1]
         else:
-            fftstar_abs = fft_abs.copy()[:, :, -1:0:-1]
+            fftstar_abs = rfft_arr.copy()[:, :, -1:0:-1]
 
         fftstar_abs[1::, :, :] = fftstar_abs[:0:-1, :, :]
         fftstar_abs[:, 1::, :] = fftstar_abs[:, :0:-1, :]
 
-        return np.concatenate((fft_abs, fftstar_abs), axis=2)
+        return np.concatenate((rfft_arr, fftstar_abs), axis=2)
@@ -1,6 +1,10 @@
 # Licensed under an MIT open source license - see LICENSE
 from __future__ import print_function, absolute_import, division
 
+import os
+import sys
+import hashlib
+import tempfile
 import numpy as np
 from astropy import units as u
 from astropy.wcs import WCS
@@ -9,11 +13,19 @@ import statsmodels.api as sm
 from warnings import warn
 from astropy.utils.console import ProgressBar
 from itertools import product
+from threading import Lock
+
+if sys.version_info[0] >= 3:
+    import _pickle as pickle
+else:
+    import cPickle as pickle
 
 from ..psds import pspec, make_radial_arrays
 from ..base_statistic import BaseStatisticMixIn
+from ..result_cache import cached_run
 from ...io import common_types, threed_types, input_data
-from ..stats_utils import common_scale, fourier_shift, pixel_shift
+from ..stats_utils import common_scale, ordered_map
+from ..fft_engine import get_fft_engine
 from ..fitting_utils import clip_func
 from ..elliptical_powerlaw import (fit_elliptical_powerlaw,
                                    inverse_interval_transform,
@@ -94,6 +106,9 @@ class SCF(BaseStatisticMixIn):
         self._scf_surface = None
         self._scf_spectrum_stddev = None
 
+        # SCF values of each lag computed so far.
+        self._lag_cache = {}
+
         self._fit2D_flag = False
 
     @property
@@ -127,7 +142,9 @@ class SCF(BaseStatisticMixIn):
         '''
         return self._lags
 
-    def compute_surface(self, boundary='continuous', show_progress=True):
+    def compute_surface(self, boundary='continuous', show_progress=True,
+                        n_jobs=1, method='direct', checkpoint=None,
+                        checkpoint_every=None):
         '''
         Computes the SCF up to the given lag value. This is an
         expensive operation and could take a long time to calculate.
@@ -138,12 +155,52 @@ class SCF(BaseStatisticMixIn):
             Treat the boundary as continuous (wrap-around) or cut values
             beyond the edge (i.e., for most observational data).
         show_progress : bool, optional
-            Show a progress bar when computing the surface. =
+            Show a progress bar when computing the surface.
+        n_jobs : int, optional
+            Number of threads used to compute the lags in parallel. The
+            threads share the cube, and each lag is always placed at the
+            same position in the surface, so the result does not depend on
+            `n_jobs`.
+        method : {"direct", "fft"}, optional
+            "direct" computes the SCF at each lag with the normalization
+            from each pixel (Rosolowsky et al, 1999). "fft" normalizes by
+            the sums over all pixels, which allows all lags to be computed
+            at once from the spectrally-summed spatial autocorrelation. At
+            lag :math:`l`, "fft" gives
+            :math:`1 - \sqrt{\sum_p D_p(l) / \sum_p (N_p + N_{p-l})}`,
+            where :math:`D_p(l)` is the summed squared difference between
+            the spectra at pixels :math:`p` and :math:`p - l`, and
+            :math:`N_p` is the summed square of the spectrum at :math:`p`.
+            "direct" instead averages :math:`D_p(l) / (N_p + N_{p-l})` over
+            the pixels. The two are equal when :math:`N_p` is the same in
+            all pixels; otherwise "fft" weights pixels by their
+            intensity. Only integer pixel lags are supported, and with
+            `boundary='cut'`, pixels are only compared to pixels
+            within the map.
+        checkpoint : str, optional
+            File to save the SCF values of the computed lags to while the
+            surface is computed (direct method only). If the file already
+            exists, the lags saved in it are not recomputed, so an
+            interrupted calculation resumes from the last save. Values
+            saved from different data are ignored.
+        checkpoint_every : int, optional
+            Number of lags to compute between saves of the checkpoint.
+            Defaults to the number of lags along one axis.
         '''
 
         if boundary not in ["continuous", "cut"]:
             raise ValueError("boundary must be 'continuous' or 'cut'.")
 
+        if method not in ["direct", "fft"]:
+            raise ValueError("method must be 'direct' or 'fft'.")
+
+        if method == "fft":
+            pix_lags = self._to_pixel(self.roll_lags).value
+            self._scf_surface = \
+                _scf_fft_surface(self.data, pix_lags, boundary=boundary,
+                                 n_jobs=n_jobs)
+            return
+
         self._scf_surface = np.zeros((self.size, self.size))
 
         # Convert the lags into pixel units.
@@ -152,74 +209,118 @@ class SCF(BaseStatisticMixIn):
         dx = pix_lags.copy()
         dy = pix_lags.copy()
 
-        if show_progress:
-            bar = ProgressBar(len(dx) * len(dy))
+        # Values of previously computed lags are kept, so only new lags are
+        # computed. Older saved results may not have the cache.
+        if getattr(self, "_lag_cache", None) is None:
+            self._lag_cache = {}
+        lag_cache = self._lag_cache
+
+        if checkpoint is not None:
+            data_key = _checkpoint_key(self.data)
+            lag_cache.update(_load_lag_checkpoint(checkpoint, data_key))
+
+            if checkpoint_every is None:
+                checkpoint_every = len(dy)
+            if checkpoint_every < 1:
+                raise ValueError("checkpoint_every must be at least 1.")
+
+        def cache_key(x_shift, y_shift):
+            return (boundary, round(float(x_shift), 8),
+                    round(float(y_shift), 8))
+
+        missing = [(x_shift, y_shift) for x_shift, y_shift in
+                   product(dx, dy)
+                   if cache_key(x_shift, y_shift) not in lag_cache]
+
+        if len(missing) > 0:
+            # The spectral norms of each pixel are only computed once.
+            # Integer lags then only need the dot product between the
+            # overlapping parts of the cube.
+            kernel = _SCFKernel(self.data)
+
+            if show_progress:
+                bar = ProgressBar(len(missing))
+
+            def lag_value(shifts):
+                return kernel(shifts[0], shifts[1], boundary)
+
+            values = ordered_map(lag_value, missing, n_jobs=n_jobs)
+
+            for n, scf_value in enumerate(values):
+
+                if scf_value > 1:
+                    raise ValueError("Cannot have a correlation above 1. "
+                                     "Check your input data. Contact the "
+                                     "TurbuStat authors if the problem "
+                                     "persists.")
+
+                lag_cache[cache_key(*missing[n])] = scf_value
+
+                if checkpoint is not None and \
+                        (n + 1) % checkpoint_every == 0:
+                    _save_lag_checkpoint(checkpoint, data_key, lag_cache)
+
+                if show_progress:
+                    bar.update(n + 1)
+
+            if checkpoint is not None:
+                _save_lag_checkpoint(checkpoint, data_key, lag_cache)
 
         for n, (x_shift, y_shift) in enumerate(product(dx, dy)):
 
             i, j = np.unravel_index(n, (len(dx), len(dy)))
 
-            if x_shift == 0 and y_shift == 0:
-                self._scf_surface[j, i] = 1.
-
-            if x_shift == 0:
-                tmp = self.data
-            else:
-                if float(x_shift).is_integer():
-                    shift_func = pixel_shift
-                else:
-                    shift_func = fourier_shift
-                tmp = shift_func(self.data, x_shift, axis=1)
+            self._scf_surface[j, i] = lag_cache[cache_key(x_shift, y_shift)]
 
-            if y_shift != 0:
-                if float(y_shift).is_integer():
-                    shift_func = pixel_shift
-                else:
-                    shift_func = fourier_shift
-                tmp = shift_func(tmp, y_shift, axis=2)
-
-            if boundary is "cut":
-                # Always round up to the nearest integer.
-                x_shift = np.ceil(x_shift).astype(int)
-                y_shift = np.ceil(y_shift).astype(int)
-                if x_shift < 0:
-                    x_slice_data = slice(None, tmp.shape[1] + x_shift)
-                    x_slice_tmp = slice(-x_shift, None)
-                else:
-                    x_slice_data = slice(x_shift, None)
-                    x_slice_tmp = slice(None, tmp.shape[1] - x_shift)
+    def extend_lags(self, new_lags, boundary='continuous',
+                    show_progress=True, n_jobs=1, checkpoint=None,
+                    checkpoint_every=None):
+        '''
+        Add lags to the SCF surface. Only the SCF at lags that have not
+        already been computed is calculated. `~SCF.compute_spectrum` and
+        the fits need to be re-run afterwards.
 
-                if y_shift < 0:
-                    y_slice_data = slice(None, tmp.shape[2] + y_shift)
-                    y_slice_tmp = slice(-y_shift, None)
-                else:
-                    y_slice_data = slice(y_shift, None)
-                    y_slice_tmp = slice(None, tmp.shape[2] - y_shift)
+        Parameters
+        ----------
+        new_lags : `~astropy.units.Quantity` or `~numpy.ndarray`
+            Lags to add. Arrays without units are assumed to be in pixels.
+            The lags are combined with the current `roll_lags`.
+        boundary : {"continuous", "cut"}
+            See `~SCF.compute_surface`.
+        show_progress : bool, optional
+            Show a progress bar when computing the surface.
+        n_jobs : int, optional
+            See `~SCF.compute_surface`.
+        checkpoint : str, optional
+            See `~SCF.compute_surface`.
+        checkpoint_every : int, optional
+            See `~SCF.compute_surface`.
+        '''
 
-                data_slice = (slice(None), x_slice_data, y_slice_data)
-                tmp_slice = (slice(None), x_slice_tmp, y_slice_tmp)
-            elif boundary is "continuous":
-                data_slice = (slice(None),) * 3
-                tmp_slice = (slice(None),) * 3
+        if isinstance(new_lags, u.Quantity):
+            pass
+        elif isinstance(new_lags, np.ndarray):
+            new_lags = new_lags * u.pix
+        else:
+            raise TypeError("new_lags must be an astropy.units.Quantity"
+                            " array or a numpy.ndarray.")
 
-            values = \
-                np.nansum(((self.data[data_slice] - tmp[tmp_slice]) ** 2),
-                          axis=0) / \
-                (np.nansum(self.data[data_slice] ** 2, axis=0) +
-                 np.nansum(tmp[tmp_slice] ** 2, axis=0))
+        pix_lags = np.append(self._to_pixel(self.roll_lags).value,
+                             self._to_pixel(new_lags).value)
 
-            scf_value = 1. - \
-                np.sqrt(np.nansum(values) / np.sum(np.isfinite(values)))
+        # Remove repeated lags from the unit conversions
+        pix_lags = np.unique(np.round(pix_lags, 8))
 
-            if scf_value > 1:
-                raise ValueError("Cannot have a correlation above 1. Check "
-                                 "your input data. Contact the TurbuStat "
-                                 "authors if the problem persists.")
+        if pix_lags.size % 2 == 0:
+            warn("The number of lags is even. The SCF surface will not be "
+                 "centered on the zero lag.")
 
-            self._scf_surface[j, i] = scf_value
+        self.roll_lags = pix_lags * u.pix
+        self.size = self.roll_lags.size
 
-            if show_progress:
-                bar.update(n + 1)
+        self.compute_surface(boundary=boundary, show_progress=show_progress,
+                             n_jobs=n_jobs, checkpoint=checkpoint,
+                             checkpoint_every=checkpoint_every)
 
     def compute_spectrum(self, return_stddev=True,
                          **kwargs):
@@ -233,7 +334,9 @@ class SCF(BaseStatisticMixIn):
         ----------
         return_stddev : bool, optional
             Return the standard deviation in the 1D bins. Default is True.
-        kwargs : passed to `turbustat.statistics.psds.pspec`
+        kwargs : passed to `turbustat.statistics.psds.pspec`. Setting
+            `boot_iter` (and optionally `boot_seed`) uses bootstrapped
+            standard deviations in the bins.
         '''
 
         # If scf_surface hasn't been computed, do it
@@ -672,10 +775,12 @@ class SCF(BaseStatisticMixIn):
         else:
             plt.show()
 
+    @cached_run
     def run(self, return_stddev=True, boundary='continuous',
             show_progress=True, xlow=None, xhigh=None,
             fit_2D=True, fit_2D_kwargs={}, radialavg_kwargs={},
-            verbose=False, xunit=u.pix, save_name=None):
+            n_jobs=1, method='direct', verbose=False, xunit=u.pix,
+            save_name=None):
         '''
         Computes all SCF outputs.
 
@@ -699,6 +804,13 @@ class SCF(BaseStatisticMixIn):
             `xlow` and `xhigh` keywords to provide fit limits.
         radialavg_kwargs : dict, optional
             Passed to `~SCF.compute_spectrum`.
+        n_jobs : int, optional
+            Number of threads used to compute the lags. See
+            `~SCF.compute_surface`.
+        method : {"direct", "fft"}, optional
+            Compute the SCF with the normalization from each pixel, or
+            normalized by the sums over the whole map. See
+            `~SCF.compute_surface`.
         verbose : bool, optional
             Enables plotting.
         xunit : `~astropy.units.Unit`, optional
@@ -707,7 +819,8 @@ class SCF(BaseStatisticMixIn):
             Save the figure when a file name is given.
         '''
 
-        self.compute_surface(boundary=boundary, show_progress=show_progress)
+        self.compute_surface(boundary=boundary, show_progress=show_progress,
+                             n_jobs=n_jobs, method=method)
         self.compute_spectrum(return_stddev=return_stddev,
                               **radialavg_kwargs)
         self.fit_plaw(verbose=verbose, xlow=xlow, xhigh=xhigh)
@@ -760,6 +873,9 @@ class SCF_Distance(object):
         dataset1 = input_data(cube1, no_header=False)
         dataset2 = input_data(cube2, no_header=False)
 
+        if isinstance(size, u.Quantity):
+            size = int(size.to(u.pix).value)
+
         # Create a default set of lags, in pixels
         if size % 2 == 0:
             Warning("Size must be odd. Reducing size to next lowest odd"
@@ -906,3 +1022,458 @@ class SCF_Distance(object):
             else:
                 p.show()
         return self
+
+
+class _SCFKernel(object):
+    '''
+    Computes the SCF for one spatial lag of a cube.
+
+    The numerator of the SCF, sum((a - b)**2), is expanded into
+    |a|**2 + |b|**2 - 2 a.b, where the norms of each spectrum are computed
+    once. For integer lags, the shifted spectra are views of the overlapping
+    regions of the cube, so no shifted copy of the cube is made.
+
+    For non-integer lags, the spatial FFT of the cube is computed once and
+    each shifted cube is produced by multiplying with a phase ramp. The
+    shifted cube is formed in blocks of channels, which are reduced into the
+    spectral sums before the next block.
+
+    Parameters
+    ----------
+    data : `~numpy.ndarray`
+        Cube with the spectral axis first.
+    block_size : int, optional
+        Number of channels to shift at once for non-integer lags. Defaults
+        to blocks of roughly 64 MB.
+    '''
+
+    def __init__(self, data, block_size=None):
+
+        finite = np.isfinite(data)
+        if finite.all():
+            self._cube = data.astype(np.float64, copy=False)
+            self._mask = None
+        else:
+            self._cube = np.where(finite, data, 0.).astype(np.float64)
+            self._mask = finite.astype(np.float64)
+
+        self._norms = _spectral_dot(self._cube, self._cube)
+
+        if block_size is None:
+            # Size of one transformed channel in bytes
+            chan_size = 16 * data.shape[1] * (data.shape[2] // 2 + 1)
+            block_size = max(1, 2**26 // chan_size)
+        self.block_size = int(block_size)
+
+        self._engine = get_fft_engine()
+        self._fft_cube = None
+        self._fft_invalid = None
+        self._ramps = {}
+        self._lock = Lock()
+
+    def __call__(self, x_shift, y_shift, boundary='continuous'):
+        '''
+        SCF value at the given lag in pixels along the two spatial axes.
+        '''
+        if float(x_shift).is_integer() and float(y_shift).is_integer():
+            return self._integer_lag(int(x_shift), int(y_shift), boundary)
+        return self._fractional_lag(x_shift, y_shift, boundary)
+
+    def _integer_lag(self, x_shift, y_shift, boundary):
+
+        numer = 0.
+        count = 0
+
+        for x_data, x_lag in _lag_segments(self._cube.shape[1], x_shift,
+                                           boundary):
+            for y_data, y_lag in _lag_segments(self._cube.shape[2], y_shift,
+                                               boundary):
+
+                data_slice = (slice(None), x_data, y_data)
+                lag_slice = (slice(None), x_lag, y_lag)
+
+                cube = self._cube[data_slice]
+                lag_cube = self._cube[lag_slice]
+
+                norms = self._norms[data_slice[1:]]
+                lag_norms = self._norms[lag_slice[1:]]
+
+                dot = _spectral_dot(cube, lag_cube)
+
+                if self._mask is None:
+                    diff = norms + lag_norms - 2 * dot
+                else:
+                    # Only channels that are finite in both spectra
+                    # contribute to the numerator.
+                    mask = self._mask[data_slice]
+                    lag_mask = self._mask[lag_slice]
+                    diff = _spectral_dot(cube, cube, lag_mask) + \
+                        _spectral_dot(lag_cube, lag_cube, mask) - 2 * dot
+
+                block_numer, block_count = \
+                    _normalized_sum(diff, norms + lag_norms)
+                numer += block_numer
+                count += block_count
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return 1. - np.sqrt(numer / count)
+
+    def _spatial_fft(self):
+        '''
+        Spatial FFTs of the cube and of the mask of NaNs, computed on the
+        first call.
+        '''
+
+        with self._lock:
+            if self._fft_cube is None:
+                self._fft_cube = self._engine.rfftn(self._cube, axes=(1, 2))
+                if self._mask is not None:
+                    self._fft_invalid = \
+                        self._engine.rfftn(1. - self._mask, axes=(1, 2))
+
+        return self._fft_cube, self._fft_invalid
+
+    def _phase_ramp(self, x_shift, y_shift):
+        '''
+        Phase ramp that shifts the spatial FFT by the given lag.
+        '''
+
+        key = (float(x_shift), float(y_shift))
+
+        ramp = self._ramps.get(key)
+
+        if ramp is None:
+            x_freqs = np.fft.fftfreq(self._cube.shape[1])
+            y_freqs = np.fft.rfftfreq(self._cube.shape[2])
+
+            ramp = np.exp(-2j * np.pi * x_shift * x_freqs)[:, np.newaxis] * \
+                np.exp(-2j * np.pi * y_shift * y_freqs)[np.newaxis, :]
+
+            self._ramps[key] = ramp
+
+        return ramp
+
+    def _fractional_lag(self, x_shift, y_shift, boundary):
+
+        fft_cube, fft_invalid = self._spatial_fft()
+        ramp = self._phase_ramp(x_shift, y_shift)
+
+        nchan, nx, ny = self._cube.shape
+
+        if boundary == "cut":
+            # Always round up to the nearest integer.
+            x_cut = int(np.ceil(x_shift))
+            y_cut = int(np.ceil(y_shift))
+            if x_cut < 0:
+                x_slice_data = slice(None, nx + x_cut)
+                x_slice_lag = slice(-x_cut, None)
+            else:
+                x_slice_data = slice(x_cut, None)
+                x_slice_lag = slice(None, nx - x_cut)
+
+            if y_cut < 0:
+                y_slice_data = slice(None, ny + y_cut)
+                y_slice_lag = slice(-y_cut, None)
+            else:
+                y_slice_data = slice(y_cut, None)
+                y_slice_lag = slice(None, ny - y_cut)
+
+            data_slice = (x_slice_data, y_slice_data)
+            lag_slice = (x_slice_lag, y_slice_lag)
+        else:
+            data_slice = (slice(None),) * 2
+            lag_slice = (slice(None),) * 2
+
+        norms = self._norms[data_slice]
+
+        shape = norms.shape
+        dot = np.zeros(shape)
+        lag_norms = np.zeros(shape)
+        if self._mask is not None:
+            masked_norms = np.zeros(shape)
+
+        for start in range(0, nchan, self.block_size):
+            chans = slice(start, start + self.block_size)
+
+            lag_cube = self._engine.irfftn(fft_cube[chans] * ramp,
+                                           s=(nx, ny), axes=(1, 2))
+
+            if fft_invalid is not None:
+                # Channels that the shift moves mostly from NaNs are blanked
+                lag_mask = self._engine.irfftn(fft_invalid[chans] * ramp,
+                                               s=(nx, ny), axes=(1, 2))
+                lag_mask = (lag_mask <= 0.5).astype(np.float64)
+                lag_cube *= lag_mask
+                lag_mask = lag_mask[(slice(None),) + lag_slice]
+
+            lag_cube = lag_cube[(slice(None),) + lag_slice]
+            cube = self._cube[(chans,) + data_slice]
+
+            dot += _spectral_dot(cube, lag_cube)
+
+            if self._mask is None:
+                lag_norms += _spectral_dot(lag_cube, lag_cube)
+            else:
+                mask = self._mask[(chans,) + data_slice]
+                lag_norms += _spectral_dot(lag_cube, lag_cube)
+                masked_norms += _spectral_dot(cube, cube, lag_mask) + \
+                    _spectral_dot(lag_cube, lag_cube, mask)
+
+        if self._mask is None:
+            diff = norms + lag_norms - 2 * dot
+        else:
+            diff = masked_norms - 2 * dot
+
+        numer, count = _normalized_sum(diff, norms + lag_norms)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return 1. - np.sqrt(numer / count)
+
+
+def _checkpoint_key(data):
+    '''
+    Hash of the data, used to check that a checkpoint matches the data.
+    '''
+    hasher = hashlib.sha256()
+    hasher.update(str(data.shape).encode())
+    hasher.update(np.ascontiguousarray(data, dtype=np.float64).view(np.uint8))
+    return hasher.hexdigest()
+
+
+def _load_lag_checkpoint(filename, data_key):
+    '''
+    Load the SCF values saved with `_save_lag_checkpoint`. Returns an empty
+    dictionary when the file does not exist or was saved from other data.
+    '''
+
+    if not os.path.exists(filename):
+        return {}
+
+    try:
+        with open(filename, 'rb') as input:
+            saved = pickle.load(input)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError):
+        warn("Unable to read the SCF checkpoint {}. Computing all lags."
+             .format(filename))
+        return {}
+
+    if saved.get("data_key") != data_key:
+        warn("The SCF checkpoint {} was computed from different data. "
+             "Computing all lags.".format(filename))
+        return {}
+
+    return saved["lags"]
+
+
+def _save_lag_checkpoint(filename, data_key, lag_cache):
+    '''
+    Save the SCF values of the computed lags.
+    '''
+
+    output = pickle.dumps({"data_key": data_key, "lags": lag_cache}, -1)
+
+    # Write to a temporary file first so an interrupted save does not
+    # remove the previous checkpoint.
+    path = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_name = tempfile.mkstemp(dir=path, suffix=".tmp")
+    with os.fdopen(fd, 'wb') as tmp_file:
+        tmp_file.write(output)
+
+    # Replacing the file is atomic, so a checkpoint always exists.
+    try:
+        os.replace(tmp_name, filename)
+    except AttributeError:
+        # Python 2. os.rename only overwrites an existing file on POSIX.
+        if os.name == 'nt' and os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tmp_name, filename)
+
+
+def _scf_fft_surface(data, lags, boundary='continuous', block_size=None,
+                     n_jobs=1):
+    '''
+    SCF surface normalized by the sums over all pixels, computed from
+    spatial correlations of the whole cube. See `~SCF.compute_surface`.
+
+    Parameters
+    ----------
+    data : `~numpy.ndarray`
+        Cube with the spectral axis first.
+    lags : `~numpy.ndarray`
+        Integer lags in pixels, used along both spatial axes.
+    boundary : {"continuous", "cut"}, optional
+        Wrap around the edges, or only compare pixels within the map.
+    block_size : int, optional
+        Number of channels to transform at once. Defaults to blocks of
+        roughly 64 MB.
+    n_jobs : int, optional
+        Number of threads used to transform blocks in parallel.
+
+    Returns
+    -------
+    surface : `~numpy.ndarray`
+        SCF surface, indexed as `surface[y_lag, x_lag]`, where the x lag is
+        along the first spatial axis.
+    '''
+
+    lags = np.asarray(lags)
+
+    if not np.all(lags == np.round(lags)):
+        raise ValueError("method='fft' requires integer pixel lags.")
+    lags = lags.astype(int)
+
+    nchan, nx, ny = data.shape
+
+    if np.abs(lags).max() >= min(nx, ny):
+        raise ValueError("The lags must be smaller than the spatial size of "
+                         "the cube.")
+
+    if boundary == "cut":
+        # Pad so that the correlations do not wrap around the edge
+        shape = (2 * nx, 2 * ny)
+    else:
+        shape = (nx, ny)
+
+    if block_size is None:
+        # Size of one transformed channel in bytes
+        chan_size = 16 * shape[0] * (shape[1] // 2 + 1)
+        block_size = max(1, 2**26 // chan_size)
+    block_size = int(block_size)
+
+    engine = get_fft_engine()
+
+    def transform(arr):
+        return engine.rfftn(arr, s=shape, axes=(-2, -1))
+
+    def correlate(ft_one, ft_two):
+        # sum_p one(p) * two(p - l), for every lag l
+        return engine.irfftn(ft_one * ft_two.conj(), s=shape, axes=(-2, -1))
+
+    has_nans = not np.isfinite(data).all()
+
+    def block_sums(start):
+        block = np.array(data[start:start + block_size], dtype=np.float64)
+        mask = np.isfinite(block)
+        block[~mask] = 0.
+
+        ft_block = transform(block)
+        autocorr = (ft_block * ft_block.conj()).real.sum(0)
+
+        if not has_nans:
+            return autocorr, None, (block**2).sum(0)
+
+        # Channels with a NaN in either spectrum are excluded from the
+        # squared difference, as in the direct method.
+        ft_masked = (transform(block**2) *
+                     transform(mask.astype(np.float64)).conj()).sum(0)
+
+        return autocorr, ft_masked, (block**2).sum(0)
+
+    ft_autocorr = 0.
+    ft_masked = 0.
+    norms = 0.
+
+    for block_autocorr, block_masked, block_norms in \
+            ordered_map(block_sums, range(0, nchan, block_size),
+                        n_jobs=n_jobs):
+        ft_autocorr = ft_autocorr + block_autocorr
+        if block_masked is not None:
+            ft_masked = ft_masked + block_masked
+        norms = norms + block_norms
+
+    autocorr = engine.irfftn(ft_autocorr, s=shape, axes=(-2, -1))
+
+    # sum_p N_p W(p - l), where W is 1 for pixels within the map
+    window = np.zeros(shape)
+    window[:nx, :ny] = 1.
+    norm_corr = correlate(transform(norms), transform(window))
+
+    if has_nans:
+        masked_norms = engine.irfftn(ft_masked, s=shape, axes=(-2, -1))
+    else:
+        masked_norms = norm_corr
+
+    x_lags = lags % shape[0]
+    y_lags = lags % shape[1]
+    x_neg = -lags % shape[0]
+    y_neg = -lags % shape[1]
+
+    # Terms at lag -l give sum_p N_{p - l} W(p).
+    grid = np.ix_(x_lags, y_lags)
+    neg_grid = np.ix_(x_neg, y_neg)
+
+    diff = masked_norms[grid] + masked_norms[neg_grid] - 2 * autocorr[grid]
+    denom = norm_corr[grid] + norm_corr[neg_grid]
+
+    # Remove round-off below zero.
+    np.clip(diff, 0, None, out=diff)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        surface = 1. - np.sqrt(diff / denom)
+
+    return surface.T
+
+
+def _normalized_sum(diff, denom):
+    '''
+    Sum and number of the finite values of diff / denom.
+    '''
+
+    # Remove round-off below zero.
+    np.clip(diff, 0, None, out=diff)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        values = diff / denom
+
+    finite = np.isfinite(values)
+
+    return values[finite].sum(), finite.sum()
+
+
+def _spectral_dot(*arrs):
+    '''
+    Product of the arrays summed over the spectral (first) axis.
+    '''
+    subscripts = ",".join(["kij"] * len(arrs)) + "->ij"
+    return np.einsum(subscripts, *arrs)
+
+
+def _lag_segments(size, shift, boundary):
+    '''
+    Overlapping regions along one axis for an integer lag.
+
+    Pixel `d` is compared to pixel `(d - shift) % size` for a continuous
+    boundary, matching `~numpy.roll`. For a cut boundary, only pixels with
+    `max(shift, 0) <= d < size + min(shift, 0)` are used and compared to
+    `(d - 2 * shift) % size`, matching the previous shifting and slicing
+    of the cube.
+
+    Returns
+    -------
+    segments : list
+        Pairs of slices for the data and the lagged pixels. The lagged
+        pixels wrap around the edge in at most one place, so there are at
+        most two segments.
+    '''
+
+    if boundary == "cut":
+        start = max(shift, 0)
+        stop = size + min(shift, 0)
+        offset = 2 * shift
+    else:
+        start = 0
+        stop = size
+        offset = shift
+
+    length = stop - start
+    if length <= 0:
+        return []
+
+    lag_start = (start - offset) % size
+
+    if lag_start + length <= size:
+        return [(slice(start, stop), slice(lag_start, lag_start + length))]
+
+    split = size - lag_start
+    return [(slice(start, start + split), slice(lag_start, size)),
+            (slice(start + split, stop), slice(0, length - split))]
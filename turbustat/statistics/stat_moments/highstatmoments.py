@@ -6,10 +6,13 @@ from astropy.wcs import WCS
 import astropy.units as u
 from astropy.utils.console import ProgressBar
 from itertools import product
+from scipy.fftpack import next_fast_len
 
 from ..stats_utils import (hellinger, kl_divergence, common_histogram_bins,
                            common_scale, padwithnans)
 from ..base_statistic import BaseStatisticMixIn
+from ..fft_engine import get_fft_engine
+from ..result_cache import cached_run
 from ...io import common_types, twod_types, input_data
 
 
@@ -71,6 +74,15 @@ class StatMoments(BaseStatisticMixIn):
     @radius.setter
     def radius(self, value):
 
+        self._check_radius(value)
+
+        self._radius = value
+
+    def _check_radius(self, value):
+        '''
+        Check that a radius can be used and return it in pixel units.
+        '''
+
         if not isinstance(value, u.Quantity):
             raise TypeError("radius must be an astropy.units.Quantity.")
 
@@ -90,7 +102,7 @@ class StatMoments(BaseStatisticMixIn):
             raise ValueError("The chosen radius is larger than half the image "
                              "size. Reduce the size of the radius.")
 
-        self._radius = value
+        return pix_rad
 
     def array_moments(self):
         '''
@@ -100,7 +112,9 @@ class StatMoments(BaseStatisticMixIn):
             compute_moments(self.data, self.weights)
 
     def compute_spatial_distrib(self, radius=None, periodic=True,
-                                min_frac=0.8, show_progress=True):
+                                min_frac=0.8, show_progress=True,
+                                method='fft', use_pyfftw=False, threads=1,
+                                pyfftw_kwargs={}):
         '''
         Compute the moments over circular region with the specified radius.
 
@@ -116,18 +130,35 @@ class StatMoments(BaseStatisticMixIn):
             be in the region.
         show_progress : bool, optional
             Show a progress bar during the creation of the covariance matrix.
+            Only used with "loop".
+        method : {"fft", "loop"}, optional
+            "fft" finds the weighted sums of the powers of the data in the
+            circular region around every pixel from FFT convolutions, and
+            the number of finite pixels in each square region from summed
+            area tables. "loop" computes the moments pixel by pixel with
+            `compute_moments`. Both give the same moments, up to
+            floating-point round-off. With "fft", regions whose variance is
+            much smaller than their second moment about the global mean are
+            recomputed from their pixels, and regions that have no pixels
+            with both finite data and weights are NaN.
+        use_pyfftw : bool, optional
+            Enable to use pyfftw, if it is installed.
+        threads : int, optional
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
+        pyfftw_kwargs : Passed to
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
         '''
 
+        if method not in ["fft", "loop"]:
+            raise ValueError("method must be 'fft' or 'loop'. "
+                             "Given {}".format(method))
+
         # Require the fraction to be > 0 and <=1
         if min_frac <= 0.0 or min_frac > 1.:
             raise ValueError("min_frac must be larger than 0 and less than"
                              "or equal to 1.")
 
-        self._mean_array = np.empty(self.data.shape)
-        self._variance_array = np.empty(self.data.shape)
-        self._skewness_array = np.empty(self.data.shape)
-        self._kurtosis_array = np.empty(self.data.shape)
-
         # Use the new radius when another given
         if radius is not None:
             self.radius = radius
@@ -136,6 +167,23 @@ class StatMoments(BaseStatisticMixIn):
         # the nearest integer values
         pix_rad = np.ceil(self._to_pixel(self.radius).value).astype(int)
 
+        if method == "fft":
+            engine = get_fft_engine(use_pyfftw=use_pyfftw, threads=threads,
+                                    **pyfftw_kwargs)
+
+            local_moments = _LocalMoments(self.data, self.weights, pix_rad,
+                                          periodic, engine)
+
+            self._mean_array, self._variance_array, self._skewness_array, \
+                self._kurtosis_array = local_moments(pix_rad, min_frac)
+
+            return
+
+        self._mean_array = np.empty(self.data.shape)
+        self._variance_array = np.empty(self.data.shape)
+        self._skewness_array = np.empty(self.data.shape)
+        self._kurtosis_array = np.empty(self.data.shape)
+
         if periodic:
             pad_img = np.pad(self.data, pix_rad, mode="wrap")
             pad_weights = np.pad(self.weights, pix_rad, mode="wrap")
@@ -212,6 +260,92 @@ class StatMoments(BaseStatisticMixIn):
         '''
         return self._kurtosis_array
 
+    def sweep_radii(self, radii, periodic=True, min_frac=0.8,
+                    histograms_only=False, mean_bins=None,
+                    variance_bins=None, skewness_bins=None,
+                    kurtosis_bins=None, use_pyfftw=False, threads=1,
+                    pyfftw_kwargs={}):
+        '''
+        Compute the local moments at several radii.
+
+        The weighted powers of the data are transformed once, and the
+        moments at each radius are found as with the "fft" method of
+        `~StatMoments.compute_spatial_distrib`. The radius and moment
+        arrays of this object are not changed.
+
+        Parameters
+        ----------
+        radii : `~astropy.units.Quantity`
+            Radii of the circular regions.
+        periodic : bool, optional
+            Specify whether the boundaries can be wrapped. Default is True.
+        min_frac : float, optional
+            A number between 0 and 1 that sets the minimum fraction of data in
+            each region that are finite. A value of 1.0 requires that no NaNs
+            be in the region.
+        histograms_only : bool, optional
+            Return only the histograms of the moments. The moment arrays at
+            each radius are discarded once their histograms are made, so
+            only one set is held in memory at a time.
+        mean_bins : array, optional
+            Bins to use for the histograms of the mean arrays.
+        variance_bins : array, optional
+            Bins to use for the histograms of the variance arrays.
+        skewness_bins : array, optional
+            Bins to use for the histograms of the skewness arrays.
+        kurtosis_bins : array, optional
+            Bins to use for the histograms of the kurtosis arrays.
+        use_pyfftw : bool, optional
+            Enable to use pyfftw, if it is installed.
+        threads : int, optional
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
+        pyfftw_kwargs : Passed to
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
+
+        Returns
+        -------
+        moments : list of dict
+            For each radius, a dictionary with "mean", "variance",
+            "skewness" and "kurtosis" keys. With `histograms_only`, the
+            values are the histogram bins and values, as in
+            `~StatMoments.mean_hist`. Otherwise, they are the moment
+            arrays.
+        '''
+
+        # Require the fraction to be > 0 and <=1
+        if min_frac <= 0.0 or min_frac > 1.:
+            raise ValueError("min_frac must be larger than 0 and less than"
+                             "or equal to 1.")
+
+        radii = np.atleast_1d(radii)
+
+        pix_rads = [np.ceil(self._check_radius(radius).value).astype(int)
+                    for radius in radii]
+
+        engine = get_fft_engine(use_pyfftw=use_pyfftw, threads=threads,
+                                **pyfftw_kwargs)
+
+        local_moments = _LocalMoments(self.data, self.weights,
+                                      max(pix_rads), periodic, engine)
+
+        names = ['mean', 'variance', 'skewness', 'kurtosis']
+        bins = [mean_bins, variance_bins, skewness_bins, kurtosis_bins]
+        bins = [self.nbins if bin_set is None else bin_set
+                for bin_set in bins]
+
+        moments = []
+        for pix_rad in pix_rads:
+            arrays = local_moments(pix_rad, min_frac)
+
+            if histograms_only:
+                arrays = [_moment_histogram(arr, bin_set)
+                          for arr, bin_set in zip(arrays, bins)]
+
+            moments.append(dict(zip(names, arrays)))
+
+        return moments
+
     @property
     def mean_extrema(self):
         '''
@@ -260,40 +394,24 @@ class StatMoments(BaseStatisticMixIn):
         kurtosis_bins : array, optional
             Bins to use for the histogram of the kurtosis array.
         '''
-        # Mean
         if mean_bins is None:
             mean_bins = self.nbins
-        mean_hist, edges = \
-            np.histogram(self.mean_array[~np.isnan(self.mean_array)],
-                         mean_bins, density=True)
-        mean_bin_centres = (edges[:-1] + edges[1:]) / 2
-        self._mean_hist = [mean_bin_centres, mean_hist]
+        self._mean_hist = _moment_histogram(self.mean_array, mean_bins)
 
-        # Variance
         if variance_bins is None:
             variance_bins = self.nbins
-        variance_hist, edges = \
-            np.histogram(self.variance_array[~np.isnan(self.variance_array)],
-                         variance_bins, density=True)
-        var_bin_centres = (edges[:-1] + edges[1:]) / 2
-        self._variance_hist = [var_bin_centres, variance_hist]
+        self._variance_hist = _moment_histogram(self.variance_array,
+                                                variance_bins)
 
-        # Skewness
         if skewness_bins is None:
             skewness_bins = self.nbins
-        skewness_hist, edges = \
-            np.histogram(self.skewness_array[~np.isnan(self.skewness_array)],
-                         skewness_bins, density=True)
-        skew_bin_centres = (edges[:-1] + edges[1:]) / 2
-        self._skewness_hist = [skew_bin_centres, skewness_hist]
-        # Kurtosis
+        self._skewness_hist = _moment_histogram(self.skewness_array,
+                                                skewness_bins)
+
         if kurtosis_bins is None:
             kurtosis_bins = self.nbins
-        kurtosis_hist, edges = \
-            np.histogram(self.kurtosis_array[~np.isnan(self.kurtosis_array)],
-                         kurtosis_bins, density=True)
-        kurt_bin_centres = (edges[:-1] + edges[1:]) / 2
-        self._kurtosis_hist = [kurt_bin_centres, kurtosis_hist]
+        self._kurtosis_hist = _moment_histogram(self.kurtosis_array,
+                                                kurtosis_bins)
 
     @property
     def mean_hist(self):
@@ -442,8 +560,10 @@ class StatMoments(BaseStatisticMixIn):
         else:
             plt.show()
 
+    @cached_run
     def run(self, show_progress=True, verbose=False, save_name=None,
-            radius=None, periodic=True, min_frac=0.8, **hist_kwargs):
+            radius=None, periodic=True, min_frac=0.8, method='fft',
+            use_pyfftw=False, threads=1, pyfftw_kwargs={}, **hist_kwargs):
         '''
         Compute the entire method.
 
@@ -463,12 +583,25 @@ class StatMoments(BaseStatisticMixIn):
             A number between 0 and 1 that sets the minimum fraction of data in
             each region that are finite. A value of 1.0 requires that no NaNs
             be in the region.
+        method : {"fft", "loop"}, optional
+            See `~StatMoments.compute_spatial_distrib`.
+        use_pyfftw : bool, optional
+            Enable to use pyfftw, if it is installed.
+        threads : int, optional
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
+        pyfftw_kwargs : Passed to
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
         hist_kwargs : Passed to `~StatMoments.make_spatial_histograms`.
         '''
 
         self.array_moments()
         self.compute_spatial_distrib(periodic=periodic, radius=radius,
-                                     show_progress=show_progress)
+                                     min_frac=min_frac,
+                                     show_progress=show_progress,
+                                     method=method, use_pyfftw=use_pyfftw,
+                                     threads=threads,
+                                     pyfftw_kwargs=pyfftw_kwargs)
         self.make_spatial_histograms(**hist_kwargs)
 
         if verbose:
@@ -670,6 +803,223 @@ class StatMoments_Distance(object):
         return self
 
 
+class _LocalMoments(object):
+    '''
+    Weighted moments of an image within the circular region around every
+    pixel, from convolutions with the circular kernel.
+
+    The data are shifted by their mean and scaled by their standard
+    deviation, which leaves the central moments unchanged and limits the
+    round-off when they are found from the raw sums. The weights, and the
+    weights times the first four powers of the scaled data, are
+    transformed once. At each radius, the sums over the circular regions
+    only need a product with the transform of the kernel and an inverse
+    FFT. As in `compute_moments`, the weights of pixels where only the
+    data are NaN are kept in the normalization.
+
+    Expanding the central sums from the raw sums cancels catastrophically
+    where the local variance is much smaller than the second moment about
+    the global mean, as in smooth images with small regions. The moments
+    of those regions are recomputed directly from their pixels.
+
+    For periodic boundaries, the transforms are periodic over the image.
+    Otherwise, the maps are zero-padded by the largest radius, so that
+    the regions at the edges only include the pixels within the image, as
+    with the NaN-padding in `StatMoments.compute_spatial_distrib`.
+    '''
+
+    def __init__(self, img, weights, max_radius, periodic, engine):
+
+        self._engine = engine
+
+        self._img = img
+        self._weights = weights
+        self._img_shape = img.shape
+        self.periodic = periodic
+
+        if periodic:
+            self.shape = img.shape
+        else:
+            self.shape = tuple(next_fast_len(size + int(max_radius))
+                               for size in img.shape)
+
+        self._finite_img = np.isfinite(img)
+        self._finite_wgt = np.isfinite(weights)
+        valid = self._finite_img & self._finite_wgt
+
+        if valid.any():
+            self.shift = np.mean(img[valid])
+            self.scale = np.std(img[valid])
+        else:
+            self.shift = 0.
+            self.scale = 1.
+        if not np.isfinite(self.scale) or self.scale == 0.:
+            self.scale = 1.
+
+        scaled = np.where(valid, (img - self.shift) / self.scale, 0.)
+        wgts = np.where(valid, weights, 0.)
+
+        self._ft_sums = [self._transform(valid.astype(float))]
+        for power in range(5):
+            self._ft_sums.append(self._transform(wgts * scaled**power))
+
+        # The normalization only differs when the data has NaNs where the
+        # weights are finite.
+        if (self._finite_wgt & ~self._finite_img).any():
+            self._ft_norm = \
+                self._transform(np.where(self._finite_wgt, weights, 0.))
+        else:
+            self._ft_norm = None
+
+    def _transform(self, arr):
+        return self._engine.rfftn(arr, s=self.shape)
+
+    def _finite_counts(self, finite, radius):
+        '''
+        Number of finite pixels in the square of width 2 * radius + 1
+        around every pixel, from a summed area table.
+        '''
+
+        if self.periodic:
+            padded = np.pad(finite, radius, mode='wrap')
+        else:
+            padded = np.pad(finite, radius, mode='constant')
+
+        table = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1),
+                         dtype=np.int64)
+        table[1:, 1:] = padded.cumsum(axis=0).cumsum(axis=1)
+
+        width = 2 * radius + 1
+        rows, cols = self._img_shape
+
+        return table[width:width + rows, width:width + cols] - \
+            table[:rows, width:width + cols] - \
+            table[width:width + rows, :cols] + table[:rows, :cols]
+
+    def __call__(self, radius, min_frac):
+        '''
+        Returns the mean, variance, skewness and kurtosis arrays within the
+        circular regions of radius `radius` pixels.
+        '''
+
+        # Same region as `circular_region`, centered on the first pixel.
+        yy, xx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+        inside = xx**2 + yy**2 < radius**2
+
+        kernel = np.zeros(self.shape)
+        kernel[yy[inside] % self.shape[0], xx[inside] % self.shape[1]] = 1.
+
+        # The kernel is symmetric, so its transform is real.
+        transfer = np.fft.rfftn(kernel).real
+
+        crop = (slice(0, self._img_shape[0]), slice(0, self._img_shape[1]))
+
+        def convolve(ft_arr):
+            return self._engine.irfftn(ft_arr * transfer, s=self.shape)[crop]
+
+        num_valid = np.rint(convolve(self._ft_sums[0]))
+        sums = [convolve(ft_sum) for ft_sum in self._ft_sums[1:]]
+
+        if self._ft_norm is None:
+            norm = sums[0]
+            offset = 0.
+        else:
+            norm = convolve(self._ft_norm)
+            offset = self.shift / self.scale * (sums[0] - norm)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = (sums[1] + offset) / norm
+
+            # Sums of the powers of the scaled data about the mean
+            central = []
+            for power in [2, 3, 4]:
+                central.append(sum(binom * sums[k] * (-mean)**(power - k)
+                                   for k, binom in
+                                   enumerate(_binomials[power])))
+            central = [cent / norm for cent in central]
+
+            variance = central[0]
+            skewness = central[1] / variance**1.5
+            kurtosis = central[2] / variance**2 - 3
+
+            # The round-off in the central sums grows with the square of
+            # the ratio of the raw second moment to the variance.
+            unstable = ~(variance > _cancel_tol *
+                         np.maximum(sums[2] / norm, 1.))
+
+        mean = self.shift + self.scale * mean
+        variance = self.scale**2 * variance
+
+        area = float((2 * radius + 1)**2)
+        bad = (self._finite_counts(self._finite_img, radius) / area <
+               min_frac) | \
+            (self._finite_counts(self._finite_wgt, radius) / area <
+             min_frac) | (num_valid == 0)
+
+        unstable &= ~bad
+        if unstable.any():
+            posns = np.nonzero(unstable)
+            direct = self._direct_moments(posns, yy[inside], xx[inside],
+                                          radius)
+            for arr, direct_arr in zip([mean, variance, skewness, kurtosis],
+                                       direct):
+                arr[posns] = direct_arr
+
+        moments = []
+        for arr in [mean, variance, skewness, kurtosis]:
+            arr[bad] = np.NaN
+            moments.append(arr)
+
+        return moments
+
+    def _direct_moments(self, posns, yy, xx, radius):
+        '''
+        Moments of the circular regions centred on `posns` from their
+        pixels, with the offsets `yy` and `xx` within the region.
+        '''
+
+        if self.periodic:
+            pad_img = np.pad(self._img, radius, mode="wrap")
+            pad_weights = np.pad(self._weights, radius, mode="wrap")
+        else:
+            pad_img = np.pad(self._img, radius, padwithnans)
+            pad_weights = np.pad(self._weights, radius, padwithnans)
+
+        rows = posns[0] + radius
+        cols = posns[1] + radius
+
+        moments = [np.empty(rows.size) for _ in range(4)]
+
+        # Limit the size of the gathered regions
+        chunk = max(1, _direct_chunk // yy.size)
+        for start in range(0, rows.size, chunk):
+            sl = slice(start, start + chunk)
+            region_rows = rows[sl, np.newaxis] + yy
+            region_cols = cols[sl, np.newaxis] + xx
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                chunk_moments = \
+                    compute_moments(pad_img[region_rows, region_cols],
+                                    pad_weights[region_rows, region_cols],
+                                    axis=1)
+            for arr, chunk_arr in zip(moments, chunk_moments):
+                arr[sl] = chunk_arr
+
+        return moments
+
+
+# Binomial coefficients used to expand the central sums
+_binomials = {2: [1, 2, 1], 3: [1, 3, 3, 1], 4: [1, 4, 6, 4, 1]}
+
+# Regions whose variance is below this fraction of the second moment about
+# the global mean, in units of the global variance, are recomputed
+# directly. The kurtosis from the sums is then good to ~1e-10.
+_cancel_tol = 1e-2
+
+# Number of pixels gathered at once when recomputing regions directly
+_direct_chunk = 2**20
+
+
 def circular_region(radius):
     '''
     Create a circular region with nans outside the radius.
@@ -686,7 +1036,7 @@ def circular_region(radius):
     return circle
 
 
-def compute_moments(img, weights):
+def compute_moments(img, weights, axis=None):
     '''
     Compute the moments of the given image.
 
@@ -696,6 +1046,9 @@ def compute_moments(img, weights):
         2D image.
     weights : numpy.ndarray
         2D weight image.
+    axis : int, optional
+        Axis along which to compute the moments. By default, the moments
+        of the whole image are returned.
 
     Returns
     -------
@@ -710,15 +1063,39 @@ def compute_moments(img, weights):
 
     '''
 
-    mean = np.nansum(img * weights) / np.nansum(weights)
-    variance = np.nansum(weights * (img - mean) ** 2.) / np.nansum(weights)
-    skewness = np.nansum(weights * ((img - mean) / np.sqrt(variance)) ** 3.) / \
-        np.nansum(weights)
-    kurtosis = np.nansum(weights * ((img - mean) / np.sqrt(variance)) ** 4.) / \
-        np.nansum(weights) - 3
+    if axis is not None:
+        def expand(arr):
+            return np.expand_dims(arr, axis)
+    else:
+        def expand(arr):
+            return arr
+
+    wgt_sum = np.nansum(weights, axis=axis)
+
+    mean = np.nansum(img * weights, axis=axis) / wgt_sum
+    variance = np.nansum(weights * (img - expand(mean)) ** 2.,
+                         axis=axis) / wgt_sum
+    skewness = np.nansum(weights * ((img - expand(mean)) /
+                                    np.sqrt(expand(variance))) ** 3.,
+                         axis=axis) / wgt_sum
+    kurtosis = np.nansum(weights * ((img - expand(mean)) /
+                                    np.sqrt(expand(variance))) ** 4.,
+                         axis=axis) / wgt_sum - 3
 
     return mean, variance, skewness, kurtosis
 
 
+def _moment_histogram(arr, bins):
+    '''
+    Normalized histogram of the finite values in a moment array. Returns
+    the bin centres and the histogram values.
+    '''
+
+    hist, edges = np.histogram(arr[~np.isnan(arr)], bins, density=True)
+    bin_centres = (edges[:-1] + edges[1:]) / 2
+
+    return [bin_centres, hist]
+
+
 def _auto_nbins(size1, size2):
     return int((size1 + size2) / 2.)
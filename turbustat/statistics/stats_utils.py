@@ -5,6 +5,10 @@ import numpy as np
 import math
 from scipy.optimize import leastsq
 import astropy.wcs as wcs
+from multiprocessing.pool import ThreadPool
+from collections import deque
+
+from .fft_engine import get_fft_engine
 
 
 def hellinger(data1, data2, bin_width=1.0):
@@ -555,13 +559,14 @@ def fourier_shift(x, shift, axis=0):
 
 
 def _shifter(x, shift, axis):
-    ftx = np.fft.fft(x, axis=axis)
+    engine = get_fft_engine()
+    ftx = engine.fft(x, axis=axis)
     m = np.fft.fftfreq(x.shape[axis])
     m_shape = [1] * len(x.shape)
     m_shape[axis] = m.shape[0]
     m = m.reshape(m_shape)
     phase = np.exp(-2 * np.pi * m * 1j * shift)
-    x2 = np.real(np.fft.ifft(ftx * phase, axis=axis))
+    x2 = np.real(engine.ifft(ftx * phase, axis=axis))
     return x2
 
 
@@ -604,3 +609,59 @@ def padwithnans(vector, pad_width, iaxis, kwargs):
     vector[:pad_width[0]] = np.NaN
     vector[-pad_width[1]:] = np.NaN
     return vector
+
+
+def ordered_map(func, items, n_jobs=1, max_in_flight=None):
+    '''
+    Apply a function to each item, optionally with a pool of threads. The
+    outputs are yielded in the order of the items, so reductions over the
+    outputs do not depend on the number of threads.
+
+    Parameters
+    ----------
+    func : function
+        Function applied to each item.
+    items : iterable
+        Inputs to `func`.
+    n_jobs : int, optional
+        Number of threads. The items are processed serially when 1.
+    max_in_flight : int, optional
+        Maximum number of items that are being processed or whose outputs
+        have not been yielded yet. This limits the memory held by large
+        outputs when the caller is slower than the threads. No limit is
+        set by default.
+
+    Returns
+    -------
+    outputs : generator
+        Outputs of `func`.
+    '''
+
+    if max_in_flight is not None and max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1.")
+
+    if n_jobs is None or n_jobs == 1:
+        for item in items:
+            yield func(item)
+        return
+
+    if n_jobs < 1:
+        raise ValueError("n_jobs must be at least 1.")
+
+    pool = ThreadPool(n_jobs)
+    try:
+        if max_in_flight is None:
+            for output in pool.imap(func, items):
+                yield output
+        else:
+            pending = deque()
+            for item in items:
+                if len(pending) == max_in_flight:
+                    yield pending.popleft().get()
+                pending.append(pool.apply_async(func, (item,)))
+
+            while pending:
+                yield pending.popleft().get()
+    finally:
+        pool.close()
+        pool.join()
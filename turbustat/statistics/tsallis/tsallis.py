@@ -9,6 +9,7 @@ from astropy.table import Table
 
 from ..stats_utils import standardize, padwithzeros
 from ..base_statistic import BaseStatisticMixIn
+from ..result_cache import cached_run
 from ...io import common_types, twod_types
 
 
@@ -321,6 +322,7 @@ class Tsallis(BaseStatisticMixIn):
         else:
             plt.show()
 
+    @cached_run
     def run(self, verbose=False, num_bins=None, periodic=True, sigma_clip=5,
             save_name=None):
         '''
@@ -44,36 +44,16 @@ def spectral_regrid_cube(cube, channel_width):
     if not isinstance(channel_width, u.Quantity):
         raise TypeError("channel_width must be an astropy.units.Quantity.")
 
-    fwhm_factor = np.sqrt(8 * np.log(2))
-
-    pix_unit = channel_width.unit.is_equivalent(u.pix)
-
-    spec_width = np.diff(cube.spectral_axis[:2])[0]
-
     current_resolution = np.diff(cube.spectral_axis[:2])[0]
 
-    if pix_unit:
-        target_resolution = channel_width.value * spec_width
-    else:
-        target_resolution = channel_width.to(current_resolution.unit)
-
-    diff_factor = np.abs(target_resolution / current_resolution).value
+    diff_factor, gaussian_width = \
+        channel_width_to_kernel(channel_width, current_resolution)
 
     if diff_factor == 1:
         warn("The requested channel width match the original channel width. "
              "The original cube is returned.")
         return cube
 
-    if diff_factor < 1:
-        raise ValueError("Only down-sampling the spectral grid is supported. "
-                         "The requested channel width of {0} is a factor {1} "
-                         "smaller than the original channel width."
-                         .format(target_resolution, diff_factor))
-
-    pixel_scale = np.abs(current_resolution)
-
-    gaussian_width = ((target_resolution**2 - current_resolution**2)**0.5 /
-                      pixel_scale / fwhm_factor)
     kernel = Gaussian1DKernel(gaussian_width)
     new_cube = cube.spectral_smooth(kernel)
 
@@ -88,3 +68,53 @@ def spectral_regrid_cube(cube, channel_width):
 
     return new_cube.spectral_interpolate(new_specaxis,
                                          suppress_smooth_warning=True)
+
+
+def channel_width_to_kernel(channel_width, current_resolution):
+    '''
+    Find the down-sampling factor and the width of the Gaussian smoothing
+    kernel needed to change the channel width. The kernel width is the
+    target channel width deconvolved from the current channel width.
+
+    Parameters
+    ----------
+    channel_width : `~astropy.units.Quantity`
+        The width of the new channels, in equivalent spectral units to
+        `current_resolution` or in pixel units.
+    current_resolution : `~astropy.units.Quantity`
+        The current channel width.
+
+    Returns
+    -------
+    diff_factor : float
+        Ratio of the new to the current channel width.
+    gaussian_width : float
+        Standard deviation of the Gaussian smoothing kernel in pixels.
+    '''
+
+    if not isinstance(channel_width, u.Quantity):
+        raise TypeError("channel_width must be an astropy.units.Quantity.")
+
+    fwhm_factor = np.sqrt(8 * np.log(2))
+
+    pix_unit = channel_width.unit.is_equivalent(u.pix)
+
+    if pix_unit:
+        target_resolution = channel_width.value * current_resolution
+    else:
+        target_resolution = channel_width.to(current_resolution.unit)
+
+    diff_factor = np.abs(target_resolution / current_resolution).value
+
+    if diff_factor < 1:
+        raise ValueError("Only down-sampling the spectral grid is supported. "
+                         "The requested channel width of {0} is a factor {1} "
+                         "smaller than the original channel width."
+                         .format(target_resolution, diff_factor))
+
+    pixel_scale = np.abs(current_resolution)
+
+    gaussian_width = ((target_resolution**2 - current_resolution**2)**0.5 /
+                      pixel_scale / fwhm_factor)
+
+    return diff_factor, gaussian_width.value
@@ -3,13 +3,16 @@ from __future__ import print_function, absolute_import, division
 
 import numpy as np
 import warnings
-from numpy.fft import fftshift
 import astropy.units as u
+from copy import copy
 
 from ..rfft_to_fft import rfft_to_fft
-from .slice_thickness import spectral_regrid_cube
+from ..fft_engine import get_fft_engine
+from ..stats_utils import ordered_map
+from .slice_thickness import spectral_regrid_cube, channel_width_to_kernel
 from ..base_pspec2 import StatisticBase_PSpec2D
 from ..base_statistic import BaseStatisticMixIn
+from ..result_cache import cached_run
 from ...io import common_types, threed_types
 from ...io.input_base import to_spectral_cube
 from ..fitting_utils import check_fit_limits
@@ -54,8 +57,11 @@ class VCA(BaseStatisticMixIn, StatisticBase_PSpec2D):
             # Don't pass the header. It will read the new one in reg_cube
             self.input_data_header(reg_cube, None)
 
-        if np.isnan(self.data).any():
-            self.data[np.isnan(self.data)] = 0
+        # NaNs in memory-mapped data are replaced as the channels are read
+        # in compute_pspec, to avoid loading or altering the whole cube.
+        if not isinstance(self.data, np.memmap):
+            if np.isnan(self.data).any():
+                self.data[np.isnan(self.data)] = 0
 
         if distance is not None:
             self.distance = distance
@@ -66,10 +72,17 @@ class VCA(BaseStatisticMixIn, StatisticBase_PSpec2D):
 
     def compute_pspec(self, beam_correct=False,
                       apodize_kernel=None, alpha=0.3, beta=0.0,
+                      block_size=None, n_jobs=1,
                       use_pyfftw=False, threads=1, **pyfftw_kwargs):
         '''
         Compute the 2D power spectrum.
 
+        The cube is streamed in blocks of channels: each block is
+        transformed with 2D FFTs and the power is added to a single 2D
+        array. The full 3D FFT is never held in memory, and the cube can be
+        a memory-mapped array. By Parseval's theorem, this is equivalent to
+        summing the power of the 3D FFT over the spectral frequencies.
+
         Parameters
         ----------
         beam_correct : bool, optional
@@ -83,12 +96,18 @@ class VCA(BaseStatisticMixIn, StatisticBase_PSpec2D):
         beta : float, optional
             beta shape parameter of the apodization kernel. See
             `~turbustat.apodizing_kernel` for more information.
+        block_size : int, optional
+            Number of channels to transform at once. Defaults to blocks of
+            roughly 64 MB. See `channel_power`.
+        n_jobs : int, optional
+            Number of threads used to transform blocks in parallel.
         use_pyfftw : bool, optional
             Enable to use pyfftw, if it is installed.
         threads : int, optional
-            Number of threads to use in FFT when using pyfftw.
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
         pyfftw_kwargs : Passed to
-            `~turbustat.statistics.rfft_to_fft.rfft_to_fft`. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`. See
             `here <http://hgomersall.github.io/pyFFTW/pyfftw/builders/builders.html>`__
             for a list of accepted kwargs.
         '''
@@ -97,16 +116,16 @@ class VCA(BaseStatisticMixIn, StatisticBase_PSpec2D):
             apod_kernel = self.apodizing_kernel(kernel_type=apodize_kernel,
                                                 alpha=alpha,
                                                 beta=beta)
-            data = self.data * apod_kernel
         else:
-            data = self.data
+            apod_kernel = None
 
         if pyfftw_kwargs.get('threads') is not None:
             pyfftw_kwargs.pop('threads')
 
-        fft = fftshift(rfft_to_fft(data, use_pyfftw=use_pyfftw,
-                                   threads=threads,
-                                   **pyfftw_kwargs))
+        ps2D_half = channel_power(self.data, apod_kernel=apod_kernel,
+                                  block_size=block_size, n_jobs=n_jobs,
+                                  use_pyfftw=use_pyfftw, threads=threads,
+                                  **pyfftw_kwargs)
 
         if beam_correct:
             if not hasattr(self, '_beam'):
@@ -117,17 +136,19 @@ class VCA(BaseStatisticMixIn, StatisticBase_PSpec2D):
                                              y_size=self.data.shape[1],
                                              x_size=self.data.shape[2])
 
-            beam_fft = fftshift(rfft_to_fft(beam_kern.array))
+            beam_fft = rfft_to_fft(beam_kern.array, keep_rfft=True)
 
             self._beam_pow = np.abs(beam_fft**2)
 
-        self._ps2D = np.power(fft, 2.).sum(axis=0)
-
         if beam_correct:
-            self._ps2D /= self._beam_pow
+            ps2D_half /= self._beam_pow
 
+        self._set_ps2D_half(ps2D_half, self.data.shape[1:])
+
+    @cached_run
     def run(self, verbose=False, beam_correct=False,
             apodize_kernel=None, alpha=0.2, beta=0.0,
+            block_size=None, n_jobs=1,
             use_pyfftw=False, threads=1,
             pyfftw_kwargs={},
             return_stddev=True, radial_pspec_kwargs={},
@@ -152,10 +173,16 @@ class VCA(BaseStatisticMixIn, StatisticBase_PSpec2D):
         beta : float, optional
             beta shape parameter of the apodization kernel. See
             `~turbustat.apodizing_kernel` for more information.
+        block_size : int, optional
+            Number of channels to transform at once. See
+            `~VCA.compute_pspec`.
+        n_jobs : int, optional
+            Number of threads used to transform blocks in parallel.
         use_pyfftw : bool, optional
             Enable to use pyfftw, if it is installed.
         threads : int, optional
-            Number of threads to use in FFT when using pyfftw.
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
         pyfft_kwargs : Passed to
             `~turbustat.statistics.rfft_to_fft.rfft_to_fft`. See
             `here <https://hgomersall.github.io/pyFFTW/pyfftw/interfaces/interfaces.html#interfaces-additional-args>`_
@@ -191,6 +218,7 @@ class VCA(BaseStatisticMixIn, StatisticBase_PSpec2D):
         self.compute_pspec(apodize_kernel=apodize_kernel,
                            alpha=alpha, beta=beta,
                            beam_correct=beam_correct,
+                           block_size=block_size, n_jobs=n_jobs,
                            use_pyfftw=use_pyfftw, threads=threads,
                            **pyfftw_kwargs)
 
@@ -215,6 +243,240 @@ class VCA(BaseStatisticMixIn, StatisticBase_PSpec2D):
 
         return self
 
+    def sweep_channel_widths(self, widths, beam_correct=False,
+                             apodize_kernel=None, alpha=0.3, beta=0.0,
+                             return_stddev=True, radial_pspec_kwargs={},
+                             low_cut=None, high_cut=None, fit_2D=False,
+                             fit_kwargs={}, fit_2D_kwargs={},
+                             use_pyfftw=False, threads=1, **pyfftw_kwargs):
+        '''
+        Compute the VCA for a set of channel widths from a single FFT of
+        the cube.
+
+        The 3D FFT of the cube is computed once. For each channel width, the
+        spectral smoothing and down-sampling used by
+        `~turbustat.statistics.vca_vcs.slice_thickness.spectral_regrid_cube`
+        are applied in Fourier space: the power is weighted by the response
+        of the Gaussian smoothing kernel and only the spectral frequencies
+        sampled by the new number of channels are kept. Since the
+        down-sampling is done by Fourier truncation rather than by linear
+        interpolation, the spectra differ slightly from those computed with
+        `VCA(cube, channel_width=width)`.
+
+        The power of the 3D FFT is kept in memory, which requires about half
+        of the memory of the full complex FFT of the cube.
+
+        Parameters
+        ----------
+        widths : `~astropy.units.Quantity`
+            Channel widths, in spectral units equivalent to the header or
+            in pixel units.
+        beam_correct : bool, optional
+            If a beam object was given, divide the 2D FFT by the beam
+            response.
+        apodize_kernel : None or 'splitcosinebell', 'hanning', 'tukey', 'cosinebell', 'tophat'
+            If None, no apodization kernel is applied. Otherwise, the type of
+            apodizing kernel is given.
+        alpha : float, optional
+            alpha shape parameter of the apodization kernel.
+        beta : float, optional
+            beta shape parameter of the apodization kernel.
+        return_stddev : bool, optional
+            Return the standard deviation in the 1D bins.
+        radial_pspec_kwargs : dict, optional
+            Passed to `~VCA.compute_radial_pspec`.
+        low_cut : `~astropy.units.Quantity`, optional
+            Low frequency cut off in frequencies used in the fitting.
+        high_cut : `~astropy.units.Quantity`, optional
+            High frequency cut off in frequencies used in the fitting.
+        fit_2D : bool, optional
+            Fit an elliptical power-law model to the 2D spectra.
+        fit_kwargs : dict, optional
+            Passed to `~VCA.fit_pspec`.
+        fit_2D_kwargs : dict, optional
+            Keyword arguments for `~VCA.fit_2Dpspec`.
+        use_pyfftw : bool, optional
+            Enable to use pyfftw, if it is installed.
+        threads : int, optional
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
+        pyfftw_kwargs : Passed to
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
+
+        Returns
+        -------
+        sweep : list of `~VCA`
+            A VCA object for each channel width, with the power spectra and
+            fits computed. The data and header are shared with this object.
+        '''
+
+        if not isinstance(widths, u.Quantity):
+            raise TypeError("widths must be an astropy.units.Quantity.")
+
+        widths = np.atleast_1d(widths)
+
+        if pyfftw_kwargs.get('threads') is not None:
+            pyfftw_kwargs.pop('threads')
+
+        nchan = self.data.shape[0]
+
+        # Current channel width
+        wcs = self._wcs
+        current_resolution = wcs.pixel_scale_matrix[2, 2] * \
+            u.Unit(wcs.wcs.cunit[2])
+
+        # Weights on the power at each spectral frequency for each width.
+        spec_freqs = np.fft.fftfreq(nchan)
+        int_freqs = np.round(spec_freqs * nchan).astype(int)
+
+        weights = np.empty((len(widths), nchan))
+        for i, width in enumerate(widths):
+            diff_factor, gaussian_width = \
+                channel_width_to_kernel(width, current_resolution)
+
+            num_chan = int(np.floor_divide(nchan, diff_factor))
+
+            # Frequencies sampled by the down-sampled channels
+            kept = np.logical_and(int_freqs >= -(num_chan // 2),
+                                  int_freqs <= (num_chan - 1) // 2)
+
+            # Response of the Gaussian kernel squared
+            gauss_resp = np.exp(-4 * np.pi**2 * gaussian_width**2 *
+                                spec_freqs**2)
+
+            # The DFT of the shorter axis is scaled by num_chan / nchan
+            weights[i] = kept * gauss_resp * (num_chan / float(nchan))**2
+
+        if apodize_kernel is not None:
+            apod_kernel = self.apodizing_kernel(kernel_type=apodize_kernel,
+                                                alpha=alpha,
+                                                beta=beta)
+        else:
+            apod_kernel = 1.
+
+        data = np.array(self.data, dtype=float)
+        data[np.isnan(data)] = 0.
+        data *= apod_kernel
+
+        engine = get_fft_engine(use_pyfftw=use_pyfftw, threads=threads,
+                                **pyfftw_kwargs)
+
+        power = np.abs(engine.rfftn(data))**2
+
+        del data
+
+        ps2D_stack = np.tensordot(weights, power, axes=(1, 0))
+
+        del power
+
+        if beam_correct:
+            if not hasattr(self, '_beam'):
+                raise AttributeError("Beam correction cannot be applied since"
+                                     " no beam object was given.")
+
+            beam_kern = self._beam.as_kernel(self._wcs.wcs.cdelt[0] * u.deg,
+                                             y_size=self.data.shape[1],
+                                             x_size=self.data.shape[2])
+
+            beam_fft = rfft_to_fft(beam_kern.array, keep_rfft=True)
+
+            ps2D_stack /= np.abs(beam_fft**2)
+
+        sweep = []
+        for ps2D_half in ps2D_stack:
+            width_vca = copy(self)
+
+            width_vca._set_ps2D_half(ps2D_half, self.data.shape[1:])
+
+            width_vca.compute_radial_pspec(return_stddev=return_stddev,
+                                           **radial_pspec_kwargs)
+            width_vca.fit_pspec(low_cut=low_cut, high_cut=high_cut,
+                                **fit_kwargs)
+
+            if fit_2D:
+                width_vca.fit_2Dpspec(low_cut=low_cut, high_cut=high_cut,
+                                      **fit_2D_kwargs)
+
+            sweep.append(width_vca)
+
+        return sweep
+
+
+def channel_power(cube, apod_kernel=None, block_size=None, n_jobs=1,
+                  use_pyfftw=False, threads=1, **pyfftw_kwargs):
+    '''
+    Sum the 2D power spectra of the channels in a cube, in the half-plane
+    layout of the real FFT. The channels are read and transformed in blocks,
+    so the cube may be a memory-mapped array that does not fit in memory.
+
+    The sum is scaled by the number of channels. By Parseval's theorem,
+    this matches summing the power of the 3D FFT of the cube over the
+    spectral frequencies.
+
+    Parameters
+    ----------
+    cube : np.ndarray
+        3D array, with the spectral axis first. NaNs are treated as zeros.
+    apod_kernel : np.ndarray, optional
+        2D apodizing kernel applied to each channel.
+    block_size : int, optional
+        Number of channels to transform at once. Defaults to blocks of
+        roughly 64 MB.
+    n_jobs : int, optional
+        Number of threads used to transform blocks in parallel. The blocks
+        are summed in order, so the result does not depend on `n_jobs`.
+    use_pyfftw : bool, optional
+        Enable to use pyfftw, if it is installed.
+    threads : int, optional
+        Number of threads to use in the FFT. See
+        `~turbustat.statistics.fft_engine.get_fft_engine`.
+    pyfftw_kwargs : Passed to
+        `~turbustat.statistics.fft_engine.get_fft_engine`.
+
+    Returns
+    -------
+    power : np.ndarray
+        Summed power with shape `(cube.shape[1], cube.shape[2] // 2 + 1)`.
+    '''
+
+    if cube.ndim != 3:
+        raise ValueError("cube must be 3D.")
+
+    nchan = cube.shape[0]
+
+    if block_size is None:
+        # Size of one transformed channel in bytes
+        chan_size = 16 * cube.shape[1] * (cube.shape[2] // 2 + 1)
+        block_size = max(1, 2**26 // chan_size)
+
+    block_size = int(block_size)
+    if block_size < 1:
+        raise ValueError("block_size must be at least 1.")
+
+    engine = get_fft_engine(use_pyfftw=use_pyfftw, threads=threads,
+                            **pyfftw_kwargs)
+
+    def block_power(start):
+        block = np.array(cube[start:start + block_size], dtype=float)
+
+        block[np.isnan(block)] = 0.
+
+        if apod_kernel is not None:
+            block *= apod_kernel
+
+        return (np.abs(engine.rfftn(block, axes=(1, 2)))**2).sum(0)
+
+    starts = range(0, nchan, block_size)
+
+    power = np.zeros((cube.shape[1], cube.shape[2] // 2 + 1))
+
+    for block in ordered_map(block_power, starts, n_jobs=n_jobs):
+        power += block
+
+    power *= nchan
+
+    return power
+
 
 class VCA_Distance(object):
 
@@ -7,8 +7,10 @@ from numpy.fft import fftfreq
 from astropy import units as u
 
 from ..lm_seg import Lm_Seg
-from ..rfft_to_fft import rfft_to_fft
+from ..fft_engine import get_fft_engine
+from ..stats_utils import ordered_map
 from ..base_statistic import BaseStatisticMixIn
+from ..result_cache import cached_run
 from ...io import common_types, threed_types
 from ...io.input_base import to_spectral_cube
 from ..fitting_utils import clip_func
@@ -50,48 +52,53 @@ class VCS(BaseStatisticMixIn):
             # Don't pass the header. It will read the new one in reg_cube
             self.input_data_header(reg_cube, None)
 
-        self._has_nan_flag = False
-        if np.isnan(self.data).any():
-            self.data[np.isnan(self.data)] = 0
-            self._has_nan_flag = True
-
         self.vel_channels = np.arange(1, self.data.shape[0], 1)
 
         self.freqs = \
             np.abs(fftfreq(self.data.shape[0])) / u.pix
 
-    def compute_pspec(self, use_pyfftw=False, threads=1, **pyfftw_kwargs):
+    def compute_pspec(self, tile_size=None, n_jobs=1, use_pyfftw=False,
+                      threads=1, **pyfftw_kwargs):
         '''
         Take the FFT of each spectrum in the velocity dimension and average.
 
+        The spectra are transformed in spatial tiles, so the cube may be a
+        memory-mapped array. Only spectra with at least one finite value are
+        included in the average. NaNs are treated as zeros.
+
         Parameters
         ----------
+        tile_size : int, optional
+            Number of rows (along the second axis of the cube) in each tile.
+            Defaults to tiles of roughly 64 MB. See `spectral_power`.
+        n_jobs : int, optional
+            Number of threads used to transform tiles in parallel.
         use_pyfftw : bool, optional
             Enable to use pyfftw, if it is installed.
         threads : int, optional
-            Number of threads to use in FFT when using pyfftw.
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
         pyfftw_kwargs : Passed to
-            `~turbustat.statistics.rfft_to_fft.rfft_to_fft`. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`. See
             `here <http://hgomersall.github.io/pyFFTW/pyfftw/builders/builders.html>`_
             for a list of accepted kwargs.
         '''
 
-        if self._has_nan_flag:
-            # Is this the best way to be averaging the data?
-            good_pixel_count = np.sum(self.data.max(axis=0) != 0)
-        else:
-            good_pixel_count = \
-                float(self.data.shape[1] * self.data.shape[2])
-
         if pyfftw_kwargs.get('threads') is not None:
             pyfftw_kwargs.pop('threads')
 
-        fft = rfft_to_fft(self.data, use_pyfftw=use_pyfftw,
-                          keep_rfft=False,
-                          threads=threads,
-                          **pyfftw_kwargs)
-        ps3D = np.power(fft, 2.)
-        self._ps1D = np.nansum(ps3D, axis=(1, 2)) / good_pixel_count
+        power, good_pixel_count = \
+            spectral_power(self.data, tile_size=tile_size, n_jobs=n_jobs,
+                           use_pyfftw=use_pyfftw, threads=threads,
+                           **pyfftw_kwargs)
+
+        if good_pixel_count == 0:
+            raise ValueError("The cube contains no valid spectra.")
+
+        # Keep the normalization of the 3D FFT over the cube.
+        num_pix = self.data.shape[1] * self.data.shape[2]
+
+        self._ps1D = power * num_pix / float(good_pixel_count)
 
     @property
     def ps1D(self):
@@ -299,7 +306,9 @@ class VCS(BaseStatisticMixIn):
         else:
             plt.show()
 
+    @cached_run
     def run(self, verbose=False, save_name=None, xunit=u.pix**-1,
+            tile_size=None, n_jobs=1,
             use_pyfftw=False, threads=1, pyfftw_kwargs={},
             **fit_kwargs):
         '''
@@ -313,12 +322,17 @@ class VCS(BaseStatisticMixIn):
             Save the figure when a file name is given.
         xunit : u.Unit, optional
             Choose the unit to convert the x-axis in the plot to.
+        tile_size : int, optional
+            Number of rows in each spatial tile. See `~VCS.compute_pspec`.
+        n_jobs : int, optional
+            Number of threads used to transform tiles in parallel.
         use_pyfftw : bool, optional
             Enable to use pyfftw, if it is installed.
         threads : int, optional
-            Number of threads to use in FFT when using pyfftw.
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
         pyfftw_kwargs : Passed to
-            `~turbustat.statistics.rfft_to_fft.rfft_to_fft`. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`. See
             `here <http://hgomersall.github.io/pyFFTW/pyfftw/builders/builders.html>`_
             for a list of accepted kwargs.
         fit_kwargs : Passed to `~VCS.fit_pspec`.
@@ -327,7 +341,8 @@ class VCS(BaseStatisticMixIn):
         # Remove threads if in dict
         if pyfftw_kwargs.get('threads') is not None:
             pyfftw_kwargs.pop('threads')
-        self.compute_pspec(use_pyfftw=use_pyfftw, threads=threads,
+        self.compute_pspec(tile_size=tile_size, n_jobs=n_jobs,
+                           use_pyfftw=use_pyfftw, threads=threads,
                            **pyfftw_kwargs)
 
         self.fit_pspec(**fit_kwargs)
@@ -342,6 +357,88 @@ class VCS(BaseStatisticMixIn):
         return self
 
 
+def spectral_power(cube, tile_size=None, n_jobs=1, use_pyfftw=False,
+                   threads=1, **pyfftw_kwargs):
+    '''
+    Sum the power spectra of the spectra in a cube along the spectral axis.
+    The cube is read and transformed in tiles of rows, so it may be a
+    memory-mapped array that does not fit in memory.
+
+    Parameters
+    ----------
+    cube : np.ndarray
+        3D array, with the spectral axis first. NaNs are treated as zeros.
+        Spectra without any finite values are not counted as valid.
+    tile_size : int, optional
+        Number of rows (along the second axis) in each tile. Defaults to
+        tiles of roughly 64 MB.
+    n_jobs : int, optional
+        Number of threads used to transform tiles in parallel. The tiles
+        are summed in order, so the result does not depend on `n_jobs`.
+    use_pyfftw : bool, optional
+        Enable to use pyfftw, if it is installed.
+    threads : int, optional
+        Number of threads to use in the FFT. See
+        `~turbustat.statistics.fft_engine.get_fft_engine`.
+    pyfftw_kwargs : Passed to
+        `~turbustat.statistics.fft_engine.get_fft_engine`.
+
+    Returns
+    -------
+    power : np.ndarray
+        Summed power at the frequencies of `np.fft.fftfreq(cube.shape[0])`.
+    num_valid : int
+        Number of valid spectra.
+    '''
+
+    if cube.ndim != 3:
+        raise ValueError("cube must be 3D.")
+
+    nchan = cube.shape[0]
+
+    if tile_size is None:
+        # Size of one transformed row in bytes
+        row_size = 16 * (nchan // 2 + 1) * cube.shape[2]
+        tile_size = max(1, 2**26 // row_size)
+
+    tile_size = int(tile_size)
+    if tile_size < 1:
+        raise ValueError("tile_size must be at least 1.")
+
+    engine = get_fft_engine(use_pyfftw=use_pyfftw, threads=threads,
+                            **pyfftw_kwargs)
+
+    def tile_power(start):
+        tile = np.array(cube[:, start:start + tile_size], dtype=float)
+
+        nan_posns = np.isnan(tile)
+        num_valid = np.sum(~nan_posns.all(axis=0))
+        tile[nan_posns] = 0.
+
+        del nan_posns
+
+        power = (np.abs(engine.rfft(tile, axis=0))**2).sum(axis=(1, 2))
+
+        return power, num_valid
+
+    starts = range(0, cube.shape[1], tile_size)
+
+    half_power = np.zeros(nchan // 2 + 1)
+    num_valid = 0
+
+    for power, tile_valid in ordered_map(tile_power, starts, n_jobs=n_jobs):
+        half_power += power
+        num_valid += tile_valid
+
+    # Expand to the negative frequencies, which have the same power for
+    # real spectra.
+    power = np.empty(nchan)
+    power[:nchan // 2 + 1] = half_power
+    power[nchan // 2 + 1:] = half_power[1:(nchan + 1) // 2][::-1]
+
+    return power, int(num_valid)
+
+
 class VCS_Distance(object):
 
     '''
@@ -6,19 +6,16 @@ import warnings
 from astropy.convolution import convolve_fft, MexicanHat2DKernel
 import astropy.units as u
 import statsmodels.api as sm
-from warnings import warn
 from astropy.utils.console import ProgressBar
-
-try:
-    from pyfftw.interfaces.numpy_fft import fftn, ifftn
-    PYFFTW_FLAG = True
-except ImportError:
-    PYFFTW_FLAG = False
+from scipy.fftpack import next_fast_len
 
 from ..base_statistic import BaseStatisticMixIn
+from ..result_cache import cached_run
 from ...io import common_types, twod_types
 from ..fitting_utils import check_fit_limits
+from ..stats_utils import ordered_map
 from ..lm_seg import Lm_Seg
+from ..fft_engine import get_fft_engine
 
 
 class Wavelet(BaseStatisticMixIn):
@@ -98,9 +95,13 @@ class Wavelet(BaseStatisticMixIn):
         self._scales = values
 
     def compute_transform(self, show_progress=True, scale_normalization=True,
-                          use_pyfftw=False, threads=1, pyfftw_kwargs={}):
+                          use_pyfftw=False, threads=1, pyfftw_kwargs={},
+                          n_jobs=1, max_in_flight=None, method='convolve',
+                          keep_planes=True, planes_dtype=np.float64,
+                          planes_file=None):
         '''
-        Compute the wavelet transform at each scale.
+        Compute the wavelet transform at each scale, and the 1D transform
+        from each plane as it is computed.
 
         Parameters
         ----------
@@ -112,68 +113,182 @@ class Wavelet(BaseStatisticMixIn):
         use_pyfftw : bool, optional
             Enable to use pyfftw, if it is installed.
         threads : int, optional
-            Number of threads to use in FFT when using pyfftw.
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
         pyfftw_kwargs : Passed to
             See `here <http://hgomersall.github.io/pyFFTW/pyfftw/builders/builders.html>`_
             for a list of accepted kwargs.
+        n_jobs : int, optional
+            Number of threads used to transform the scales in parallel. Each
+            scale is placed in its own plane, so the results do not depend
+            on `n_jobs`.
+        max_in_flight : int, optional
+            Maximum number of scales being transformed or waiting to be
+            stored at once. Defaults to twice `n_jobs`.
+        method : {"convolve", "fourier"}, optional
+            "convolve" convolves the image with a sampled
+            `~astropy.convolution.MexicanHat2DKernel` at each scale.
+            "fourier" transforms the image once, and multiplies it by the
+            analytic transform of the Mexican hat at each scale. The image
+            is zero-padded in both cases. The wavelet is not sampled or
+            truncated with "fourier", so the planes differ slightly,
+            mostly at the smallest scales.
+        keep_planes : bool, optional
+            Store the transform at every scale in `Wf`. When disabled, only
+            the 1D transform is kept, and single planes can be recomputed
+            with `~Wavelet.plane`.
+        planes_dtype : `~numpy.dtype`, optional
+            Data type of the stored planes. Use `~numpy.float32` to halve
+            the memory used by `Wf`.
+        planes_file : str, optional
+            Store `Wf` in a memory-mapped `.npy` file with this name instead
+            of in memory.
         '''
 
-        if use_pyfftw:
-            if PYFFTW_FLAG:
-                use_fftn = fftn
-                use_ifftn = ifftn
-            else:
-                warn("pyfftw not installed. Using numpy.fft functions.")
-                use_fftn = np.fft.fftn
-                use_ifftn = np.fft.ifftn
-        else:
-            use_fftn = np.fft.fftn
-            use_ifftn = np.fft.ifftn
+        if method not in ["convolve", "fourier"]:
+            raise ValueError("method must be 'convolve' or 'fourier'. "
+                             "Given {}".format(method))
 
-        n0, m0 = self.data.shape
-        A = len(self.scales)
-
-        self._Wf = np.zeros((A, n0, m0), dtype=np.float)
-
-        factor = 2
         if not scale_normalization:
-            factor = 4
             Warning("Transform values are only reliable with the proper scale"
                     " normalization. When disabled, the slope of the transform"
                     " CANNOT be used for physical interpretation.")
 
         pix_scales = self._to_pixel(self.scales).value
 
+        # The largest scale sets the padding with "fourier", so it is kept
+        # for recomputing the planes with `~Wavelet.plane`.
+        self._transform_kwargs = dict(max_scale=pix_scales.max(),
+                                      scale_normalization=scale_normalization,
+                                      use_pyfftw=use_pyfftw, threads=threads,
+                                      pyfftw_kwargs=pyfftw_kwargs,
+                                      method=method)
+
+        n0, m0 = self.data.shape
+        A = len(self.scales)
+
+        if not keep_planes:
+            self._Wf = None
+        elif planes_file is not None:
+            self._Wf = np.lib.format.open_memmap(planes_file, mode='w+',
+                                                 dtype=planes_dtype,
+                                                 shape=(A, n0, m0))
+        else:
+            self._Wf = np.zeros((A, n0, m0), dtype=planes_dtype)
+
+        scale_transform = self._scale_transformer(**self._transform_kwargs)
+
         if show_progress:
             bar = ProgressBar(len(pix_scales))
 
-        for i, an in enumerate(pix_scales):
-            psi = MexicanHat2DKernel(an)
+        def scale_outputs(an):
+            plane = scale_transform(an)
 
-            self._Wf[i] = \
-                convolve_fft(self.data, psi, normalize_kernel=False,
-                             fftn=use_fftn, ifftn=use_ifftn).real * \
-                an**factor
+            return _plane_value(plane), plane if keep_planes else None
+
+        if max_in_flight is None and n_jobs is not None:
+            max_in_flight = 2 * n_jobs
+
+        outputs = ordered_map(scale_outputs, pix_scales, n_jobs=n_jobs,
+                              max_in_flight=max_in_flight)
+
+        self._values = np.empty_like(pix_scales)
+
+        for i, (value, plane) in enumerate(outputs):
+            self._values[i] = value
+
+            if keep_planes:
+                self._Wf[i] = plane
 
             if show_progress:
                 bar.update(i + 1)
 
+        if planes_file is not None and keep_planes:
+            self._Wf.flush()
+
+    def _scale_transformer(self, max_scale, scale_normalization=True,
+                           use_pyfftw=False, threads=1, pyfftw_kwargs={},
+                           method='convolve'):
+        '''
+        Returns a function that computes the transform at one pixel scale.
+        '''
+
+        factor = 2 if scale_normalization else 4
+
+        if method == "fourier":
+            transform = _MexicanHatTransform(self.data, max_scale,
+                                             use_pyfftw=use_pyfftw,
+                                             threads=threads,
+                                             **pyfftw_kwargs)
+
+            def scale_transform(an):
+                return transform(an) * an**factor
+
+            return scale_transform
+
+        engine = get_fft_engine(use_pyfftw=use_pyfftw, threads=threads,
+                                **pyfftw_kwargs)
+
+        def scale_transform(an):
+            psi = MexicanHat2DKernel(an)
+
+            return convolve_fft(self.data, psi, normalize_kernel=False,
+                                fftn=engine.fftn, ifftn=engine.ifftn).real * \
+                an**factor
+
+        return scale_transform
+
     @property
     def Wf(self):
         '''
         The wavelet transforms of the image. Each plane is the transform at
-        different wavelet sizes.
+        different wavelet sizes. None when the planes were not kept.
         '''
         return self._Wf
 
+    def plane(self, i):
+        '''
+        The wavelet transform at the `i`-th scale. When the planes were not
+        kept, the plane is recomputed from the data with the settings last
+        given to `~Wavelet.compute_transform`, so it is the same plane that
+        was used for `~Wavelet.values`.
+
+        Parameters
+        ----------
+        i : int
+            Index of the scale.
+
+        Returns
+        -------
+        plane : `~numpy.ndarray`
+            Wavelet transform at the scale.
+        '''
+
+        if self.Wf is not None:
+            return self.Wf[i]
+
+        if self.data is None:
+            raise ValueError("The planes were not kept and the data was not "
+                             "saved, so the plane cannot be recomputed.")
+
+        an = self._to_pixel(self.scales[i]).value
+
+        return self._scale_transformer(**self._transform_kwargs)(an)
+
     def make_1D_transform(self):
         '''
-        Create the 1D transform.
+        Create the 1D transform from the stored planes.
+        `~Wavelet.compute_transform` already creates the 1D transform, so
+        this is only needed when `Wf` has been changed.
         '''
 
+        if self.Wf is None:
+            raise ValueError("The planes were not kept. Run "
+                             "compute_transform with keep_planes=True.")
+
         self._values = np.empty_like(self.scales.value)
         for i, plane in enumerate(self.Wf):
-            self._values[i] = (plane[plane > 0]).mean()
+            self._values[i] = _plane_value(plane)
 
     @property
     def values(self):
@@ -398,11 +513,13 @@ class Wavelet(BaseStatisticMixIn):
         else:
             plt.show()
 
+    @cached_run
     def run(self, show_progress=True, verbose=False, xunit=u.pix,
             use_pyfftw=False, threads=1,
             pyfftw_kwargs={}, scale_normalization=True,
-            xlow=None, xhigh=None, brk=None,
-            save_name=None, **plot_kwargs):
+            xlow=None, xhigh=None, brk=None, n_jobs=1, max_in_flight=None,
+            method='convolve', keep_planes=True, planes_dtype=np.float64,
+            planes_file=None, save_name=None, **plot_kwargs):
         '''
         Compute the Wavelet transform.
 
@@ -420,7 +537,8 @@ class Wavelet(BaseStatisticMixIn):
         use_pyfftw : bool, optional
             Enable to use pyfftw, if it is installed.
         threads : int, optional
-            Number of threads to use in FFT when using pyfftw.
+            Number of threads to use in the FFT. See
+            `~turbustat.statistics.fft_engine.get_fft_engine`.
         pyfftw_kwargs : Passed to
             See `here <http://hgomersall.github.io/pyFFTW/pyfftw/builders/builders.html>`_
             for a list of accepted kwargs.
@@ -434,6 +552,19 @@ class Wavelet(BaseStatisticMixIn):
         brk : `~astropy.units.Quantity`, optional
             Give an initial guess for a break point. This enables fitting
             with a `turbustat.statistics.Lm_Seg`.
+        n_jobs : int, optional
+            Number of threads used to transform the scales. See
+            `~Wavelet.compute_transform`.
+        max_in_flight : int, optional
+            See `~Wavelet.compute_transform`.
+        method : {"convolve", "fourier"}, optional
+            See `~Wavelet.compute_transform`.
+        keep_planes : bool, optional
+            See `~Wavelet.compute_transform`.
+        planes_dtype : `~numpy.dtype`, optional
+            See `~Wavelet.compute_transform`.
+        planes_file : str, optional
+            See `~Wavelet.compute_transform`.
         save_name : str,optional
             Save the figure when a file name is given.
         plot_kwargs : Passed to `~Wavelet.plot_transform`.
@@ -441,8 +572,11 @@ class Wavelet(BaseStatisticMixIn):
         self.compute_transform(scale_normalization=scale_normalization,
                                use_pyfftw=use_pyfftw, threads=threads,
                                pyfftw_kwargs=pyfftw_kwargs,
-                               show_progress=show_progress)
-        self.make_1D_transform()
+                               show_progress=show_progress,
+                               n_jobs=n_jobs, max_in_flight=max_in_flight,
+                               method=method, keep_planes=keep_planes,
+                               planes_dtype=planes_dtype,
+                               planes_file=planes_file)
         self.fit_transform(xlow=xlow, xhigh=xhigh, brk=brk)
 
         if verbose:
@@ -549,3 +683,52 @@ class Wavelet_Distance(object):
                 plt.show()
 
         return self
+
+
+class _MexicanHatTransform(object):
+    '''
+    Convolves an image with the Mexican hat wavelet at any scale, using the
+    analytic transform of the wavelet.
+
+    The wavelet matches `~astropy.convolution.MexicanHat2DKernel`, which
+    has a transform of :math:`4 \\pi^2 k^2 \\exp(-2 \\pi^2 a^2 k^2)` at
+    the frequency :math:`k` for the width :math:`a`. The image is
+    zero-padded by four widths of the largest scale, which is the
+    half-width of the largest kernel, and transformed once.
+    '''
+
+    def __init__(self, img, max_scale, use_pyfftw=False, threads=1,
+                 **pyfftw_kwargs):
+
+        self._engine = get_fft_engine(use_pyfftw=use_pyfftw, threads=threads,
+                                      **pyfftw_kwargs)
+
+        self._img_shape = img.shape
+
+        pad = int(np.ceil(4 * max_scale))
+        self.shape = tuple(next_fast_len(size + pad) for size in img.shape)
+
+        self._ft_img = self._engine.rfftn(img, s=self.shape)
+
+        yfreqs = np.fft.fftfreq(self.shape[0])
+        xfreqs = np.fft.rfftfreq(self.shape[1])
+        self._freqs_sq = yfreqs[:, np.newaxis]**2 + xfreqs[np.newaxis]**2
+
+    def __call__(self, scale):
+        '''
+        Returns the image convolved with the wavelet of width `scale`.
+        '''
+
+        transfer = 4 * np.pi**2 * self._freqs_sq * \
+            np.exp(-2 * np.pi**2 * scale**2 * self._freqs_sq)
+
+        conv = self._engine.irfftn(self._ft_img * transfer, s=self.shape)
+
+        return conv[:self._img_shape[0], :self._img_shape[1]]
+
+
+def _plane_value(plane):
+    '''
+    Value of the 1D transform from one plane.
+    '''
+    return (plane[plane > 0]).mean()
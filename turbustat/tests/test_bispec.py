@@ -109,6 +109,123 @@ def test_bispec_radial_slicing(plaw):
     npt.assert_allclose(out.slope, -plaw * 1.5, atol=0.3)
 
 
+@pytest.mark.parametrize('max_memory', [1, 2**14, 2**27])
+def test_Bispec_sampler_reference(max_memory):
+    '''
+    The blocked sampler should reproduce the per-pair sampling loop to the
+    bit, for any block size.
+    '''
+
+    img = make_extended(32, powerlaw=3., randomseed=5)
+    nsamples = 20
+
+    tester = Bispectrum(fits.PrimaryHDU(img))
+    tester.run(nsamples=nsamples, seed=1000, max_memory=max_memory)
+
+    fftarr = np.fft.fftn(img)
+    conjfft = np.conj(fftarr)
+
+    bispec = np.zeros((16, 16), dtype=complex)
+    biconorm = np.ones((16, 16))
+    tracker = np.zeros(img.shape, dtype=int)
+
+    np.random.seed(1000)
+    for k1mag in range(16):
+        for k2mag in range(16):
+            phi1 = np.random.uniform(0, 2 * np.pi, nsamples)
+            phi2 = np.random.uniform(0, 2 * np.pi, nsamples)
+
+            k1x = np.array([int(k1mag * np.cos(ang)) for ang in phi1])
+            k1y = np.array([int(k1mag * np.sin(ang)) for ang in phi1])
+            k2x = np.array([int(k2mag * np.cos(ang)) for ang in phi2])
+            k2y = np.array([int(k2mag * np.sin(ang)) for ang in phi2])
+            k3x = np.array([int(k1mag * np.cos(ang1) + k2mag * np.cos(ang2))
+                            for ang1, ang2 in zip(phi1, phi2)])
+            k3y = np.array([int(k1mag * np.sin(ang1) + k2mag * np.sin(ang2))
+                            for ang1, ang2 in zip(phi1, phi2)])
+
+            samps = fftarr[k1x, k1y] * fftarr[k2x, k2y] * conjfft[k3x, k3y]
+
+            bispec[k1mag, k2mag] = np.sum(samps)
+            biconorm[k1mag, k2mag] = np.sum(np.abs(samps))
+
+            for kx, ky in [(k1x, k1y), (k2x, k2y), (k3x, k3y)]:
+                np.add.at(tracker, (kx, ky), 1)
+
+    npt.assert_array_equal(tester.bispectrum, bispec)
+    npt.assert_array_equal(tester.bicoherence, np.abs(bispec) / biconorm)
+    npt.assert_array_equal(tester.tracker, tracker)
+
+
+def test_Bispec_n_jobs():
+    '''
+    Sampling in threads should not change the results.
+    '''
+
+    img = make_extended(32, powerlaw=3., randomseed=5)
+
+    serial = Bispectrum(fits.PrimaryHDU(img))
+    serial.run(nsamples=20, seed=1000, max_memory=2000)
+
+    parallel = Bispectrum(fits.PrimaryHDU(img))
+    parallel.run(nsamples=20, seed=1000, max_memory=2000, n_jobs=3,
+                 max_in_flight=4)
+
+    npt.assert_array_equal(serial.bispectrum, parallel.bispectrum)
+    npt.assert_array_equal(serial.bicoherence, parallel.bicoherence)
+    npt.assert_array_equal(serial.tracker, parallel.tracker)
+
+
+@pytest.mark.parametrize(('size', 'max_memory'),
+                         [(12, 1), (12, 2**27), (32, 1), (32, 2**27)])
+def test_Bispec_shells(size, max_memory):
+    '''
+    The shell estimator should give the sum over all pairs of wavevectors
+    in each pair of shells.
+    '''
+
+    img = make_extended(size, powerlaw=3., randomseed=5)
+
+    tester = Bispectrum(fits.PrimaryHDU(img))
+    tester.run(method='shells', max_memory=max_memory)
+
+    nshells = size // 2
+
+    fftarr = np.fft.fftn(img)
+    freqs = np.fft.fftfreq(size, 1. / size)
+    shells = np.floor(np.sqrt(freqs[:, np.newaxis]**2 +
+                              freqs[np.newaxis]**2) + 0.5).astype(int)
+
+    k2x, k2y = np.where(shells < nshells)
+
+    bispec = np.zeros(nshells**2, dtype=complex)
+    biconorm = np.zeros(nshells**2)
+
+    for k1 in zip(k2x, k2y):
+        k3 = ((k1[0] + k2x) % size, (k1[1] + k2y) % size)
+        samps = fftarr[k1] * fftarr[k2x, k2y] * np.conj(fftarr[k3])
+
+        bins = shells[k1] * nshells + shells[k2x, k2y]
+        bispec += np.bincount(bins, weights=samps.real,
+                              minlength=nshells**2)
+        bispec += 1j * np.bincount(bins, weights=samps.imag,
+                                   minlength=nshells**2)
+        biconorm += np.bincount(bins, weights=np.abs(samps),
+                                minlength=nshells**2)
+
+    bispec = bispec.reshape((nshells, nshells))
+    biconorm = biconorm.reshape((nshells, nshells))
+
+    npt.assert_allclose(tester.bispectrum, bispec,
+                        atol=1e-10 * np.abs(bispec).max())
+    # The image has a zero mean, so the zeroth shell is all round-off.
+    npt.assert_allclose(tester.bicoherence[1:, 1:],
+                        (np.abs(bispec) / biconorm)[1:, 1:], atol=1e-10)
+    assert np.all(tester.bicoherence[np.isfinite(tester.bicoherence)] <=
+                  1 + 1e-10)
+    assert tester.tracker is None
+
+
 @pytest.mark.skipif("not PYFFTW_INSTALLED")
 def test_Bispec_method_fftw():
     tester = Bispectrum(dataset1["moment0"])
@@ -3,6 +3,7 @@ from __future__ import print_function, absolute_import, division
 
 import pytest
 
+import numpy as np
 import numpy.testing as npt
 import astropy.units as u
 import os
@@ -159,3 +160,77 @@ def test_delvar_plaw_img(plaw, ellip):
         npt.assert_allclose(plaw - 2., test.slope, atol=0.01)
     else:
         npt.assert_allclose(plaw - 2., test.slope, rtol=0.03)
+
+
+@pytest.mark.parametrize('boundary', ['wrap', 'fill'])
+def test_DelVar_analytic(boundary):
+    '''
+    The transformed kernels should give the same convolutions, when the
+    kernels are smaller than the image.
+    '''
+
+    img = make_extended(64, powerlaw=3., randomseed=5)
+    img[10:14, 30:40] = np.NaN
+
+    lags = np.linspace(3, 20, 8) * u.pix
+
+    test = DeltaVariance(fits.PrimaryHDU(img), lags=lags)
+    test.run(boundary=boundary, method='convolve')
+
+    test_analytic = DeltaVariance(fits.PrimaryHDU(img), lags=lags)
+    test_analytic.run(boundary=boundary, method='analytic')
+
+    npt.assert_allclose(test.delta_var, test_analytic.delta_var)
+    npt.assert_allclose(test.delta_var_error, test_analytic.delta_var_error)
+
+    for arr, arr_analytic in zip(test.convolved_arrays,
+                                 test_analytic.convolved_arrays):
+        npt.assert_allclose(arr, arr_analytic, atol=1e-10)
+
+
+def test_DelVar_keep_convolved():
+    '''
+    Dropping the convolved maps should not change the delta-variance.
+    '''
+
+    img = make_extended(64, powerlaw=3., randomseed=5)
+
+    lags = np.linspace(3, 20, 8) * u.pix
+
+    test = DeltaVariance(fits.PrimaryHDU(img), lags=lags)
+    test.run()
+
+    test_none = DeltaVariance(fits.PrimaryHDU(img), lags=lags)
+    test_none.run(keep_convolved=False)
+
+    npt.assert_allclose(test.delta_var, test_none.delta_var)
+    npt.assert_allclose(test.delta_var_error, test_none.delta_var_error)
+    assert len(test_none.convolved_arrays) == 0
+
+    with pytest.raises(ValueError):
+        test_none.compute_deltavar()
+
+    test_some = DeltaVariance(fits.PrimaryHDU(img), lags=lags)
+    test_some.run(keep_convolved=lags[[1, 4]])
+
+    npt.assert_allclose(test.delta_var, test_some.delta_var)
+    assert len(test_some.convolved_arrays) == 2
+    npt.assert_allclose(test_some.convolved_arrays[1],
+                        test.convolved_arrays[4])
+    npt.assert_allclose(test_some.convolved_lags.value, lags.value[[1, 4]])
+
+
+def test_DelVar_n_jobs():
+
+    img = make_extended(64, powerlaw=3., randomseed=5)
+
+    lags = np.linspace(3, 20, 8) * u.pix
+
+    serial = DeltaVariance(fits.PrimaryHDU(img), lags=lags)
+    serial.run()
+
+    parallel = DeltaVariance(fits.PrimaryHDU(img), lags=lags)
+    parallel.run(n_jobs=3, max_in_flight=4)
+
+    npt.assert_array_equal(serial.delta_var, parallel.delta_var)
+    npt.assert_array_equal(serial.delta_var_error, parallel.delta_var_error)
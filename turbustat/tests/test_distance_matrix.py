@@ -0,0 +1,141 @@
+# Licensed under an MIT open source license - see LICENSE
+from __future__ import print_function, absolute_import, division
+
+'''
+Test functions for the distance matrix engine
+'''
+
+import pytest
+
+import numpy as np
+import numpy.testing as npt
+import astropy.units as u
+
+try:
+    import astrodendro
+    ASTRODENDRO_INSTALLED = True
+except ImportError:
+    ASTRODENDRO_INSTALLED = False
+
+from ..statistics import (DistanceMatrix, stream_fiducial_distances,
+                          Wavelet_Distance, MVC_Distance, PSpec_Distance,
+                          Bispectrum_Distance, DeltaVariance_Distance,
+                          GenusDistance, VCS_Distance, VCA_Distance,
+                          Tsallis_Distance, PCA_Distance, SCF_Distance,
+                          Cramer_Distance, StatMoments_Distance,
+                          PDF_Distance, DendroDistance)
+from ..io.sim_tools import create_image_header
+from ._testing_data import dataset1, dataset2
+from .generate_test_images import make_extended
+
+
+def make_dataset(powerlaw, seed):
+
+    img = make_extended(32, powerlaw=powerlaw, randomseed=seed)
+    img -= img.min() - 0.1
+
+    hdr = create_image_header(1 * u.arcsec, 3 * u.arcsec, img.shape,
+                              1.42 * u.GHz, u.K)
+
+    return {"moment0": [img, hdr]}
+
+
+statistics = ["PSpec", "DeltaVariance_Curve", "DeltaVariance_Slope",
+              "PDF_Hellinger", "PDF_KS"]
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_DistanceMatrix(n_jobs):
+
+    datasets = [make_dataset(plaw, seed) for plaw, seed in
+                zip([2.5, 3., 3.5], [1, 2, 3])]
+
+    dist_mat = DistanceMatrix(datasets, statistics=statistics,
+                              n_jobs=n_jobs).run()
+
+    for name in statistics:
+        mat = dist_mat.distances[name]
+        assert mat.shape == (3, 3)
+        npt.assert_allclose(mat, mat.T)
+        npt.assert_allclose(np.diag(mat), 0.)
+
+    # Compare to running the distance classes on one pair
+    img1 = datasets[0]["moment0"]
+    img2 = datasets[2]["moment0"]
+
+    pspec = PSpec_Distance(img1, img2).distance_metric()
+    npt.assert_allclose(dist_mat.distances["PSpec"][0, 2], pspec.distance)
+
+    delvar = DeltaVariance_Distance(img1, img2).distance_metric()
+    npt.assert_allclose(dist_mat.distances["DeltaVariance_Curve"][0, 2],
+                        delvar.curve_distance)
+    npt.assert_allclose(dist_mat.distances["DeltaVariance_Slope"][0, 2],
+                        delvar.slope_distance)
+
+    pdf = PDF_Distance(img1, img2).distance_metric()
+    npt.assert_allclose(dist_mat.distances["PDF_Hellinger"][0, 2],
+                        pdf.hellinger_distance)
+    npt.assert_allclose(dist_mat.distances["PDF_KS"][0, 2],
+                        pdf.ks_distance)
+
+    # Streaming comparisons to the first dataset
+    designs = (dataset for dataset in datasets[1:])
+    stream = stream_fiducial_distances(datasets[0], designs,
+                                       statistics=statistics,
+                                       n_jobs=n_jobs, block_size=1)
+
+    for i, distances in enumerate(stream):
+        for name in statistics:
+            npt.assert_allclose(distances[name],
+                                dist_mat.distances[name][0, i + 1])
+
+
+def test_DistanceMatrix_badstat():
+
+    datasets = [make_dataset(3., 1), make_dataset(3., 2)]
+
+    with pytest.raises(ValueError):
+        DistanceMatrix(datasets, statistics=["NotAStatistic"])
+
+
+# One name from each statistic, the distance class it matches with the
+# default settings, the data product it uses, and the distance attribute.
+family_distances = \
+    [("Wavelet", Wavelet_Distance, "moment0", "distance"),
+     ("MVC", MVC_Distance, None, "distance"),
+     ("PSpec", PSpec_Distance, "moment0", "distance"),
+     ("Bispectrum", Bispectrum_Distance, "moment0", "distance"),
+     ("DeltaVariance_Curve", DeltaVariance_Distance, "moment0",
+      "curve_distance"),
+     ("Genus", GenusDistance, "moment0", "distance"),
+     ("VCS", VCS_Distance, "cube", "distance"),
+     ("VCA", VCA_Distance, "cube", "distance"),
+     ("Tsallis", Tsallis_Distance, "moment0", "distance"),
+     ("PCA", PCA_Distance, "cube", "distance"),
+     ("SCF", SCF_Distance, "cube", "distance"),
+     ("Cramer", Cramer_Distance, "cube", "distance"),
+     ("Skewness", StatMoments_Distance, "moment0", "skewness_distance"),
+     ("PDF_Lognormal", PDF_Distance, "moment0", "lognormal_distance"),
+     ("Dendrogram_Hist", DendroDistance, "cube", "histogram_distance")]
+
+
+@pytest.mark.parametrize(('name', 'distance_class', 'key', 'attr'),
+                         family_distances,
+                         ids=[entry[0] for entry in family_distances])
+def test_DistanceMatrix_families(name, distance_class, key, attr):
+    '''
+    Each statistic should give the same distance as its distance class.
+    '''
+
+    if distance_class is DendroDistance and not ASTRODENDRO_INSTALLED:
+        pytest.skip("Requires astrodendro")
+
+    dist_mat = DistanceMatrix([dataset1, dataset2], statistics=[name]).run()
+
+    if key is None:
+        dist = distance_class(dataset1, dataset2)
+    else:
+        dist = distance_class(dataset1[key], dataset2[key])
+    dist.distance_metric()
+
+    npt.assert_allclose(dist_mat.distances[name][0, 1], getattr(dist, attr))
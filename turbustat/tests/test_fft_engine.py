@@ -0,0 +1,79 @@
+# Licensed under an MIT open source license - see LICENSE
+from __future__ import print_function, absolute_import, division
+
+import pytest
+import numpy as np
+import numpy.testing as npt
+
+from ..statistics.fft_engine import (FFTEngine, get_fft_engine,
+                                     set_fft_backend, SCIPY_FFT_FLAG,
+                                     PYFFTW_FLAG)
+from ..statistics.rfft_to_fft import rfft_to_fft
+from .generate_test_images import make_extended
+
+
+img = make_extended(64, powerlaw=3.)
+cube = np.random.RandomState(2323).randn(8, 16, 18)
+
+
+@pytest.mark.parametrize('backend',
+                         ['numpy',
+                          pytest.param('scipy',
+                                       marks=pytest.mark.skipif(
+                                           not SCIPY_FFT_FLAG,
+                                           reason="Requires scipy.fft")),
+                          pytest.param('pyfftw',
+                                       marks=pytest.mark.skipif(
+                                           not PYFFTW_FLAG,
+                                           reason="Requires pyfftw"))])
+def test_engine_transforms(backend):
+
+    engine = FFTEngine(backend=backend, threads=2)
+
+    npt.assert_allclose(engine.fftn(img), np.fft.fftn(img), atol=1e-8)
+    npt.assert_allclose(engine.rfftn(img), np.fft.rfftn(img), atol=1e-8)
+    npt.assert_allclose(engine.irfftn(engine.rfftn(img), s=img.shape), img,
+                        atol=1e-8)
+    npt.assert_allclose(engine.ifftn(engine.fftn(img)).real, img,
+                        atol=1e-8)
+
+    npt.assert_allclose(engine.rfftn(cube, axes=(1, 2)),
+                        np.fft.rfftn(cube, axes=(1, 2)), atol=1e-8)
+    npt.assert_allclose(engine.rfft(cube, axis=0),
+                        np.fft.rfft(cube, axis=0), atol=1e-8)
+
+
+def test_engine_plan_cache():
+
+    engine = FFTEngine(max_plans=2)
+
+    engine.rfftn(img)
+    engine.rfftn(img)
+    assert len(engine.cached_plans) == 1
+
+    engine.fftn(img)
+    engine.rfftn(cube)
+    # Oldest plan is removed
+    assert len(engine.cached_plans) == 2
+    assert engine.cached_plans[0][0] == 'fftn'
+
+    engine.clear_cache()
+    assert len(engine.cached_plans) == 0
+
+
+def test_shared_engine():
+
+    engine1 = get_fft_engine(threads=1)
+    engine2 = get_fft_engine(threads=1)
+
+    assert engine1 is engine2
+
+    # Change the default backend
+    set_fft_backend('numpy', threads=2)
+
+    engine3 = get_fft_engine()
+    assert engine3.threads == 2
+
+    set_fft_backend('numpy', threads=1)
+
+    npt.assert_allclose(rfft_to_fft(img), np.abs(np.fft.fftn(img)))
@@ -5,13 +5,19 @@ from __future__ import print_function, absolute_import, division
 Test functions for Genus
 '''
 
+import pytest
+
 import numpy as np
 import numpy.testing as npt
+import scipy.ndimage as nd
 import astropy.units as u
+from astropy.io import fits
 from copy import copy
 import os
 
 from ..statistics import GenusDistance, Genus
+from ..statistics.genus.genus import remove_small_objects
+from .generate_test_images import make_extended
 from ._testing_data import \
     dataset1, dataset2, computed_data, computed_distances
 
@@ -92,6 +98,56 @@ def test_Genus_method_smoothunits():
     npt.assert_allclose(tester.genus_stats, tester3.genus_stats)
 
 
+@pytest.mark.parametrize(('min_size', 'connectivity'),
+                         [(min_size, connectivity) for min_size in [1, 4, 9]
+                          for connectivity in [1, 2]])
+def test_Genus_curve_labeling(min_size, connectivity):
+    '''
+    The single sweep over the thresholds should count the same regions as
+    labeling the image at each threshold.
+    '''
+
+    img = make_extended(32, powerlaw=3., randomseed=5)
+    img[10:12, 3:8] = np.NaN
+
+    tester = Genus(img, numpts=30, smoothing_radii=np.array([1., 2.]))
+    tester.make_smooth_arrays()
+    tester.make_genus_curve(min_size=min_size, connectivity=connectivity)
+
+    for j, image in enumerate(tester.smoothed_images):
+        for i, thresh in enumerate(tester.thresholds):
+            high = remove_small_objects(image > thresh, min_size=min_size,
+                                        connectivity=connectivity)
+            low = remove_small_objects(image < thresh, min_size=min_size,
+                                       connectivity=connectivity)
+            genus = nd.label(high, np.ones((3, 3)))[1] - \
+                nd.label(low, np.ones((3, 3)))[1]
+
+            assert tester.genus_stats[j, i] == genus
+
+
+@pytest.mark.parametrize('add_nans', [False, True])
+def test_Genus_fourier_smoothing(add_nans):
+    '''
+    The Fourier smoothing should give the same images as convolve_fft,
+    including at the edges.
+    '''
+
+    img = make_extended(64, powerlaw=3., randomseed=5)
+    if add_nans:
+        img[10:14, 30:40] = np.NaN
+
+    tester = Genus(fits.PrimaryHDU(img))
+    tester.make_smooth_arrays()
+
+    tester_fourier = Genus(fits.PrimaryHDU(img))
+    tester_fourier.make_smooth_arrays(method='fourier', n_jobs=2)
+
+    for smooth, smooth_fourier in zip(tester.smoothed_images,
+                                      tester_fourier.smoothed_images):
+        npt.assert_allclose(smooth, smooth_fourier, rtol=1e-7, atol=1e-10)
+
+
 def test_Genus_distance():
     tester_dist = \
         GenusDistance(dataset1["moment0"],
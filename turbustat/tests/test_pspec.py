@@ -251,3 +251,103 @@ def test_PSpec_apod_kernel(apod_type):
              low_cut=low_cut, verbose=False)
 
     npt.assert_allclose(-plaw, test.slope, rtol=0.02)
+
+
+@pytest.mark.parametrize(('shape', 'kwargs'),
+                         [((64, 64), {}), ((63, 64), {}), ((64, 63), {}),
+                          ((63, 65), {}),
+                          ((64, 63), {'theta_0': 30 * u.deg,
+                                      'delta_theta': 40 * u.deg}),
+                          ((63, 64), {'return_freqs': False})])
+def test_pspec_halfplane(shape, kwargs):
+    '''
+    Binning on the RFFT half-plane should match binning the full plane.
+    '''
+
+    from ..statistics.psds import pspec, pspec_rfft
+    from ..statistics.rfft_to_fft import rfft_to_fft
+
+    img = make_extended(128, powerlaw=3., randomseed=1)
+    img = img[:shape[0], :shape[1]]
+
+    ps2D_half = rfft_to_fft(img, keep_rfft=True)**2
+    ps2D = np.fft.fftshift(rfft_to_fft(img)**2)[::-1]
+
+    full_out = pspec(ps2D, return_stddev=True, **kwargs)
+    half_out = pspec_rfft(ps2D_half, shape, return_stddev=True, **kwargs)
+
+    npt.assert_allclose(full_out[0], half_out[0])
+    npt.assert_allclose(full_out[1], half_out[1])
+    # Bins with only Hermitian pairs have a std of ~0, set by round-off
+    npt.assert_allclose(full_out[2], half_out[2], rtol=1e-7,
+                        atol=1e-10 * ps2D.max())
+
+    if 'theta_0' in kwargs:
+        npt.assert_equal(full_out[3], half_out[3])
+
+    # The expanded 2D power spectrum should match the full plane
+    test = PowerSpectrum(fits.PrimaryHDU(img))
+    test.compute_pspec()
+
+    npt.assert_allclose(test.ps2D, ps2D)
+
+
+def test_radial_bin_cache():
+    '''
+    The radial bins are reused, and the bincount reduction matches
+    nanmean and nanstd.
+    '''
+
+    from ..statistics.psds import (get_radial_bins, clear_radial_bin_cache,
+                                   binned_mean_std)
+
+    clear_radial_bin_cache()
+
+    bins1 = get_radial_bins((32, 33), logspacing=False)
+    bins2 = get_radial_bins((32, 33), logspacing=False)
+
+    assert bins1 is bins2
+
+    bins3 = get_radial_bins((32, 33), logspacing=True)
+
+    assert bins1 is not bins3
+
+    rand = np.random.RandomState(493)
+    bin_num = rand.randint(0, 6, size=1000)
+    values = rand.randn(1000)
+    values[::37] = np.NaN
+
+    # Bin 5 is outside of the bins
+    mean, std = binned_mean_std([(bin_num, values)], 5, ddof=1)
+
+    for i in range(5):
+        npt.assert_allclose(mean[i], np.nanmean(values[bin_num == i]))
+        npt.assert_allclose(std[i], np.nanstd(values[bin_num == i], ddof=1))
+
+
+def test_pspec_bootstrap():
+    '''
+    The vectorized bootstrap should be reproducible, independent of the
+    memory limit, and converge to the standard deviation in each bin.
+    '''
+
+    from ..statistics.psds import pspec, bootstrap_binned_stddev
+
+    img = make_extended(64, powerlaw=3., randomseed=1)
+    ps2D = np.fft.fftshift(np.abs(np.fft.fft2(img))**2)[::-1]
+
+    out1 = pspec(ps2D, return_stddev=True, boot_iter=100, boot_seed=3)
+    out2 = pspec(ps2D, return_stddev=True, boot_iter=100, boot_seed=3,
+                 boot_max_memory=1)
+
+    npt.assert_allclose(out1[2], out2[2])
+
+    rand = np.random.RandomState(2)
+    vals = rand.randn(2000)
+    counts = np.array([500, 0, 1500])
+
+    stds = bootstrap_binned_stddev(vals, counts, 500, seed=1)
+
+    assert np.isnan(stds[1])
+    npt.assert_allclose(stds[0], np.std(vals[:500]), rtol=0.02)
+    npt.assert_allclose(stds[2], np.std(vals[500:]), rtol=0.02)
@@ -0,0 +1,101 @@
+# Licensed under an MIT open source license - see LICENSE
+from __future__ import print_function, absolute_import, division
+
+'''
+Test functions for the result cache
+'''
+
+import os
+import numpy.testing as npt
+import astropy.units as u
+
+from ..statistics import (PowerSpectrum, ResultCache, set_result_cache,
+                          get_result_cache)
+from ..io.sim_tools import create_image_header
+from .generate_test_images import make_extended
+
+
+def make_image(seed=1):
+
+    img = make_extended(32, powerlaw=3., randomseed=seed)
+
+    hdr = create_image_header(1 * u.arcsec, 3 * u.arcsec, img.shape,
+                              1.42 * u.GHz, u.K)
+
+    return img, hdr
+
+
+def test_result_cache(tmpdir, monkeypatch):
+
+    img, hdr = make_image()
+
+    cache = set_result_cache(str(tmpdir.join("cache")))
+
+    try:
+        assert get_result_cache() is cache
+
+        pspec = PowerSpectrum(img, header=hdr).run(fit_2D=False)
+
+        assert len(os.listdir(cache.path)) == 1
+
+        # A second run with the same inputs must not recompute
+        def fail(*args, **kwargs):
+            raise AssertionError("The power spectrum was recomputed.")
+
+        monkeypatch.setattr(PowerSpectrum, "compute_pspec", fail)
+
+        cached_pspec = PowerSpectrum(img, header=hdr).run(fit_2D=False)
+
+        npt.assert_allclose(cached_pspec.ps1D, pspec.ps1D)
+        npt.assert_allclose(cached_pspec.slope, pspec.slope)
+        npt.assert_allclose(cached_pspec.data, img)
+
+        monkeypatch.undo()
+
+        # Changing the arguments or the data gives a new entry
+        PowerSpectrum(img, header=hdr).run(fit_2D=False, high_cut=0.2 / u.pix)
+        PowerSpectrum(img * 2., header=hdr).run(fit_2D=False)
+
+        assert len(os.listdir(cache.path)) == 3
+
+        cache.clear()
+        assert cache.size == 0
+
+    finally:
+        set_result_cache(None)
+
+    assert get_result_cache() is None
+
+
+def test_result_cache_eviction(tmpdir, monkeypatch):
+
+    img, hdr = make_image()
+
+    cache = ResultCache(str(tmpdir.join("cache")))
+
+    set_result_cache(cache)
+
+    try:
+        PowerSpectrum(img, header=hdr).run(fit_2D=False)
+        entry_size = cache.size
+
+        # Only room for one result.
+        cache.max_size = int(1.5 * entry_size)
+
+        pspec = PowerSpectrum(img, header=hdr).run(fit_2D=False,
+                                                   high_cut=0.2 / u.pix)
+
+        assert len(os.listdir(cache.path)) == 1
+
+        # The most recent result is kept
+        def fail(*args, **kwargs):
+            raise AssertionError("The power spectrum was recomputed.")
+
+        monkeypatch.setattr(PowerSpectrum, "compute_pspec", fail)
+
+        cached_pspec = PowerSpectrum(img, header=hdr).run(fit_2D=False,
+                                                          high_cut=0.2 / u.pix)
+        npt.assert_allclose(cached_pspec.slope, pspec.slope)
+
+    finally:
+        set_result_cache(None)
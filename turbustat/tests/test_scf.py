@@ -104,6 +104,147 @@ def test_SCF_noninteger_shift():
     tester_nonint.run()
 
 
+@pytest.mark.parametrize('boundary', ['continuous', 'cut'])
+def test_SCF_kernel_integer_lags(boundary):
+    '''
+    The sliced kernel for integer lags should match shifting the cube.
+    '''
+    from ..statistics.scf.scf import _SCFKernel
+
+    cube = np.array([make_extended(16, powerlaw=3., randomseed=seed)
+                     for seed in range(8)])
+    cube[:, 3, 5] = np.nan
+    cube[2, 10, 4] = np.nan
+
+    kernel = _SCFKernel(cube)
+
+    for x_shift, y_shift in [(0, 0), (1, 0), (-3, 2), (6, -7), (-9, 10)]:
+
+        tmp = np.roll(np.roll(cube, x_shift, axis=1), y_shift, axis=2)
+
+        if boundary == 'cut':
+            x_slice_data = slice(max(x_shift, 0), 16 + min(x_shift, 0))
+            x_slice_tmp = slice(max(-x_shift, 0), 16 - max(x_shift, 0))
+            y_slice_data = slice(max(y_shift, 0), 16 + min(y_shift, 0))
+            y_slice_tmp = slice(max(-y_shift, 0), 16 - max(y_shift, 0))
+            data = cube[:, x_slice_data, y_slice_data]
+            tmp = tmp[:, x_slice_tmp, y_slice_tmp]
+        else:
+            data = cube
+
+        values = np.nansum((data - tmp)**2, axis=0) / \
+            (np.nansum(data**2, axis=0) + np.nansum(tmp**2, axis=0))
+        scf_value = 1 - np.sqrt(np.nanmean(values))
+
+        npt.assert_allclose(kernel(x_shift, y_shift, boundary), scf_value)
+
+        # The Fourier shifting for non-integer lags should match at
+        # integer lags
+        npt.assert_allclose(kernel._fractional_lag(x_shift, y_shift,
+                                                   boundary),
+                            scf_value)
+
+
+def test_SCF_n_jobs():
+
+    cube = np.array([make_extended(16, powerlaw=3., randomseed=seed)
+                     for seed in range(8)])
+
+    rolls = np.array([-3, -1.5, 0, 1.5, 3]) * u.pix
+
+    serial = SCF(fits.PrimaryHDU(cube), roll_lags=rolls)
+    serial.compute_surface(show_progress=False)
+
+    parallel = SCF(fits.PrimaryHDU(cube), roll_lags=rolls)
+    parallel.compute_surface(show_progress=False, n_jobs=3)
+
+    npt.assert_array_equal(serial.scf_surface, parallel.scf_surface)
+
+
+@pytest.mark.parametrize('boundary', ['continuous', 'cut'])
+def test_SCF_fft_method(boundary):
+    '''
+    Compare the FFT method to the globally-normalized SCF computed directly.
+    '''
+
+    cube = np.array([make_extended(16, powerlaw=3., randomseed=seed)
+                     for seed in range(8)])
+    cube[:, 3, 5] = np.nan
+    cube[2, 10, 4] = np.nan
+
+    rolls = np.arange(-4, 5)
+
+    test = SCF(fits.PrimaryHDU(cube), roll_lags=rolls * u.pix)
+    test.compute_surface(boundary=boundary, method='fft')
+
+    for i, x_shift in enumerate(rolls):
+        for j, y_shift in enumerate(rolls):
+
+            tmp = np.roll(np.roll(cube, x_shift, axis=1), y_shift, axis=2)
+
+            if boundary == 'cut':
+                # Only keep pairs of pixels that are both in the map
+                valid = np.zeros((16, 16), dtype=bool)
+                valid[max(x_shift, 0):16 + min(x_shift, 0),
+                      max(y_shift, 0):16 + min(y_shift, 0)] = True
+                data = cube[:, valid]
+                tmp = tmp[:, valid]
+            else:
+                data = cube
+
+            numer = np.nansum((data - tmp)**2)
+            denom = np.nansum(data**2) + np.nansum(tmp**2)
+
+            npt.assert_allclose(test.scf_surface[j, i],
+                                1 - np.sqrt(numer / denom))
+
+    # Non-integer lags are not supported
+    test = SCF(fits.PrimaryHDU(cube),
+               roll_lags=np.array([-1.5, 0, 1.5]) * u.pix)
+    with pytest.raises(ValueError):
+        test.compute_surface(method='fft')
+
+
+def test_SCF_extend_lags(tmpdir, monkeypatch):
+
+    from ..statistics.scf import scf as scf_module
+
+    cube = np.array([make_extended(16, powerlaw=3., randomseed=seed)
+                     for seed in range(8)])
+
+    full = SCF(fits.PrimaryHDU(cube), size=9)
+    full.compute_surface(show_progress=False)
+
+    checkpoint = str(tmpdir.join("scf_checkpoint.pkl"))
+
+    test = SCF(fits.PrimaryHDU(cube), size=5)
+    test.compute_surface(show_progress=False, checkpoint=checkpoint)
+
+    # Count the lags that are computed when extending
+    calls = []
+    kernel_call = scf_module._SCFKernel.__call__
+
+    def counted_call(self, *args):
+        calls.append(args)
+        return kernel_call(self, *args)
+
+    monkeypatch.setattr(scf_module._SCFKernel, "__call__", counted_call)
+
+    test.extend_lags(np.arange(-4, 5), show_progress=False)
+
+    assert len(calls) == 9**2 - 5**2
+    npt.assert_allclose(test.scf_surface, full.scf_surface)
+
+    # A new instance resumes from the checkpoint
+    del calls[:]
+
+    resumed = SCF(fits.PrimaryHDU(cube), size=5)
+    resumed.compute_surface(show_progress=False, checkpoint=checkpoint)
+
+    assert len(calls) == 0
+    npt.assert_allclose(resumed.scf_surface, full.scf_surface[2:-2, 2:-2])
+
+
 def test_SCF_nonpixelunit_shift():
     # Not testing against anything, just make sure it runs w/o issue.
     rolls = np.array([-4.5, -3.0, -1.5, 0, 1.5, 3.0, 4.5]) * u.pix
@@ -6,9 +6,11 @@ import pytest
 import numpy as np
 import numpy.testing as npt
 import astropy.units as u
+from astropy.io import fits
 import os
 
 from ..statistics import StatMoments, StatMoments_Distance
+from .generate_test_images import make_extended
 from ._testing_data import \
     dataset1, dataset2, computed_data, computed_distances
 
@@ -83,6 +85,95 @@ def test_moments_nonperiodic():
                        computed_data['skewness_nonper_val'])
 
 
+@pytest.mark.parametrize(('periodic', 'min_frac'),
+                         [(periodic, min_frac) for periodic in [True, False]
+                          for min_frac in [0.5, 0.8, 1.0]])
+def test_moments_fft(periodic, min_frac):
+    '''
+    The convolution-based moments should match the pixel-by-pixel loop.
+    '''
+
+    img = make_extended(48, powerlaw=3., randomseed=5)
+    img[10:14, 20:30] = np.NaN
+
+    weights = np.random.RandomState(5).uniform(0.5, 2., img.shape)
+    weights[30:33, 5:8] = np.NaN
+
+    tester = StatMoments(fits.PrimaryHDU(img), weights=weights,
+                         radius=4 * u.pix)
+    tester.compute_spatial_distrib(periodic=periodic, min_frac=min_frac,
+                                   method='loop', show_progress=False)
+
+    tester_fft = StatMoments(fits.PrimaryHDU(img), weights=weights,
+                             radius=4 * u.pix)
+    tester_fft.compute_spatial_distrib(periodic=periodic, min_frac=min_frac)
+
+    for name in ['mean_array', 'variance_array', 'skewness_array',
+                 'kurtosis_array']:
+        npt.assert_allclose(getattr(tester_fft, name),
+                            getattr(tester, name), rtol=1e-7, atol=1e-10)
+
+    with pytest.raises(ValueError):
+        tester_fft.compute_spatial_distrib(method='direct')
+
+
+@pytest.mark.parametrize(('periodic', 'radius'),
+                         [(periodic, radius) for periodic in [True, False]
+                          for radius in [2, 3]])
+def test_moments_fft_smooth(periodic, radius):
+    '''
+    The local variance of a smooth image in small regions is much smaller
+    than the global variance. The convolution-based moments should still
+    match the loop.
+    '''
+
+    img = make_extended(64, powerlaw=6., randomseed=5)
+
+    tester = StatMoments(fits.PrimaryHDU(img), radius=radius * u.pix)
+    tester.compute_spatial_distrib(periodic=periodic, method='loop',
+                                   show_progress=False)
+
+    tester_fft = StatMoments(fits.PrimaryHDU(img), radius=radius * u.pix)
+    tester_fft.compute_spatial_distrib(periodic=periodic)
+
+    for name in ['mean_array', 'variance_array', 'skewness_array',
+                 'kurtosis_array']:
+        npt.assert_allclose(getattr(tester_fft, name),
+                            getattr(tester, name), rtol=1e-7, atol=1e-10)
+
+
+@pytest.mark.parametrize('periodic', [True, False])
+def test_moments_sweep_radii(periodic):
+
+    img = make_extended(64, powerlaw=3., randomseed=5)
+    img[10:14, 20:30] = np.NaN
+
+    radii = [3, 6.5, 12] * u.pix
+
+    tester = StatMoments(fits.PrimaryHDU(img))
+
+    moments = tester.sweep_radii(radii, periodic=periodic)
+    histograms = tester.sweep_radii(radii, periodic=periodic,
+                                    histograms_only=True)
+
+    for radius, moment, hist in zip(radii, moments, histograms):
+        tester_rad = StatMoments(fits.PrimaryHDU(img), radius=radius)
+        tester_rad.compute_spatial_distrib(periodic=periodic)
+        tester_rad.make_spatial_histograms()
+
+        for name in ['mean', 'variance', 'skewness', 'kurtosis']:
+            npt.assert_allclose(moment[name],
+                                getattr(tester_rad, name + "_array"),
+                                rtol=1e-7, atol=1e-10)
+
+            bins, vals = getattr(tester_rad, name + "_hist")
+            npt.assert_allclose(hist[name][0], bins, rtol=1e-7)
+            npt.assert_allclose(hist[name][1], vals, rtol=1e-5)
+
+    with pytest.raises(ValueError):
+        tester.sweep_radii([3, 40] * u.pix)
+
+
 def test_moment_distance():
     tester_dist = \
         StatMoments_Distance(dataset1["moment0"],
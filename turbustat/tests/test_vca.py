@@ -26,6 +26,7 @@ except ImportError:
 from ..statistics import VCA, VCA_Distance
 from ..statistics.vca_vcs.slice_thickness import spectral_regrid_cube
 from ..io.input_base import to_spectral_cube
+from ..io.sim_tools import create_cube_header
 from ._testing_data import (dataset1, dataset2, computed_data,
                             computed_distances)
 from .generate_test_images import make_extended
@@ -273,3 +274,90 @@ def test_VCA_apod_kernel(apod_type):
     test.run(apodize_kernel=apod_type, alpha=0.3, beta=0.8, fit_2D=False,
              low_cut=low_cut)
     npt.assert_allclose(-plaw, test.slope, rtol=0.02)
+
+
+def test_VCA_streaming_blocks(tmpdir):
+    '''
+    Streaming the channels in blocks, in parallel, or from a memory-mapped
+    array should all give the power of the 3D FFT summed over channels.
+    '''
+
+    nchans = 7
+    cube = np.empty((nchans, 32, 31))
+    for i in range(nchans):
+        cube[i] = make_extended(32, powerlaw=3., randomseed=i)[:, :31]
+    cube[2, 4, 5] = np.NaN
+
+    hdr = fits.PrimaryHDU(cube).header
+
+    test = VCA(fits.PrimaryHDU(cube.copy(), hdr))
+    test.compute_pspec()
+
+    # The full 3D FFT, summed over the spectral axis
+    fft_cube = np.nan_to_num(cube)
+    ps2D = np.fft.fftshift((np.abs(np.fft.fftn(fft_cube))**2).sum(0))[::-1]
+
+    npt.assert_allclose(test.ps2D, ps2D)
+
+    test_block = VCA(fits.PrimaryHDU(cube.copy(), hdr))
+    test_block.compute_pspec(block_size=2, n_jobs=3)
+
+    npt.assert_allclose(test_block.ps2D, test.ps2D)
+
+    # Memory-mapped cube. NaNs should be handled without changing the file.
+    mmap_name = str(tmpdir.join("vca_mmap.npy"))
+
+    mmap_cube = np.memmap(mmap_name, dtype=float, mode='w+',
+                          shape=cube.shape)
+    mmap_cube[:] = cube
+    mmap_cube.flush()
+
+    mmap_cube = np.memmap(mmap_name, dtype=float, mode='r',
+                          shape=cube.shape)
+
+    test_mmap = VCA(mmap_cube, header=hdr)
+    test_mmap.compute_pspec(block_size=3)
+
+    npt.assert_allclose(test_mmap.ps2D, test.ps2D)
+
+
+
+def test_VCA_sweep_channel_widths():
+    '''
+    The Fourier-space channel width sweep should recover the VCA at the
+    original width, and similar slopes to regridding the cube.
+    '''
+
+    from scipy.ndimage import gaussian_filter1d
+
+    nchans = 40
+    cube = np.array([make_extended(64, powerlaw=3., randomseed=i)
+                     for i in range(nchans)])
+    cube = gaussian_filter1d(cube, 2, axis=0)
+
+    header = create_cube_header(1 * u.arcsec, 1 * u.km / u.s,
+                                1 * u.arcsec, cube.shape,
+                                1.42 * u.GHz, u.K)
+    hdu = fits.PrimaryHDU(cube, header)
+
+    test = VCA(hdu)
+    test.run(fit_2D=False)
+
+    widths = [1, 2, 5] * u.pix
+    sweep = test.sweep_channel_widths(widths)
+
+    assert len(sweep) == len(widths)
+
+    npt.assert_allclose(sweep[0].ps1D, test.ps1D)
+    npt.assert_allclose(sweep[0].slope, test.slope)
+
+    for width, sweep_vca in zip(widths[1:], sweep[1:]):
+        regrid_vca = VCA(hdu, channel_width=width).run(fit_2D=False)
+
+        npt.assert_allclose(sweep_vca.slope, regrid_vca.slope, atol=0.05)
+
+    # Equivalent spectral units
+    sweep_spec = test.sweep_channel_widths(widths[1:].value * u.km / u.s)
+
+    for sweep_vca, sweep_vca_spec in zip(sweep[1:], sweep_spec):
+        npt.assert_allclose(sweep_vca.ps1D, sweep_vca_spec.ps1D)
@@ -92,3 +92,49 @@ def test_VCS_method_fftw():
     npt.assert_allclose(tester.ps1D, computed_data['vcs_val'])
 
     npt.assert_allclose(tester.slope, computed_data['vcs_slopes'])
+
+
+def test_VCS_tiled_spectra(tmpdir):
+    '''
+    The tiled 1D spectral FFTs should match the 3D FFT of the cube, and
+    only spectra with finite values are counted.
+    '''
+
+    from astropy.io import fits
+
+    cube = np.random.RandomState(3).randn(33, 20, 21) + 1.
+    cube[:, 3:5, 4:9] = np.NaN
+    # One partially blank spectrum is still valid
+    cube[:10, 10, 10] = np.NaN
+
+    hdr = fits.PrimaryHDU(cube).header
+
+    test = VCS(fits.PrimaryHDU(cube.copy(), hdr))
+    test.compute_pspec()
+
+    num_valid = 20 * 21 - 10
+    ps3D = np.abs(np.fft.fftn(np.nan_to_num(cube)))**2
+    ps1D = ps3D.sum(axis=(1, 2)) / num_valid
+
+    npt.assert_allclose(test.ps1D, ps1D)
+
+    test_tiled = VCS(fits.PrimaryHDU(cube.copy(), hdr))
+    test_tiled.compute_pspec(tile_size=3, n_jobs=2)
+
+    npt.assert_allclose(test_tiled.ps1D, test.ps1D)
+
+    mmap_name = str(tmpdir.join("vcs_mmap.npy"))
+
+    mmap_cube = np.memmap(mmap_name, dtype=float, mode='w+',
+                          shape=cube.shape)
+    mmap_cube[:] = cube
+    mmap_cube.flush()
+
+    mmap_cube = np.memmap(mmap_name, dtype=float, mode='r',
+                          shape=cube.shape)
+
+    test_mmap = VCS(mmap_cube, header=hdr)
+    test_mmap.compute_pspec(tile_size=4)
+
+    npt.assert_allclose(test_mmap.ps1D, test.ps1D)
+
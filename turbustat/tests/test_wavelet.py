@@ -113,6 +113,109 @@ def test_Wavelet_method_customscales():
     npt.assert_allclose(tester.slope, tester3.slope)
 
 
+def test_Wavelet_save_npy(tmpdir):
+    '''
+    Save the arrays to separate files and memory-map them on loading.
+    '''
+
+    img = make_extended(64, powerlaw=3., randomseed=2191)
+
+    tester = Wavelet(fits.PrimaryHDU(img),
+                     scales=np.arange(1.5, 10, 0.5) * u.pix)
+    tester.run()
+
+    output_name = str(tmpdir.join("wave_output"))
+
+    tester.save_results(output_name, keep_data=False, format='npy')
+
+    saved_tester = Wavelet.load_results(output_name)
+
+    assert saved_tester.data is None
+    assert isinstance(saved_tester.Wf, np.memmap)
+    npt.assert_allclose(saved_tester.Wf, tester.Wf)
+    npt.assert_allclose(saved_tester.values, tester.values)
+    npt.assert_allclose(saved_tester.scales, tester.scales)
+    assert saved_tester.scales.unit == tester.scales.unit
+    npt.assert_allclose(saved_tester.slope, tester.slope)
+
+    # Read everything into memory
+    saved_tester = Wavelet.load_results(output_name, mmap_mode=None)
+    assert not isinstance(saved_tester.Wf, np.memmap)
+    npt.assert_allclose(saved_tester.Wf, tester.Wf)
+
+    with pytest.raises(ValueError):
+        tester.save_results(output_name, format='hdf5')
+
+
+def test_Wavelet_n_jobs():
+
+    img = make_extended(64, powerlaw=3., randomseed=5)
+
+    scales = np.logspace(np.log10(1.667), np.log10(31.), 10) * u.pix
+
+    serial = Wavelet(fits.PrimaryHDU(img), scales=scales)
+    serial.run()
+
+    parallel = Wavelet(fits.PrimaryHDU(img), scales=scales)
+    parallel.run(n_jobs=3, max_in_flight=4)
+
+    npt.assert_array_equal(serial.Wf, parallel.Wf)
+
+
+def test_Wavelet_fourier():
+    '''
+    The analytic transform of the wavelet should give the same 1D transform
+    as the sampled kernel, away from the smallest scales.
+    '''
+
+    img = make_extended(128, powerlaw=3., randomseed=5)
+
+    scales = np.logspace(np.log10(3), np.log10(30), 10) * u.pix
+
+    test = Wavelet(fits.PrimaryHDU(img), scales=scales)
+    test.run()
+
+    test_fourier = Wavelet(fits.PrimaryHDU(img), scales=scales)
+    test_fourier.run(method='fourier')
+
+    npt.assert_allclose(test.values, test_fourier.values, rtol=0.05)
+    npt.assert_allclose(test.slope, test_fourier.slope, atol=0.05)
+
+
+def test_Wavelet_planes_storage(tmpdir):
+
+    img = make_extended(64, powerlaw=3., randomseed=5)
+
+    scales = np.logspace(np.log10(1.667), np.log10(31.), 10) * u.pix
+
+    test = Wavelet(fits.PrimaryHDU(img), scales=scales)
+    test.run(method='fourier')
+
+    test_noplanes = Wavelet(fits.PrimaryHDU(img), scales=scales)
+    test_noplanes.run(method='fourier', keep_planes=False)
+
+    assert test_noplanes.Wf is None
+    npt.assert_allclose(test.values, test_noplanes.values)
+    # The recomputed planes use the padding set by the largest scale.
+    for i in [0, 3, 9]:
+        npt.assert_allclose(test.Wf[i], test_noplanes.plane(i), rtol=1e-12,
+                            atol=1e-12 * np.abs(test.Wf[i]).max())
+
+    with pytest.raises(ValueError):
+        test_noplanes.make_1D_transform()
+
+    planes_file = str(tmpdir.join("planes.npy"))
+
+    test_mmap = Wavelet(fits.PrimaryHDU(img), scales=scales)
+    test_mmap.run(method='fourier', planes_dtype=np.float32,
+                  planes_file=planes_file)
+
+    assert isinstance(test_mmap.Wf, np.memmap)
+    assert test_mmap.Wf.dtype == np.float32
+    npt.assert_allclose(test.Wf, np.load(planes_file), rtol=1e-5,
+                        atol=1e-5 * np.abs(test.Wf).max())
+
+
 def test_Wavelet_distance():
     tester_dist = \
         Wavelet_Distance(dataset1["moment0"],